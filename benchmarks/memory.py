@@ -0,0 +1,133 @@
+"""Measure the memory held by a parsed Disconnect list.
+
+Every measurement runs in a fresh process, which builds a parser and loads
+the entitylist. Three numbers are reported per parser mode:
+
+* `rss_bytes`: the growth of the resident set size of the process.
+* `traced_bytes`: the memory allocated by Python and still held by the
+  parser, as reported by `tracemalloc`.
+* `peak_bytes`: the peak memory allocated by Python while building the
+  parser, as reported by `tracemalloc`.
+
+The `streaming` mode is only measured if `ijson` is installed.
+
+Usage: python benchmarks/memory.py [--blocklist FILE --entitylist FILE]
+           [--organizations N]
+
+Synthetic lists are generated if no list is given.
+"""
+import argparse
+import gc
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from trackingprotection_tools import DisconnectParser  # noqa: E402
+from trackingprotection_tools.DisconnectLoader import ijson  # noqa: E402
+
+MODES = {
+    'default': {},
+    'compact': {'compact': True},
+    'streaming': {'compact': True, 'streaming': True}
+}
+
+
+def get_modes():
+    """Return the parser modes that can be measured"""
+    return [mode for mode in sorted(MODES)
+            if mode != 'streaming' or ijson is not None]
+
+
+def get_rss():
+    """Return the current resident set size of this process in bytes"""
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith('VmRSS:'):
+                    return int(line.split()[1]) * 1024
+    except IOError:
+        pass
+    # Peak rather than current RSS, in kilobytes on Linux and bytes on macOS
+    import resource
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss if sys.platform == 'darwin' else rss * 1024
+
+
+def build_parser(mode, blocklist, entitylist):
+    """Build a parser in `mode` and load all of its lists"""
+    parser = DisconnectParser(
+        blocklist=blocklist, entitylist=entitylist, **MODES[mode])
+    parser.should_block_with_match('https://example.com/', 'https://a.com/')
+    return parser
+
+
+def measure(mode, blocklist, entitylist):
+    """Measure one parser in `mode` in the current process"""
+    gc.collect()
+    rss = get_rss()
+    parser = build_parser(mode, blocklist, entitylist)
+    gc.collect()
+    rss = get_rss() - rss
+
+    del parser
+    gc.collect()
+    tracemalloc.start()
+    parser = build_parser(mode, blocklist, entitylist)  # noqa: F841
+    gc.collect()
+    traced, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'mode': mode, 'rss_bytes': rss, 'traced_bytes': traced,
+            'peak_bytes': peak}
+
+
+def run(blocklist, entitylist, modes=None):
+    """Measure every mode in a fresh process and return the results"""
+    out = list()
+    if modes is None:
+        modes = get_modes()
+    for mode in modes:
+        output = subprocess.check_output([
+            sys.executable, os.path.abspath(__file__), '--measure', mode,
+            '--blocklist', blocklist, '--entitylist', entitylist
+        ])
+        out.append(json.loads(output.decode('utf-8')))
+    return out
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the memory held by a parsed list.")
+    arg_parser.add_argument('--blocklist')
+    arg_parser.add_argument('--entitylist')
+    arg_parser.add_argument('--organizations', type=int, default=10000)
+    arg_parser.add_argument('--measure', choices=sorted(MODES),
+                            help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.measure is not None:
+        print(json.dumps(
+            measure(args.measure, args.blocklist, args.entitylist)))
+        return
+    if args.blocklist is not None:
+        results = run(args.blocklist, args.entitylist)
+    else:
+        from synthetic import write_lists
+        with tempfile.TemporaryDirectory() as directory:
+            blocklist, entitylist = write_lists(
+                directory, organizations=args.organizations)
+            results = run(blocklist, entitylist)
+    for result in results:
+        print("%-9s rss: %8.1f MiB  traced: %8.1f MiB  peak: %8.1f MiB" % (
+            result['mode'], result['rss_bytes'] / 2.0 ** 20,
+            result['traced_bytes'] / 2.0 ** 20,
+            result['peak_bytes'] / 2.0 ** 20))
+
+
+if __name__ == '__main__':
+    main()
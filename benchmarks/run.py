@@ -0,0 +1,345 @@
+"""Benchmark the parsing, lookup and reporting hot paths.
+
+Every benchmark runs on synthetic lists and a synthetic crawl request stream
+from `synthetic.py`, so results are reproducible for a given configuration.
+For each benchmark the suite records:
+
+* `seconds`: the best wall time of `--repeat` runs.
+* `throughput`: operations (parses, lookups or report domains) per second
+  of the best run.
+* `peak_bytes`: the peak memory allocated while running the benchmark once,
+  as reported by `tracemalloc`.
+
+The `parser_memory_<mode>` benchmarks instead record the memory held by a
+parser in each mode of `memory.py`, measured in a fresh process: the growth
+of the resident set size (`rss_bytes`), the memory retained by the parser
+(`traced_bytes`) and the peak while building it (`peak_bytes`).
+
+The `classify_arrays` benchmark only runs if `numpy` is installed, and
+`parser_memory_streaming` only if `ijson` is installed.
+
+Results are compared against a stored baseline, and the suite exits with a
+non-zero status if any benchmark is slower or uses more memory than the
+baseline allows, or has no baseline entry. Wall times are only comparable on
+the same machine, so the baseline should be recorded with `--save-baseline`
+on the machine that runs the comparison.
+
+Usage: python benchmarks/run.py [--baseline FILE] [--save-baseline]
+           [--only NAME ...]
+"""
+import argparse
+import contextlib
+import gc
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+import memory  # noqa: E402
+from synthetic import generate_requests, write_lists  # noqa: E402
+from trackingprotection_tools import (DisconnectParser,  # noqa: E402
+                                      DisconnectReport)
+from trackingprotection_tools.DisconnectParser import (  # noqa: E402
+    get_hostname, ps_plus_1_cache_clear)
+from trackingprotection_tools.DisconnectVectorized import (  # noqa: E402
+    classify_arrays, np)
+
+DEFAULT_BASELINE = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+DEFAULT_CONFIG = {
+    'organizations': 10000,
+    'domains_per_organization': 4,
+    'requests': 100000,
+    'report_domains': 5000,
+    'seed': 0
+}
+# Absolute memory growth always allowed, for benchmarks that allocate little
+MEMORY_SLACK = 2 ** 16
+# Memory results compared against the baseline, with their descriptions
+MEMORY_RESULTS = (
+    ('peak_bytes', 'peak memory'),
+    ('traced_bytes', 'retained memory'),
+    ('rss_bytes', 'resident memory')
+)
+
+
+class Context(object):
+    """The synthetic lists and requests shared by all benchmarks"""
+    def __init__(self, directory, config):
+        self.config = config
+        self.blocklist, self.entitylist = write_lists(
+            directory, config['organizations'],
+            config['domains_per_organization'], config['seed'])
+        with open(self.blocklist) as f:
+            blocklist = json.load(f)
+        self.requests = list(generate_requests(
+            blocklist, count=config['requests'], seed=config['seed']))
+        self.hostnames = [get_hostname(url) for url, _ in self.requests]
+        self.report_dir = os.path.join(directory, 'reports')
+        self._parser = None
+
+    @property
+    def parser(self):
+        """A parser of the synthetic lists, shared by lookup benchmarks"""
+        if self._parser is None:
+            self._parser = DisconnectParser(
+                blocklist=self.blocklist, entitylist=self.entitylist)
+            self._parser._entitylist
+        return self._parser
+
+
+def bench_parse(context):
+    def run():
+        parser = DisconnectParser(
+            blocklist=context.blocklist, entitylist=context.entitylist)
+        parser._entitylist
+    return run, 1
+
+
+def bench_should_block_with_match(context):
+    parser = context.parser
+    requests = context.requests
+
+    def run():
+        ps_plus_1_cache_clear()
+        for url, top_url in requests:
+            parser.should_block_with_match(url, top_url)
+    return run, len(requests)
+
+
+def bench_lookup(context):
+    parser = context.parser
+    requests = context.requests
+
+    def run():
+        ps_plus_1_cache_clear()
+        for url, top_url in requests:
+            parser.lookup(url, top_url)
+    return run, len(requests)
+
+
+def bench_should_block_many(context):
+    parser = context.parser
+    requests = context.requests
+
+    def run():
+        ps_plus_1_cache_clear()
+        parser.should_block_many(requests)
+    return run, len(requests)
+
+
+def bench_classify_arrays(context):
+    parser = context.parser
+    urls = [url for url, _ in context.requests]
+    top_urls = [top_url for _, top_url in context.requests]
+
+    def run():
+        ps_plus_1_cache_clear()
+        classify_arrays(parser, urls, top_urls)
+    return run, len(urls)
+
+
+def bench_should_whitelist(context):
+    parser = context.parser
+    requests = context.requests
+
+    def run():
+        ps_plus_1_cache_clear()
+        for url, top_url in requests:
+            parser.should_whitelist(url, top_url)
+    return run, len(requests)
+
+
+def bench_get_matching_domains(context):
+    parser = context.parser
+    hostnames = context.hostnames
+
+    def run():
+        for hostname in hostnames:
+            parser.get_matching_domains(hostname)
+    return run, len(hostnames)
+
+
+def bench_generate_report(context):
+    count = context.config['report_domains']
+    requests = context.requests[:count]
+
+    def run():
+        report = DisconnectReport()
+        for i, (url, top_url) in enumerate(requests):
+            domain = 'reported%d.example' % i
+            report.add_domain(domain, 'benchmark', 'tracker',
+                              'Synthetic report')
+            report.add_observation(domain, top_url, url)
+            report.add_comment(domain, 'Synthetic comment')
+        with contextlib.redirect_stdout(io.StringIO()):
+            report.generate_report(context.report_dir, 'report.json')
+    return run, count
+
+
+BENCHMARKS = OrderedDict([
+    ('parse', bench_parse),
+    ('should_block_with_match', bench_should_block_with_match),
+    ('lookup', bench_lookup),
+    ('should_block_many', bench_should_block_many),
+    ('should_whitelist', bench_should_whitelist),
+    ('get_matching_domains', bench_get_matching_domains),
+    ('generate_report', bench_generate_report)
+])
+if np is not None:
+    BENCHMARKS['classify_arrays'] = bench_classify_arrays
+MEMORY_BENCHMARKS = OrderedDict(
+    ('parser_memory_%s' % mode, mode) for mode in memory.get_modes())
+
+
+def _time(run, repeat):
+    """Return the best wall time of `repeat` runs of `run`"""
+    seconds = float('inf')
+    for i in range(repeat):
+        # Like `timeit`, keep the garbage collector out of the timings
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.perf_counter()
+            run()
+            seconds = min(seconds, time.perf_counter() - start)
+        finally:
+            gc.enable()
+    return seconds
+
+
+def measure(benchmark, context, repeat):
+    """Run one benchmark and return its result"""
+    run, operations = benchmark(context)
+    run()  # Warm up
+    seconds = _time(run, repeat)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        run()
+        _, peak_bytes = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {
+        'seconds': seconds,
+        'throughput': operations / seconds,
+        'peak_bytes': peak_bytes
+    }
+
+
+def measure_memory(mode, context):
+    """Measure the memory held by a parser in `mode` in a fresh process"""
+    result = memory.run(context.blocklist, context.entitylist, [mode])[0]
+    del result['mode']
+    return result
+
+
+def compare(results, baseline, time_tolerance, memory_tolerance):
+    """Return a description of every regression against `baseline`
+
+    Benchmarks without a baseline entry are reported as well, as they could
+    regress unnoticed.
+    """
+    regressions = list()
+    for name, result in results.items():
+        expected = baseline.get(name)
+        if expected is None:
+            regressions.append(
+                "%s: no baseline entry, record one with `--save-baseline "
+                "--only %s`" % (name, name))
+            continue
+        if 'seconds' in result and \
+                result['seconds'] > expected['seconds'] * (1 + time_tolerance):
+            regressions.append(
+                "%s: %.3fs is slower than the baseline %.3fs" % (
+                    name, result['seconds'], expected['seconds']))
+        for key, description in MEMORY_RESULTS:
+            if key not in result or key not in expected:
+                continue
+            limit = expected[key] * (1 + memory_tolerance) + MEMORY_SLACK
+            if result[key] > limit:
+                regressions.append(
+                    "%s: %d bytes %s is more than the baseline %d" % (
+                        name, result[key], description, expected[key]))
+    return regressions
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description="Benchmark the parsing, lookup and reporting hot paths.")
+    arg_parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                            help="baseline file to compare against")
+    arg_parser.add_argument('--save-baseline', action='store_true',
+                            help="store the results as the new baseline")
+    arg_parser.add_argument('--only', nargs='+',
+                            choices=list(BENCHMARKS) + list(MEMORY_BENCHMARKS),
+                            metavar='NAME', help="benchmarks to run")
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--time-tolerance', type=float, default=0.25,
+                            help="allowed relative slowdown (default 0.25)")
+    arg_parser.add_argument('--memory-tolerance', type=float, default=0.10,
+                            help="allowed relative memory growth "
+                                 "(default 0.10)")
+    for key, value in DEFAULT_CONFIG.items():
+        arg_parser.add_argument('--' + key.replace('_', '-'), type=int,
+                                default=value)
+    args = arg_parser.parse_args(argv)
+    config = dict((key, getattr(args, key)) for key in DEFAULT_CONFIG)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['config'] != config and not args.save_baseline:
+            print("The baseline was recorded with a different "
+                  "configuration and is ignored: %s" % baseline['config'])
+            baseline = None
+
+    results = OrderedDict()
+    with tempfile.TemporaryDirectory() as directory:
+        context = Context(directory, config)
+        for name in args.only or list(BENCHMARKS) + list(MEMORY_BENCHMARKS):
+            if name in MEMORY_BENCHMARKS:
+                results[name] = measure_memory(
+                    MEMORY_BENCHMARKS[name], context)
+                print("%-24s %9.1f MiB rss %9.1f MiB retained %9.1f MiB "
+                      "peak" % (name, results[name]['rss_bytes'] / 2.0 ** 20,
+                                results[name]['traced_bytes'] / 2.0 ** 20,
+                                results[name]['peak_bytes'] / 2.0 ** 20))
+                continue
+            results[name] = measure(BENCHMARKS[name], context, args.repeat)
+            print("%-24s %9.3fs %12.0f ops/s %9.1f MiB peak" % (
+                name, results[name]['seconds'],
+                results[name]['throughput'],
+                results[name]['peak_bytes'] / 2.0 ** 20))
+
+    if args.save_baseline:
+        stored = dict()
+        if baseline is not None and baseline['config'] == config:
+            stored = baseline['results']
+        stored.update(results)
+        with open(args.baseline, 'w') as f:
+            json.dump({'config': config, 'results': stored}, f, indent=2,
+                      sort_keys=True)
+            f.write('\n')
+        print("Saved baseline to %s" % args.baseline)
+        return 0
+    if baseline is None:
+        return 0
+    regressions = compare(results, baseline['results'],
+                          args.time_tolerance, args.memory_tolerance)
+    for regression in regressions:
+        print("REGRESSION %s" % regression)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,121 @@
+"""Measure the throughput of the HTTP classification service.
+
+Starts a `ClassificationServer` on a free local port with synthetic lists
+and drives it with a local asyncio client over keep-alive connections:
+
+* `single`: concurrent `GET /classify` requests, which the server coalesces
+  into micro-batches.
+* `batch`: `POST /classify/batch` requests of `--batch-size` requests each.
+
+Usage: python benchmarks/server_load.py [--requests N] [--connections N]
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+from urllib.parse import urlencode
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from synthetic import generate_requests, write_lists  # noqa: E402
+from trackingprotection_tools import DisconnectParser  # noqa: E402
+from trackingprotection_tools.DisconnectServer import \
+    ClassificationServer  # noqa: E402
+
+
+async def _request(reader, writer, method, target, body=b''):
+    """Send one request over a keep-alive connection and read the body"""
+    writer.write((
+        '%s %s HTTP/1.1\r\nHost: localhost\r\nContent-Length: %d\r\n\r\n'
+        % (method, target, len(body))).encode('latin-1') + body)
+    await writer.drain()
+    status = await reader.readline()
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line == b'\r\n':
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    if b' 200 ' not in status:
+        raise RuntimeError("Unexpected response %s: %s" % (status, body))
+    return body
+
+
+async def _run_client(port, requests, connections, batch_size):
+    """Send all `requests` and return the elapsed time per mode"""
+    out = dict()
+
+    async def single_worker(queue):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while queue:
+            url, top_url = queue.pop()
+            await _request(reader, writer, 'GET', '/classify?' + urlencode(
+                {'url': url, 'top_url': top_url}))
+        writer.close()
+
+    async def batch_worker(queue):
+        reader, writer = await asyncio.open_connection('127.0.0.1', port)
+        while queue:
+            batch = queue.pop()
+            await _request(reader, writer, 'POST', '/classify/batch',
+                           json.dumps(batch).encode('utf-8'))
+        writer.close()
+
+    queue = list(requests)
+    start = time.perf_counter()
+    await asyncio.gather(*[single_worker(queue) for _ in range(connections)])
+    out['single'] = time.perf_counter() - start
+
+    records = [{'url': url, 'top_url': top_url} for url, top_url in requests]
+    queue = [records[i:i + batch_size]
+             for i in range(0, len(records), batch_size)]
+    start = time.perf_counter()
+    await asyncio.gather(*[batch_worker(queue) for _ in range(connections)])
+    out['batch'] = time.perf_counter() - start
+    return out
+
+
+async def run(blocklist, entitylist, requests, connections, batch_size):
+    """Serve and load the service in the same event loop"""
+    parser = DisconnectParser(blocklist=blocklist, entitylist=entitylist)
+    server = ClassificationServer(parser, port=0)
+    await server.start()
+    try:
+        return await _run_client(
+            server.port, requests, connections, batch_size)
+    finally:
+        await server.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the throughput of the HTTP service.")
+    arg_parser.add_argument('--organizations', type=int, default=10000)
+    arg_parser.add_argument('--requests', type=int, default=20000)
+    arg_parser.add_argument('--connections', type=int, default=32)
+    arg_parser.add_argument('--batch-size', type=int, default=1000)
+    args = arg_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        blocklist, entitylist = write_lists(
+            directory, organizations=args.organizations)
+        with open(blocklist) as f:
+            requests = list(generate_requests(
+                json.load(f), count=args.requests))
+        elapsed = asyncio.run(run(blocklist, entitylist, requests,
+                                  args.connections, args.batch_size))
+    for mode in ['single', 'batch']:
+        print("%-6s %8d requests in %7.2fs: %10.0f requests/s" % (
+            mode, len(requests), elapsed[mode],
+            len(requests) / elapsed[mode]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""Measure the memory of worker processes with and without a shared index.
+
+Starts `--workers` processes that either each build a `DisconnectParser`
+(`parser`) or all open the same `SharedIndex` (`shared`), and reports the
+sum of their proportional set sizes (PSS), which splits shared pages between
+the processes mapping them. With a shared index the total only grows by the
+memory of the interpreter and its modules per worker.
+
+PSS is read from `/proc/self/smaps_rollup`, so this requires Linux.
+
+Usage: python benchmarks/shared_memory.py [--organizations N]
+           [--workers N ...]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(
+    __file__))))
+
+from trackingprotection_tools import DisconnectParser  # noqa: E402
+from trackingprotection_tools.DisconnectSharedIndex import \
+    SharedIndex  # noqa: E402
+
+
+def get_pss():
+    """Return the proportional set size of this process in bytes"""
+    with open('/proc/self/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) * 1024
+
+
+def worker(mode, blocklist, entitylist, index):
+    """Load the lists in `mode`, classify and report the PSS once told"""
+    if mode == 'shared':
+        parser = SharedIndex(index)
+    else:
+        parser = DisconnectParser(blocklist=blocklist, entitylist=entitylist)
+    for line in sys.stdin:
+        parser.should_block_with_match(line.strip(), 'https://site.example/')
+    print(json.dumps(get_pss()))
+
+
+def run(mode, workers, blocklist, entitylist, index, hosts):
+    """Return the total PSS of `workers` processes in `mode`"""
+    processes = [subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), '--worker', mode,
+         blocklist, entitylist, index],
+        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        for _ in range(workers)]
+    # All workers write their hosts before any worker reports, so they
+    # are all alive and mapping the index while the PSS is read
+    for process in processes:
+        process.stdin.write(hosts)
+        process.stdin.flush()
+    for process in processes:
+        process.stdin.close()
+    total = 0
+    for process in processes:
+        total += json.loads(process.stdout.read().decode('utf-8'))
+        process.wait()
+    return total
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Measure the memory of workers sharing an index.")
+    arg_parser.add_argument('--organizations', type=int, default=20000)
+    arg_parser.add_argument('--workers', type=int, nargs='+',
+                            default=[1, 2, 4, 8])
+    arg_parser.add_argument('--worker', nargs=4, help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+    if args.worker is not None:
+        worker(*args.worker)
+        return
+
+    from synthetic import _list_domains, write_lists
+    with tempfile.TemporaryDirectory() as directory:
+        blocklist, entitylist = write_lists(
+            directory, organizations=args.organizations)
+        index = os.path.join(directory, 'list.index')
+        SharedIndex.build(
+            DisconnectParser(blocklist=blocklist, entitylist=entitylist),
+            index).close()
+        with open(blocklist) as f:
+            hosts = '\n'.join(_list_domains(json.load(f)))
+        hosts = hosts.encode('utf-8') + b'\n'
+        for workers in args.workers:
+            for mode in ['parser', 'shared']:
+                total = run(mode, workers, blocklist, entitylist, index,
+                            hosts)
+                print("%-6s %3d workers: %8.1f MiB total PSS" % (
+                    mode, workers, total / 2.0 ** 20))
+
+
+if __name__ == '__main__':
+    main()
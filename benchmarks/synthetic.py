@@ -0,0 +1,181 @@
+"""Generate synthetic Disconnect lists and requests for benchmarks.
+
+The generated lists follow the structure of the real blocklist and
+entitylist, at an arbitrary scale and with a fixed seed so measurements are
+comparable between runs.
+
+Usage: python benchmarks/synthetic.py OUTPUT_DIR [--organizations N]
+"""
+import argparse
+import json
+import os
+import random
+
+CATEGORIES = ['Advertising', 'Analytics', 'Social', 'Content',
+              'Cryptomining', 'Fingerprinting']
+TAGS = ['fingerprinting', 'cryptominer', 'session-replay', 'performance']
+TLDS = ['com', 'net', 'org', 'io', 'co.uk', 'com.au', 'de', 'example']
+
+
+def _domain(rng, org_index, domain_index):
+    """Return a synthetic domain of organization `org_index`"""
+    labels = ['org%d-d%d' % (org_index, domain_index)]
+    if rng.random() < 0.3:
+        labels.insert(0, 'cdn%d' % rng.randrange(4))
+    return '%s.%s' % ('.'.join(labels), rng.choice(TLDS))
+
+
+def generate_blocklist(organizations=10000, domains_per_organization=4,
+                       seed=0):
+    """Generate a synthetic blocklist
+
+    Parameters
+    ----------
+    organizations : int
+        The number of organizations on the list.
+    domains_per_organization : int
+        The average number of domains of each organization.
+    seed : int
+        The seed of the random number generator.
+
+    Returns
+    -------
+    dict : The blocklist, in the format of the Disconnect list.
+    """
+    rng = random.Random(seed)
+    categories = dict((category, list()) for category in CATEGORIES)
+    for i in range(organizations):
+        name = 'Organization %d' % i
+        count = rng.randint(1, 2 * domains_per_organization - 1)
+        resources = {
+            'https://org%d.example/' % i: [
+                _domain(rng, i, j) for j in range(count)]
+        }
+        for tag in TAGS:
+            if rng.random() < 0.05:
+                resources[tag] = 'true'
+        if rng.random() < 0.1:
+            resources['dnt'] = rng.choice(['eff', 'w3c'])
+        categories[rng.choice(CATEGORIES)].append({name: resources})
+    return {'license': 'Synthetic list.', 'categories': categories}
+
+
+def generate_entitylist(blocklist, fraction=0.2, seed=0):
+    """Generate a synthetic entitylist for the domains of `blocklist`
+
+    Parameters
+    ----------
+    blocklist : dict
+        A blocklist generated by `generate_blocklist`.
+    fraction : float
+        The fraction of organizations with an entitylist entry.
+    seed : int
+        The seed of the random number generator.
+
+    Returns
+    -------
+    dict : The entitylist, in the format of the Disconnect entitylist.
+    """
+    rng = random.Random(seed)
+    out = dict()
+    for items in blocklist['categories'].values():
+        for item in items:
+            for name, resources in item.items():
+                if rng.random() >= fraction:
+                    continue
+                domains = list()
+                for key, value in resources.items():
+                    if isinstance(value, list):
+                        domains.extend(value)
+                out[name] = {'properties': domains, 'resources': domains}
+    return out
+
+
+def _list_domains(blocklist):
+    """Return the sorted domains of a generated blocklist"""
+    out = set()
+    for items in blocklist['categories'].values():
+        for item in items:
+            for resources in item.values():
+                for value in resources.values():
+                    if isinstance(value, list):
+                        out.update(value)
+    return sorted(out)
+
+
+def generate_requests(blocklist, count=100000, sites=1000,
+                      tracker_fraction=0.3, seed=0):
+    """Generate a synthetic stream of crawled requests
+
+    Parameters
+    ----------
+    blocklist : dict
+        A blocklist generated by `generate_blocklist`. Tracker requests are
+        made to (subdomains of) its domains.
+    count : int
+        The number of requests.
+    sites : int
+        The number of distinct top-level sites the requests are made on.
+    tracker_fraction : float
+        The fraction of requests made to domains of the blocklist.
+    seed : int
+        The seed of the random number generator.
+
+    Yields
+    ------
+    tuple : `(url, top_url)` pairs.
+    """
+    rng = random.Random(seed)
+    domains = _list_domains(blocklist)
+    for i in range(count):
+        site = 'site%d.%s' % (rng.randrange(sites), rng.choice(TLDS))
+        top_url = 'https://www.%s/' % site
+        if rng.random() < tracker_fraction:
+            host = rng.choice(domains)
+            if rng.random() < 0.5:
+                host = 'sub%d.%s' % (rng.randrange(10), host)
+        elif rng.random() < 0.5:
+            host = 'static.%s' % site
+        else:
+            host = 'cdn%d.unlisted%d.com' % (
+                rng.randrange(10), rng.randrange(sites))
+        yield 'https://%s/resource/%d.js?v=%d' % (host, i % 97, i), top_url
+
+
+def write_lists(directory, organizations=10000, domains_per_organization=4,
+                seed=0):
+    """Write a synthetic blocklist and entitylist to `directory`
+
+    Returns
+    -------
+    string : The file location of the blocklist.
+    string : The file location of the entitylist.
+    """
+    blocklist = generate_blocklist(
+        organizations, domains_per_organization, seed)
+    entitylist = generate_entitylist(blocklist, seed=seed)
+    blocklist_path = os.path.join(directory, 'blocklist.json')
+    entitylist_path = os.path.join(directory, 'entitylist.json')
+    with open(blocklist_path, 'w') as f:
+        json.dump(blocklist, f)
+    with open(entitylist_path, 'w') as f:
+        json.dump(entitylist, f)
+    return blocklist_path, entitylist_path
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(
+        description="Write a synthetic blocklist and entitylist.")
+    arg_parser.add_argument('output_dir')
+    arg_parser.add_argument('--organizations', type=int, default=10000)
+    arg_parser.add_argument('--domains-per-organization', type=int,
+                            default=4)
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    for path in write_lists(args.output_dir, args.organizations,
+                            args.domains_per_organization, args.seed):
+        print(path)
+
+
+if __name__ == '__main__':
+    main()
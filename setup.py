@@ -20,6 +20,12 @@ setup(
 
     # Dependencies
     install_requires=requirements,
+    python_requires='>=3.7',
+    extras_require={
+        'streaming': ['ijson'],
+        'vectorized': ['numpy', 'pandas'],
+        'zstd': ['zstandard']
+    },
     setup_requires=['setuptools_scm'],
 
     # Packaging
@@ -34,7 +40,6 @@ setup(
         'License :: OSI Approved :: Mozilla Public License 2.0 (MPL 2.0)',
         'Programming Language :: Python',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
         'Topic :: Internet :: WWW/HTTP',
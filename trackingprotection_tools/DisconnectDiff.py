@@ -0,0 +1,149 @@
+class ListDiff(object):
+    """The structural difference between two versions of the Disconnect list
+
+    All domain-level changes are keyed on the domain / rule. Categories are
+    the raw list categories, i.e. domains of a remapped Disconnect category
+    are reported under both `Disconnect` and their remapped category.
+
+    Attributes
+    ----------
+    added : dict
+        Maps domains only on the new list to their set of categories.
+    removed : dict
+        Maps domains only on the old list to their set of categories.
+    recategorized : dict
+        Maps domains on both lists whose categories changed to a tuple of
+        the old and new set of categories.
+    organization_changes : dict
+        Maps domains whose owning organization changed to a tuple of the old
+        and new organization. Added and removed domains are included with an
+        old or new organization of None.
+    tag_changes : dict
+        Maps domains whose tags changed to a tuple of the old and new set of
+        tags.
+    entitylist_changes : dict
+        Maps entitylist properties whose resources changed to a tuple of the
+        old and new resources. Added and removed properties are included
+        with old or new resources of None.
+    entitylist_owner_changes : dict
+        Maps entitylist properties and resources whose organization changed
+        to a tuple of the old and new organization. Added and removed hosts
+        are included with an old or new organization of None.
+    categories : set
+        All categories of the new list.
+    source_hashes : tuple
+        The source hashes (see `DisconnectParser.get_source_hashes`) of the
+        old and new list.
+    """
+    def __init__(self):
+        self.added = dict()
+        self.removed = dict()
+        self.recategorized = dict()
+        self.organization_changes = dict()
+        self.tag_changes = dict()
+        self.entitylist_changes = dict()
+        self.entitylist_owner_changes = dict()
+        self.categories = set()
+        self.source_hashes = (dict(), dict())
+
+    def __len__(self):
+        """The number of changed domains and entitylist hosts"""
+        domains = set(self.added)
+        domains.update(self.removed, self.recategorized,
+                       self.organization_changes, self.tag_changes)
+        hosts = set(self.entitylist_changes)
+        hosts.update(self.entitylist_owner_changes)
+        return len(domains) + len(hosts)
+
+    def __repr__(self):
+        return (
+            "<ListDiff added=%d removed=%d recategorized=%d "
+            "organization_changes=%d tag_changes=%d entitylist_changes=%d "
+            "entitylist_owner_changes=%d>" %
+            (len(self.added), len(self.removed), len(self.recategorized),
+             len(self.organization_changes), len(self.tag_changes),
+             len(self.entitylist_changes), len(self.entitylist_owner_changes))
+        )
+
+
+def _invert(mapping):
+    """Invert a mapping of keys to domain sets into domains to key sets"""
+    out = dict()
+    for key, domains in mapping.items():
+        for domain in domains:
+            try:
+                out[domain].add(key)
+            except KeyError:
+                out[domain] = {key}
+    return out
+
+
+def _compare(old, new, changes):
+    """Record the keys of `old` and `new` whose values differ in `changes`
+
+    Keys missing from either mapping are recorded with a value of None.
+    """
+    for key, old_value in old.items():
+        new_value = new.get(key)
+        if old_value != new_value:
+            changes[key] = (old_value, new_value)
+    for key, new_value in new.items():
+        if key not in old:
+            changes[key] = (None, new_value)
+
+
+def diff_lists(old, new):
+    """Compare two parsed versions of the Disconnect list
+
+    The resulting diff can be applied to a parser of the old list with
+    `DisconnectParser.apply_diff` to update it to the new list in place.
+
+    Parameters
+    ----------
+    old : DisconnectParser
+        A parser of the old version of the list.
+    new : DisconnectParser
+        A parser of the new version of the list.
+
+    Returns
+    -------
+    ListDiff : The changes from `old` to `new`.
+
+    Raises
+    ------
+    ValueError
+        If only one of the parsers remaps the Disconnect category, in which
+        case their categories cannot be compared.
+    """
+    if old._should_remap != new._should_remap:
+        raise ValueError(
+            "Cannot compare a list that remaps the Disconnect category with "
+            "a list that does not. Use the same remapping for both lists."
+        )
+    diff = ListDiff()
+    diff.categories = set(new._all_list_categories)
+
+    old_categories = _invert(old._categorized_blocklist)
+    new_categories = _invert(new._categorized_blocklist)
+    for domain, categories in old_categories.items():
+        try:
+            new_value = new_categories[domain]
+        except KeyError:
+            diff.removed[domain] = categories
+            continue
+        if new_value != categories:
+            diff.recategorized[domain] = (categories, new_value)
+    for domain, categories in new_categories.items():
+        if domain not in old_categories:
+            diff.added[domain] = categories
+
+    _compare(old._company_classifier, new._company_classifier,
+             diff.organization_changes)
+    _compare(_invert(old._tagged_domains), _invert(new._tagged_domains),
+             diff.tag_changes)
+    _compare(old._entitylist, new._entitylist, diff.entitylist_changes)
+    _compare(old._entitylist_owners, new._entitylist_owners,
+             diff.entitylist_owner_changes)
+    # Lazily loaded lists are recorded once they are loaded above
+    diff.source_hashes = (old.get_source_hashes(), new.get_source_hashes())
+    return diff
@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+DEFAULT_TIMEOUT = 30
+
+
+class ListFetcher(object):
+    """Download lists over a pooled HTTP session with an optional disk cache
+
+    When a cache directory is given, the content of every downloaded URL is
+    stored alongside its `ETag` and `Last-Modified` validators. Later
+    requests for the same URL are conditional, and the cached content is
+    returned when the server responds with `304 Not Modified`.
+
+    The fetcher can be used as a context manager, which closes the session
+    on exit.
+    """
+    def __init__(self, cache_dir=None, timeout=DEFAULT_TIMEOUT,
+                 max_workers=4, session=None):
+        """Initialize the fetcher.
+
+        Parameters
+        ----------
+        cache_dir : string (optional)
+            The directory in which downloaded lists are cached. It is created
+            if needed. Lists are not cached by default.
+        timeout : float (optional)
+            The connect and read timeout of every request in seconds.
+            (default 30)
+        max_workers : int (optional)
+            The maximum number of lists downloaded concurrently.
+            (default 4)
+        session : requests.Session (optional)
+            The session used for all requests. A new session is created by
+            default.
+        """
+        if max_workers <= 0:
+            raise ValueError(
+                "Invalid number of workers %s. The number of workers must be "
+                "a positive integer." % max_workers)
+        self._cache_dir = None
+        if cache_dir is not None:
+            self._cache_dir = os.path.expanduser(cache_dir)
+            os.makedirs(self._cache_dir, exist_ok=True)
+        self._timeout = timeout
+        self._max_workers = max_workers
+        if session is None:
+            session = requests.Session()
+            adapter = requests.adapters.HTTPAdapter(
+                pool_connections=max_workers, pool_maxsize=max_workers)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self._session = session
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Close the HTTP session"""
+        self._session.close()
+
+    def _cache_paths(self, url):
+        """Return the locations of the cached content and validators"""
+        key = hashlib.sha256(url.encode('utf-8')).hexdigest()
+        path = os.path.join(self._cache_dir, key)
+        return path + '.body', path + '.json'
+
+    def _read_cache(self, url):
+        """Return the cached content and validators of `url`, or None"""
+        if self._cache_dir is None:
+            return
+        body_path, meta_path = self._cache_paths(url)
+        try:
+            with open(meta_path, 'r') as f:
+                meta = json.load(f)
+            with open(body_path, 'rb') as f:
+                content = f.read()
+        except (IOError, ValueError):
+            return
+        if meta.get('url') != url:
+            return
+        return content, meta
+
+    def _write_cache(self, url, content, headers):
+        """Store the content and validators of `url` in the cache
+
+        Files are written to a temporary location and moved in place, so
+        concurrent readers never see a partially written entry.
+        """
+        if self._cache_dir is None:
+            return
+        meta = {
+            'url': url,
+            'etag': headers.get('ETag'),
+            'last_modified': headers.get('Last-Modified')
+        }
+        if meta['etag'] is None and meta['last_modified'] is None:
+            return
+        body_path, meta_path = self._cache_paths(url)
+        for path, data, mode in [(body_path, content, 'wb'),
+                                 (meta_path, json.dumps(meta), 'w')]:
+            tmp_path = '%s.%d.tmp' % (path, os.getpid())
+            with open(tmp_path, mode) as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+    def fetch(self, url):
+        """Download `url`, using the cached content if it is not modified
+
+        Parameters
+        ----------
+        url : string
+            The URL of the list.
+
+        Returns
+        -------
+        bytes : The content of the list.
+
+        Raises
+        ------
+        RuntimeError
+            If the server responds with an unexpected status code.
+        """
+        cached = self._read_cache(url)
+        headers = dict()
+        if cached is not None:
+            content, meta = cached
+            if meta.get('etag') is not None:
+                headers['If-None-Match'] = meta['etag']
+            if meta.get('last_modified') is not None:
+                headers['If-Modified-Since'] = meta['last_modified']
+        resp = self._session.get(url, headers=headers, timeout=self._timeout)
+        if resp.status_code == 304 and cached is not None:
+            return content
+        if resp.status_code != 200:
+            raise RuntimeError(
+                "Bad status code while requesting %s (code: %s)." %
+                (url, resp.status_code)
+            )
+        self._write_cache(url, resp.content, resp.headers)
+        return resp.content
+
+    def fetch_many(self, urls):
+        """Download several lists concurrently
+
+        Parameters
+        ----------
+        urls : iterable of strings
+            The URLs of the lists.
+
+        Returns
+        -------
+        dict : Maps each URL to the content of the list.
+
+        Raises
+        ------
+        RuntimeError
+            If the server responds with an unexpected status code for any
+            of the URLs.
+        """
+        urls = list(set(urls))
+        if len(urls) <= 1:
+            return dict((url, self.fetch(url)) for url in urls)
+        workers = min(self._max_workers, len(urls))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return dict(zip(urls, executor.map(self.fetch, urls)))
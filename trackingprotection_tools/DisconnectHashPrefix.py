@@ -0,0 +1,158 @@
+"""Match requests against hash prefixes of the list, as Firefox stores it.
+
+Firefox's URL classifier does not store the domains of the list. For every
+list entry it stores a short prefix of the SHA-256 hash of its Safe Browsing
+host expression, `<domain>/`, in a compact sorted prefix set. A request is
+checked by hashing the same expressions for each of its candidate hostnames
+(see `get_candidate_hostnames`). Only if a prefix is in the set does
+Firefox fetch the full hashes for that prefix to confirm the match, so
+hostnames whose prefix collides with a list entry cost a full-hash request
+but are not blocked.
+
+`HashPrefixMatcher` emulates this storage. See
+`DisconnectParser.compile_hash_prefixes`.
+"""
+import hashlib
+from array import array
+from bisect import bisect_left
+
+from .DisconnectParser import get_candidate_hostnames, get_hostname
+
+DEFAULT_PREFIX_SIZE = 4
+FULL_HASH_SIZE = 32
+
+
+def get_full_hash(hostname):
+    """Return the SHA-256 hash of the host expression of `hostname`"""
+    return hashlib.sha256((hostname + '/').encode('utf-8')).digest()
+
+
+class HashPrefixMatcher(object):
+    """A sorted set of hash prefixes with full hashes for confirmation
+
+    Prefixes are stored as big-endian integers in a sorted `array('I')`,
+    and the full hashes as one sorted `bytes` buffer. No domain strings are
+    kept.
+    """
+    def __init__(self, domains, prefix_size=DEFAULT_PREFIX_SIZE):
+        """Compile `domains` into a prefix set.
+
+        Parameters
+        ----------
+        domains : iterable of strings
+            The domains / rules of the list.
+        prefix_size : int (optional)
+            The length of the prefixes in bytes, from 1 to 4. Shorter
+            prefixes collide more often. (default 4)
+        """
+        if not 1 <= prefix_size <= 4:
+            raise ValueError(
+                "Invalid prefix size %s. Prefixes must be 1 to 4 bytes "
+                "long." % prefix_size)
+        self.prefix_size = prefix_size
+        full_hashes = sorted(set(get_full_hash(domain) for domain in domains))
+        self._full_hashes = b''.join(full_hashes)
+        self._prefixes = array('I')
+        self._collisions = dict()
+        previous = None
+        for full_hash in full_hashes:
+            prefix = self._get_prefix(full_hash)
+            if prefix == previous:
+                self._collisions[prefix] = self._collisions.get(prefix, 1) + 1
+                continue
+            self._prefixes.append(prefix)
+            previous = prefix
+
+    def __len__(self):
+        """The number of distinct prefixes"""
+        return len(self._prefixes)
+
+    @property
+    def nbytes(self):
+        """The number of bytes held by the prefixes and full hashes"""
+        return (len(self._prefixes) * self._prefixes.itemsize +
+                len(self._full_hashes))
+
+    def _get_prefix(self, full_hash):
+        return int.from_bytes(full_hash[:self.prefix_size], 'big')
+
+    def _has_prefix(self, prefix):
+        prefixes = self._prefixes
+        i = bisect_left(prefixes, prefix)
+        return i < len(prefixes) and prefixes[i] == prefix
+
+    def _has_full_hash(self, full_hash):
+        """Binary search the sorted full hashes for `full_hash`"""
+        blob = self._full_hashes
+        low = 0
+        high = len(blob) // FULL_HASH_SIZE
+        while low < high:
+            middle = (low + high) // 2
+            start = middle * FULL_HASH_SIZE
+            value = blob[start:start + FULL_HASH_SIZE]
+            if value < full_hash:
+                low = middle + 1
+            elif value > full_hash:
+                high = middle
+            else:
+                return True
+        return False
+
+    def get_prefix_collisions(self):
+        """Return the prefixes shared by several list entries
+
+        Returns
+        -------
+        dict : Maps each prefix shared by more than one entry of the list to
+            the number of entries sharing it.
+        """
+        return dict(self._collisions)
+
+    def match_prefixes(self, url):
+        """Return the candidate hostnames of `url` whose prefix is in the set
+
+        These are the hostnames Firefox would request full hashes for. Any
+        of them that is not on the list is a prefix collision.
+
+        Parameters
+        ----------
+        url : string
+            The URL or hostname to check.
+
+        Returns
+        -------
+        list : The matching candidate hostnames, longest first.
+        """
+        return [
+            candidate
+            for candidate in get_candidate_hostnames(get_hostname(url))
+            if self._has_prefix(self._get_prefix(get_full_hash(candidate)))
+        ]
+
+    def match_hostname(self, hostname):
+        """Return the candidate hostname matching the list, or None
+
+        Parameters
+        ----------
+        hostname : string
+            A hostname as returned by `get_hostname`.
+
+        Returns
+        -------
+        string : The first candidate hostname whose prefix is in the set and
+            whose full hash confirms the match. This is the rule
+            `DisconnectParser.should_block_with_match` reports.
+        """
+        for candidate in get_candidate_hostnames(hostname):
+            full_hash = get_full_hash(candidate)
+            if (self._has_prefix(self._get_prefix(full_hash)) and
+                    self._has_full_hash(full_hash)):
+                return candidate
+        return
+
+    def match(self, url):
+        """Return the candidate hostname of `url` matching the list, or None
+
+        See `match_hostname`.
+        """
+        return self.match_hostname(get_hostname(url))
@@ -0,0 +1,298 @@
+import os
+import sys
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .DisconnectParser import DisconnectParser, get_candidate_hostnames
+
+
+def _load_version(blocklist, disconnect_mapping, categories_to_exclude):
+    """Parse one list version into plain containers that pickle cheaply"""
+    parser = DisconnectParser(
+        blocklist=blocklist,
+        disconnect_mapping=disconnect_mapping,
+        categories_to_exclude=categories_to_exclude
+    )
+    categories = dict()
+    for category in parser._all_list_categories:
+        if parser._should_remap and category == 'Disconnect':
+            continue
+        categories[category] = list(parser._categorized_blocklist[category])
+    return (categories, list(parser._blocklist),
+            list(parser._company_classifier.items()))
+
+
+def _update_membership(history, previous, current, version):
+    """Record the domains entering and leaving a set at `version`
+
+    `history` maps each domain to an array of transitions: the indices of
+    the versions at which the domain alternately entered and left the set.
+    """
+    for domain in current - previous:
+        try:
+            history[domain].append(version)
+        except KeyError:
+            history[domain] = array('I', [version])
+    for domain in previous - current:
+        history[domain].append(version)
+
+
+def _in_history(transitions, version):
+    """Return True if `transitions` contain `version`"""
+    count = 0
+    for transition in transitions:
+        if transition > version:
+            break
+        count += 1
+    return count % 2 == 1
+
+
+class DisconnectListStore(object):
+    """Many versions of the Disconnect list for historical analysis
+
+    Rather than keeping one `DisconnectParser` per version, the store keeps
+    the history of every domain: the versions at which it entered or left
+    the blocklist and each category, and the versions at which its owning
+    organization changed. Domain, category and organization strings are
+    interned, so each is stored once for all versions.
+
+    Versions are kept in the order they are given, which is expected to be
+    chronological. Only the blocklist is stored; entitylist exceptions are
+    not taken into account.
+    """
+    def __init__(self, versions, disconnect_mapping=None,
+                 categories_to_exclude=[], processes=None):
+        """Load and index many versions of the list.
+
+        Parameters
+        ----------
+        versions : list of tuples
+            `(name, blocklist)` pairs, where `name` identifies the version
+            (e.g. a date or commit) and `blocklist` is the file location of
+            that version of the blocklist.
+        disconnect_mapping : string (optional)
+            A file location of the disconnect category remapping file in json
+            format, applied to all versions.
+        categories_to_exclude : list (optional)
+            A list of list categories to exclude from the blocklist of every
+            version. Category histories are kept for all categories.
+            (default empty list)
+        processes : int (optional)
+            The number of processes used to parse versions in parallel.
+            Defaults to the number of CPUs. With a value of 1 versions are
+            parsed in the current process.
+        """
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self._versions = list()
+        self._version_index = dict()
+        self._blocked = dict()
+        self._categories = dict()
+        self._organizations = dict()
+
+        previous_blocklist = set()
+        previous_categories = dict()
+        previous_organizations = dict()
+        loaded = self._load(versions, disconnect_mapping,
+                            categories_to_exclude, processes)
+        for index, (name, (categories, blocklist, organizations)) in \
+                enumerate(loaded):
+            self._versions.append(name)
+            self._version_index[name] = index
+
+            blocklist = set(sys.intern(domain) for domain in blocklist)
+            _update_membership(
+                self._blocked, previous_blocklist, blocklist, index)
+            previous_blocklist = blocklist
+
+            for category in set(categories).union(previous_categories):
+                current = set(
+                    sys.intern(domain)
+                    for domain in categories.get(category, ())
+                )
+                history = self._categories.setdefault(
+                    sys.intern(category), dict())
+                _update_membership(
+                    history, previous_categories.get(category, set()),
+                    current, index)
+                previous_categories[category] = current
+
+            organizations = dict(organizations)
+            for domain, organization in organizations.items():
+                if previous_organizations.get(domain) != organization:
+                    self._organizations.setdefault(
+                        sys.intern(domain), list()).append(
+                            (index, sys.intern(organization)))
+            for domain in previous_organizations:
+                if domain not in organizations:
+                    self._organizations[domain].append((index, None))
+            previous_organizations = organizations
+
+    def _load(self, versions, disconnect_mapping, categories_to_exclude,
+              processes):
+        """Yield `(name, parsed version)` in order, parsing in parallel"""
+        if processes == 1:
+            for name, blocklist in versions:
+                yield name, _load_version(
+                    blocklist, disconnect_mapping, categories_to_exclude)
+            return
+        with ProcessPoolExecutor(max_workers=processes) as executor:
+            # Bound the number of parsed versions waiting to be indexed
+            pending = deque()
+            for name, blocklist in versions:
+                if len(pending) >= 2 * processes:
+                    pending_name, future = pending.popleft()
+                    yield pending_name, future.result()
+                pending.append((name, executor.submit(
+                    _load_version, blocklist, disconnect_mapping,
+                    categories_to_exclude)))
+            while pending:
+                pending_name, future = pending.popleft()
+                yield pending_name, future.result()
+
+    def _indices(self, transitions):
+        """Expand transitions into the version indices they cover"""
+        for i in range(0, len(transitions), 2):
+            end = len(self._versions)
+            if i + 1 < len(transitions):
+                end = transitions[i + 1]
+            for index in range(transitions[i], end):
+                yield index
+
+    def get_versions(self):
+        """Returns the names of all versions in the store, in order"""
+        return list(self._versions)
+
+    def versions_blocking(self, hostname):
+        """Returns the versions of the list that would block `hostname`
+
+        Every version is checked following the same rules as
+        `DisconnectParser.should_block`, without checking the entitylist.
+
+        Parameters
+        ----------
+        hostname : string
+            The lowercase hostname to classify.
+
+        Returns
+        -------
+        list : The names of the versions that block `hostname`, in order.
+        """
+        blocked = set()
+        for candidate in get_candidate_hostnames(hostname):
+            transitions = self._blocked.get(candidate)
+            if transitions is not None:
+                blocked.update(self._indices(transitions))
+        return [self._versions[i] for i in sorted(blocked)]
+
+    def versions_with_category(self, domain, category):
+        """Returns the versions in which `domain` is listed under `category`
+
+        Parameters
+        ----------
+        domain : string
+            An exact domain / rule of the list.
+        category : string
+            A top-level category of the list.
+
+        Returns
+        -------
+        list : The names of the matching versions, in order.
+        """
+        transitions = self._categories.get(category, {}).get(domain)
+        if transitions is None:
+            return []
+        return [self._versions[i] for i in self._indices(transitions)]
+
+    def category_history(self, domain, category):
+        """Returns when `domain` entered and left `category`
+
+        Parameters
+        ----------
+        domain : string
+            An exact domain / rule of the list.
+        category : string
+            A top-level category of the list.
+
+        Returns
+        -------
+        list of tuples : `(entered, left)` version names for every period
+            during which `domain` was listed under `category`. `left` is the
+            first version without the domain, or None if it is still listed
+            in the last version.
+        """
+        transitions = self._categories.get(category, {}).get(domain, ())
+        out = list()
+        for i in range(0, len(transitions), 2):
+            left = None
+            if i + 1 < len(transitions):
+                left = self._versions[transitions[i + 1]]
+            out.append((self._versions[transitions[i]], left))
+        return out
+
+    def first_seen(self, domain, category):
+        """Returns the first version listing `domain` under `category`
+
+        Returns
+        -------
+        string : The name of the version, or None if `domain` was never
+            listed under `category`.
+        """
+        transitions = self._categories.get(category, {}).get(domain)
+        if not transitions:
+            return
+        return self._versions[transitions[0]]
+
+    def get_organization(self, domain, version):
+        """Returns the organization owning `domain` in `version`
+
+        Returns
+        -------
+        string : The organization, or None if `domain` is not on that version
+            of the list.
+
+        Raises
+        ------
+        KeyError
+            If `version` is not in the store.
+        """
+        index = self._version_index[version]
+        organization = None
+        for changed, value in self._organizations.get(domain, ()):
+            if changed > index:
+                break
+            organization = value
+        return organization
+
+    def get_domains(self, version, category=None):
+        """Returns all domains of one version of the list
+
+        Unlike the other queries this materializes the version's domains.
+
+        Parameters
+        ----------
+        version : string
+            The name of the version.
+        category : string (optional)
+            A top-level category of the list. Defaults to the flattened
+            blocklist of the version.
+
+        Returns
+        -------
+        set : All domains / rules of `version` (under `category`).
+
+        Raises
+        ------
+        KeyError
+            If `version` is not in the store.
+        """
+        index = self._version_index[version]
+        if category is None:
+            history = self._blocked
+        else:
+            history = self._categories.get(category, {})
+        return set(
+            domain for domain, transitions in history.items()
+            if _in_history(transitions, index)
+        )
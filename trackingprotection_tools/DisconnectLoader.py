@@ -0,0 +1,217 @@
+"""Incremental loading of (compressed) Disconnect lists.
+
+Lists are read through `ListSource`, which transparently decompresses gzip,
+bz2 and zstd content and hashes the raw bytes as they are read. The
+blocklist and entitylist can then be walked one organization at a time with
+`iter_blocklist_stream` and `iter_entitylist_stream` instead of building the
+whole document first. Streaming requires the optional `ijson` package and
+zstd content the optional `zstandard` package.
+"""
+import bz2
+import gzip
+import hashlib
+import io
+import os
+
+try:
+    import ijson
+except ImportError:
+    ijson = None
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+GZIP_MAGIC = b'\x1f\x8b'
+BZIP2_MAGIC = b'BZh'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+READ_SIZE = 2 ** 16
+
+
+class _HashingReader(io.RawIOBase):
+    """A raw binary stream that hashes all bytes read from `raw`"""
+    def __init__(self, raw, digest):
+        self._raw = raw
+        self._digest = digest
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        n = self._raw.readinto(buffer)
+        if n:
+            self._digest.update(memoryview(buffer)[:n])
+        return n
+
+    def close(self):
+        self._raw.close()
+        super(_HashingReader, self).close()
+
+
+class ListSource(object):
+    """The decompressed content of one list, read as a binary stream
+
+    Compression is detected from the leading bytes of the content. The
+    SHA-256 digest covers the raw (possibly compressed) bytes, so it matches
+    the digest of the file or download the list was read from.
+
+    The source can be used as a context manager, which closes it on exit.
+    """
+    def __init__(self, raw):
+        """Initialize the source.
+
+        Parameters
+        ----------
+        raw : file object
+            A binary file object of the raw list content.
+        """
+        self._digest = hashlib.sha256()
+        self._buffered = io.BufferedReader(
+            _HashingReader(raw, self._digest), READ_SIZE)
+        magic = self._buffered.peek(len(ZSTD_MAGIC))[:len(ZSTD_MAGIC)]
+        if magic.startswith(GZIP_MAGIC):
+            self.stream = gzip.GzipFile(fileobj=self._buffered, mode='rb')
+        elif magic.startswith(BZIP2_MAGIC):
+            self.stream = bz2.BZ2File(self._buffered, mode='rb')
+        elif magic.startswith(ZSTD_MAGIC):
+            if zstandard is None:
+                raise ImportError(
+                    "The list is zstd-compressed. Install the `zstandard` "
+                    "package, e.g. with `pip install "
+                    "trackingprotection-tools[zstd]`, to load it.")
+            self.stream = zstandard.ZstdDecompressor().stream_reader(
+                self._buffered, read_size=READ_SIZE)
+        else:
+            self.stream = self._buffered
+
+    @classmethod
+    def from_file(cls, location):
+        """Return a source reading the list at the file location"""
+        return cls(open(os.path.expanduser(location), 'rb'))
+
+    @classmethod
+    def from_bytes(cls, content):
+        """Return a source reading the list from `content`"""
+        return cls(io.BytesIO(content))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def hexdigest(self):
+        """Return the SHA-256 digest of the raw content
+
+        Any content that was not read yet is read and discarded first.
+        """
+        while self._buffered.read(READ_SIZE):
+            pass
+        return self._digest.hexdigest()
+
+    def close(self):
+        """Close the stream and the underlying file object"""
+        if self.stream is not self._buffered:
+            self.stream.close()
+        self._buffered.close()
+
+
+def iter_blocklist(blocklist):
+    """Yield the `(category, item)` pairs of a parsed blocklist
+
+    Every category is first yielded with an item of None, so categories
+    without any organization are reported as well. Items are the
+    single-organization objects of the category lists.
+    """
+    for category, items in blocklist['categories'].items():
+        yield category, None
+        for item in items:
+            yield category, item
+
+
+def _check_event(event, expected):
+    """Raise if the parser `event` isn't the `expected` event"""
+    if event != expected:
+        raise ValueError(
+            "Unexpected %s in the list where %s was expected. This likely "
+            "means the list changed and the parser should be updated." %
+            (event, expected))
+
+
+def _read_value(events, event, value, builder=None):
+    """Read the json value starting with (`event`, `value`) from `events`
+
+    The value is built with the ijson object `builder` if one is given, and
+    skipped otherwise.
+    """
+    depth = 0
+    while True:
+        if builder is not None:
+            builder.event(event, value)
+        if event in ('start_map', 'start_array'):
+            depth += 1
+        elif event in ('end_map', 'end_array'):
+            depth -= 1
+        if depth == 0:
+            return builder.value if builder is not None else None
+        event, value = next(events)
+
+
+def require_ijson():
+    """Raise an ImportError if the optional `ijson` package is missing"""
+    if ijson is None:
+        raise ImportError(
+            "Streaming lists requires the `ijson` package. Install it with "
+            "`pip install trackingprotection-tools[streaming]`.")
+
+
+def iter_blocklist_stream(stream):
+    """Yield the `(category, item)` pairs of a blocklist read from `stream`
+
+    This is the streaming equivalent of `iter_blocklist`: only one
+    organization of the list is held in memory at a time. Keys other than
+    `categories` are skipped.
+
+    Parameters
+    ----------
+    stream : file object
+        A binary stream of the json blocklist, e.g. `ListSource.stream`.
+    """
+    require_ijson()
+    events = iter(ijson.basic_parse(stream))
+    _check_event(next(events)[0], 'start_map')
+    for event, key in events:
+        if event == 'end_map':
+            return
+        event, value = next(events)
+        if key != 'categories':
+            _read_value(events, event, value)
+            continue
+        _check_event(event, 'start_map')
+        for event, category in events:
+            if event == 'end_map':
+                break
+            yield category, None
+            _check_event(next(events)[0], 'start_array')
+            for event, value in events:
+                if event == 'end_array':
+                    break
+                yield category, _read_value(
+                    events, event, value, ijson.common.ObjectBuilder())
+
+
+def iter_entitylist_stream(stream):
+    """Yield the `(organization, entry)` pairs of an entitylist
+
+    Only one entry, holding the `properties` and `resources` of its
+    organization, is held in memory at a time.
+
+    Parameters
+    ----------
+    stream : file object
+        A binary stream of the json entitylist, e.g. `ListSource.stream`.
+    """
+    require_ijson()
+    return ijson.kvitems(stream, '')
@@ -0,0 +1,173 @@
+import functools
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# Phases timed by the parser
+PARSE_PHASES = (
+    'fetch', 'load_blocklist', 'load_entitylist', 'load_disconnect_mapping',
+    'parse_blocklist', 'flatten_blocklist', 'build_suffix_index',
+    'parse_entitylist'
+)
+LOOKUP_PHASES = ('suffix_walk', 'entitylist_check')
+OUTCOMES = ('blacklisted', 'whitelisted', 'none')
+
+
+class ParserMetrics(object):
+    """Timings and counters recorded by instrumented `DisconnectParser`s
+
+    Pass an instance as the `metrics` argument of `DisconnectParser` to
+    record:
+
+    * the number of times each phase of loading and parsing the lists and
+      of classifying requests ran, and the total time spent in it. See
+      `PARSE_PHASES` and `LOOKUP_PHASES`.
+    * the number of calls of each lookup method.
+    * the outcome (`blacklisted`, `whitelisted` or `none`) of every
+      classified request.
+    * the depth at which the suffix walk matched blocked requests, i.e. the
+      index of the matching hostname among `get_candidate_hostnames`, where
+      0 is an exact match of the request hostname.
+    * the number of requests to IP addresses, for which the suffix walk is
+      skipped.
+
+    Parsers without metrics do not record anything. One instance can be
+    shared by several parsers, e.g. all parsers built by a
+    `RefreshingDisconnectParser`. Counters are updated without locking, so
+    they are approximate when a parser is used from several threads at once.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Reset all timings and counters"""
+        with self._lock:
+            self._phase_seconds = Counter()
+            self._phase_counts = Counter()
+        self._calls = Counter()
+        self._outcomes = Counter()
+        self._match_depths = Counter()
+        self._ip_addresses = 0
+
+    def add_phase(self, phase, seconds):
+        """Record one run of `phase` that took `seconds`"""
+        with self._lock:
+            self._phase_seconds[phase] += seconds
+            self._phase_counts[phase] += 1
+
+    @contextmanager
+    def time_phase(self, phase):
+        """Time the enclosed block as one run of `phase`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(phase, time.perf_counter() - start)
+
+    def timed(self, phase, func):
+        """Return `func` wrapped to time every call as a run of `phase`"""
+        @functools.wraps(func)
+        def wrapper(*args):
+            start = time.perf_counter()
+            try:
+                return func(*args)
+            finally:
+                self.add_phase(phase, time.perf_counter() - start)
+        return wrapper
+
+    def record_call(self, method):
+        """Record a call of the lookup method `method`"""
+        self._calls[method] += 1
+
+    def record_outcome(self, verdict, depth=None, ip_address=False):
+        """Record the outcome of one classified request
+
+        Parameters
+        ----------
+        verdict : string
+            `blacklisted`, `whitelisted`, or None.
+        depth : int (optional)
+            The suffix walk depth at which a blocked request matched.
+        ip_address : boolean (optional)
+            True if the request hostname is an IP address.
+        """
+        self._outcomes[verdict or 'none'] += 1
+        if depth is not None:
+            self._match_depths[depth] += 1
+        if ip_address:
+            self._ip_addresses += 1
+
+    def snapshot(self):
+        """Return all timings and counters as plain dicts
+
+        Returns
+        -------
+        dict : With keys `phases` (mapping each phase that ran to its
+            `count` and total `seconds`), `calls` (mapping methods to call
+            counts), `outcomes` (mapping `blacklisted`, `whitelisted` and
+            `none` to request counts), `match_depths` (mapping depths to
+            request counts) and `ip_short_circuits`.
+        """
+        with self._lock:
+            phases = dict(
+                (phase, {'count': self._phase_counts[phase],
+                         'seconds': self._phase_seconds[phase]})
+                for phase in self._phase_counts
+            )
+        outcomes = dict((outcome, 0) for outcome in OUTCOMES)
+        outcomes.update(self._outcomes)
+        return {
+            'phases': phases,
+            'calls': dict(self._calls),
+            'outcomes': outcomes,
+            'match_depths': dict(self._match_depths),
+            'ip_short_circuits': self._ip_addresses
+        }
+
+    def to_prometheus(self, prefix='tptools_parser'):
+        """Return all timings and counters in the Prometheus text format
+
+        Parameters
+        ----------
+        prefix : string (optional)
+            The prefix of all metric names. (default `tptools_parser`)
+
+        Returns
+        -------
+        string : The exposition text, one sample per line.
+        """
+        snapshot = self.snapshot()
+        lines = list()
+
+        def add(name, kind, help_text, samples):
+            lines.append('# HELP %s_%s %s' % (prefix, name, help_text))
+            lines.append('# TYPE %s_%s %s' % (prefix, name, kind))
+            for labels, value in samples:
+                lines.append('%s_%s%s %s' % (prefix, name, labels, value))
+
+        phases = sorted(snapshot['phases'].items())
+        add('phase_seconds_total', 'counter',
+            "Total time spent in each phase.",
+            [('{phase="%s"}' % phase, repr(values['seconds']))
+             for phase, values in phases])
+        add('phase_runs_total', 'counter',
+            "Number of runs of each phase.",
+            [('{phase="%s"}' % phase, values['count'])
+             for phase, values in phases])
+        add('calls_total', 'counter', "Number of calls of lookup methods.",
+            [('{method="%s"}' % method, count)
+             for method, count in sorted(snapshot['calls'].items())])
+        add('requests_total', 'counter',
+            "Number of classified requests by outcome.",
+            [('{outcome="%s"}' % outcome, count)
+             for outcome, count in sorted(snapshot['outcomes'].items())])
+        add('match_depth_total', 'counter',
+            "Number of blocked requests by suffix walk depth at match.",
+            [('{depth="%d"}' % depth, count)
+             for depth, count in sorted(snapshot['match_depths'].items())])
+        add('ip_short_circuits_total', 'counter',
+            "Number of requests to IP addresses.",
+            [('', snapshot['ip_short_circuits'])])
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,168 @@
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from itertools import islice
+
+from .DisconnectParser import DisconnectParser
+from .DisconnectSharedIndex import SharedIndex
+
+# The parser of the current worker process, set up by `_init_worker`
+_worker_parser = None
+
+
+def _init_worker(snapshot, shared_index, parser_kwargs):
+    """Build the parser once per worker process"""
+    global _worker_parser
+    if shared_index is not None:
+        _worker_parser = SharedIndex(shared_index)
+    elif snapshot is not None:
+        _worker_parser = DisconnectParser.from_snapshot(snapshot)
+    else:
+        _worker_parser = DisconnectParser(**parser_kwargs)
+
+
+def _classify_chunk(index, pairs):
+    """Classify a chunk of requests in a worker process"""
+    verdicts, rules = _worker_parser.should_block_many(pairs)
+    return index, verdicts, rules
+
+
+class ParallelClassifier(object):
+    """Classify large streams of requests with a pool of worker processes
+
+    Every worker process builds its own `DisconnectParser` once when it
+    starts, either from a snapshot written by
+    `DisconnectParser.save_snapshot` or from the given parser arguments.
+    Alternatively, all workers can share one `SharedIndex`, so the memory
+    held by the lists does not grow with the number of workers. The
+    input stream is consumed lazily and split into chunks, and at most a few
+    chunks per worker are in flight at any time, so memory use does not
+    grow with the size of the input.
+
+    The classifier can be used as a context manager, which shuts down the
+    worker processes on exit.
+    """
+    def __init__(self, processes=None, chunk_size=10000, snapshot=None,
+                 shared_index=None, **parser_kwargs):
+        """Initialize the classifier and start the worker processes.
+
+        Parameters
+        ----------
+        processes : int (optional)
+            The number of worker processes. Defaults to the number of CPUs.
+        chunk_size : int (optional)
+            The number of requests sent to a worker at once.
+            (default 10000)
+        snapshot : string (optional)
+            The file location of a parser snapshot to load in every worker.
+            This cannot be used alongside parser arguments.
+        shared_index : string (optional)
+            The file location of a `SharedIndex` opened by every worker. This
+            cannot be used alongside a snapshot or parser arguments.
+        parser_kwargs
+            Arguments passed to `DisconnectParser` in every worker, e.g.
+            `blocklist` and `entitylist`.
+        """
+        sources = sum([snapshot is not None, shared_index is not None,
+                       len(parser_kwargs) > 0])
+        if sources > 1:
+            raise ValueError(
+                "Invalid combination of arguments. You must only specify one "
+                "of a snapshot, a shared index and parser arguments.")
+        if sources == 0:
+            raise ValueError(
+                "Either a `snapshot`, a `shared_index` or parser arguments "
+                "must be specified.")
+        if chunk_size <= 0:
+            raise ValueError(
+                "Invalid chunk size %s. The chunk size must be a positive "
+                "integer." % chunk_size)
+        if processes is None:
+            processes = os.cpu_count() or 1
+        self._chunk_size = chunk_size
+        self._max_pending = 2 * processes
+        self._executor = ProcessPoolExecutor(
+            max_workers=processes,
+            initializer=_init_worker,
+            initargs=(snapshot, shared_index, parser_kwargs)
+        )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Shut down the worker processes"""
+        self._executor.shutdown()
+
+    def _chunks(self, pairs):
+        """Split the input stream into lists of at most `chunk_size` pairs"""
+        pairs = iter(pairs)
+        while True:
+            chunk = list(islice(pairs, self._chunk_size))
+            if len(chunk) == 0:
+                return
+            yield chunk
+
+    def classify_chunks(self, pairs, ordered=True):
+        """Classify `pairs` and yield the results chunk by chunk
+
+        Parameters
+        ----------
+        pairs : iterable of tuples
+            `(url, top_url)` pairs to classify. `top_url` may be None, in
+            which case the entitylist is not checked for that request.
+        ordered : boolean (optional)
+            Set to False to yield chunks as soon as they are classified
+            rather than in input order. (default True)
+
+        Yields
+        ------
+        int : The index of the chunk in the input stream. The chunk with
+            index `i` holds the results of requests `i * chunk_size` up to
+            `(i + 1) * chunk_size`.
+        list : `blacklisted`, `whitelisted`, or None for each request
+        list : The matching domain or None for each request
+        """
+        chunks = enumerate(self._chunks(pairs))
+        if ordered:
+            pending = deque()
+            for index, chunk in chunks:
+                if len(pending) >= self._max_pending:
+                    yield pending.popleft().result()
+                pending.append(
+                    self._executor.submit(_classify_chunk, index, chunk))
+            while pending:
+                yield pending.popleft().result()
+            return
+        pending = set()
+        for index, chunk in chunks:
+            if len(pending) >= self._max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+            pending.add(self._executor.submit(_classify_chunk, index, chunk))
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+
+    def classify(self, pairs):
+        """Classify `pairs` and yield the results in input order
+
+        Parameters
+        ----------
+        pairs : iterable of tuples
+            `(url, top_url)` pairs to classify. `top_url` may be None, in
+            which case the entitylist is not checked for that request.
+
+        Yields
+        ------
+        tuple : The result of `DisconnectParser.should_block_with_match` for
+            each request, i.e. the verdict and the matching domain.
+        """
+        for index, verdicts, rules in self.classify_chunks(pairs):
+            for result in zip(verdicts, rules):
+                yield result
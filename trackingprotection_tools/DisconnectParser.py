@@ -1,11 +1,24 @@
+import contextlib
+import copy
+import functools
+import hashlib
 import json
 import os
-from collections import Counter
+import pickle
+import re
+import struct
+import sys
+from collections import Counter, OrderedDict, namedtuple
+from collections.abc import Mapping
 from urllib.parse import urlparse
 
-import requests
 from domain_utils import domain_utils as du
 
+from .DisconnectFetcher import ListFetcher
+from .DisconnectLoader import (ListSource, iter_blocklist,
+                               iter_blocklist_stream, iter_entitylist_stream,
+                               require_ijson)
+
 DNT_TAG = 'dnt'
 FINGERPRINTING_TAG = 'fingerprinting'
 CRYPTOMINING_TAG = 'cryptominer'
@@ -16,6 +29,257 @@ DISCONNECT_TAGS = {
 }
 ALL_TAGS = DISCONNECT_TAGS.union({DNT_TAG})
 
+PS1_CACHE_SIZE = 2 ** 16
+
+SNAPSHOT_MAGIC = b'TPTOOLS-SNAPSHOT'
+SNAPSHOT_VERSION = 6
+
+# Layout of the packed per-domain records, see `_pack_record`
+RECORD_FIELD_BITS = 16
+RECORD_FIELD_MASK = (1 << RECORD_FIELD_BITS) - 1
+
+DomainInfo = namedtuple('DomainInfo', ['categories', 'tags', 'organization'])
+
+CacheInfo = namedtuple(
+    'CacheInfo', ['hits', 'misses', 'evictions', 'maxsize', 'currsize'])
+
+
+class MatchResult(object):
+    """The classification of one request, as returned by `lookup`
+
+    Attributes
+    ----------
+    verdict : string
+        `blacklisted`, `whitelisted`, or None, as returned by
+        `DisconnectParser.should_block_with_match`.
+    rule : string
+        The matching domain of blocked requests, or None.
+    depth : int
+        The index of `rule` among `get_candidate_hostnames` of the request
+        hostname, where 0 is an exact match, or None.
+    categories : tuple
+        The sorted categories of `rule`, with Disconnect domains reported
+        under their remapped category.
+    tags : tuple
+        The sorted sub-category tags of `rule`.
+    organization : string
+        The organization owning `rule`, or None.
+
+    Results are shared through the decision cache and are read-only.
+    """
+    __slots__ = ('verdict', 'rule', 'depth', 'categories', 'tags',
+                 'organization')
+
+    def __init__(self, verdict=None, rule=None, depth=None, categories=(),
+                 tags=(), organization=None):
+        set_field = object.__setattr__
+        set_field(self, 'verdict', verdict)
+        set_field(self, 'rule', rule)
+        set_field(self, 'depth', depth)
+        set_field(self, 'categories', categories)
+        set_field(self, 'tags', tags)
+        set_field(self, 'organization', organization)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("MatchResult is read-only.")
+
+    def __eq__(self, other):
+        if not isinstance(other, MatchResult):
+            return NotImplemented
+        return all(getattr(self, field) == getattr(other, field)
+                   for field in self.__slots__)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, field) for field in self.__slots__))
+
+    def __repr__(self):
+        return 'MatchResult(%s)' % ', '.join(
+            '%s=%r' % (field, getattr(self, field))
+            for field in self.__slots__)
+
+
+# The result of requests that don't match the blocklist
+NO_MATCH = MatchResult()
+WHITELISTED = MatchResult('whitelisted')
+
+# Hostnames that `urlparse` would return unchanged
+_NORMALIZED_HOSTNAME = re.compile(r'[a-z0-9_.-]+\Z')
+
+
+def get_hostname(url):
+    """Return the hostname of `url`, which may also be a bare hostname
+
+    Bare lowercase hostnames and simple `http(s)://` URLs are handled without
+    `urlparse`. Anything else (ports, credentials, IPv6 literals, uppercase
+    characters, ...) falls back to `urlparse`, which also lowercases the
+    hostname.
+
+    Parameters
+    ----------
+    url : string
+        A URL or hostname.
+
+    Returns
+    -------
+    string : The hostname, or None if `url` doesn't have one.
+    """
+    if _NORMALIZED_HOSTNAME.match(url):
+        return url
+    if url.startswith('https://'):
+        start = 8
+    elif url.startswith('http://'):
+        start = 7
+    else:
+        start = 0
+    if start > 0:
+        end = len(url)
+        for delimiter in '/?#':
+            i = url.find(delimiter, start, end)
+            if i != -1:
+                end = i
+        hostname = url[start:end]
+        if _NORMALIZED_HOSTNAME.match(hostname):
+            return hostname
+    if not url.startswith('http'):
+        url = 'http://' + url
+    return urlparse(url).hostname
+
+
+def is_ip_address(hostname):
+    """Return True if `hostname` is an IPv4 or IPv6 address
+
+    Hostnames are only passed to the full check if they contain a colon or
+    end in a digit, which no registrable domain does.
+    """
+    return ((':' in hostname or hostname[-1:].isdigit()) and
+            du.is_ip_address(hostname))
+
+
+@functools.lru_cache(maxsize=PS1_CACHE_SIZE)
+def _get_hostname_ps_plus_1(hostname):
+    """Return the PS+1 of `hostname`, memoized for all parsers"""
+    if ':' in hostname:
+        # IPv6 addresses are their own PS+1
+        return hostname
+    return du.get_ps_plus_1('http://' + hostname)
+
+
+def get_ps_plus_1(url):
+    """Return the PS+1 (eTLD+1) of `url`, which may also be a bare hostname
+
+    Results are kept in a bounded least recently used cache keyed on the
+    hostname, which is shared by all `DisconnectParser` instances. See
+    `ps_plus_1_cache_info`.
+
+    Parameters
+    ----------
+    url : string
+        A URL or hostname.
+
+    Returns
+    -------
+    string : The PS+1 of `url`, or the IP address if `url` has one.
+    """
+    return _get_hostname_ps_plus_1(get_hostname(url))
+
+
+def ps_plus_1_cache_info():
+    """Return statistics of the shared PS+1 cache
+
+    Returns
+    -------
+    namedtuple : `hits`, `misses`, `maxsize` and `currsize` of the cache, as
+        returned by `functools.lru_cache`.
+    """
+    return _get_hostname_ps_plus_1.cache_info()
+
+
+def ps_plus_1_cache_clear():
+    """Clear the shared PS+1 cache and its statistics"""
+    _get_hostname_ps_plus_1.cache_clear()
+
+
+def get_candidate_hostnames(hostname):
+    """Yield the hostnames Firefox checks against the list for `hostname`
+
+    Firefox blocks domains from the Disconnect list following the
+    Safebrowsing parsing rules detailed here:
+    https://developers.google.com/safe-browsing/v4/urls-hashing#suffixprefix-expressions
+
+    The exact hostname is checked first. Unless it is an IP address, up to
+    four hostnames formed by starting with the last five components and
+    successively removing the leading component follow.
+
+    NOTE: The top-level domain should be skipped, but this is currently
+    not implemented in Firefox. See: Bug 1203635.
+
+    Parameters
+    ----------
+    hostname : string
+        A hostname as returned by `get_hostname`.
+
+    Yields
+    ------
+    string : At most five candidate hostnames, longest first.
+    """
+    yield hostname
+    if is_ip_address(hostname):
+        return
+    # Find the dots that start the suffixes with up to five components
+    dot5 = dot4 = dot3 = dot2 = -1
+    dot1 = hostname.rfind('.')
+    if dot1 != -1:
+        dot2 = hostname.rfind('.', 0, dot1)
+        if dot2 != -1:
+            dot3 = hostname.rfind('.', 0, dot2)
+            if dot3 != -1:
+                dot4 = hostname.rfind('.', 0, dot3)
+                if dot4 != -1:
+                    dot5 = hostname.rfind('.', 0, dot4)
+    # The leading component of the hostname is always removed first
+    if dot5 != -1:
+        dots = (dot5, dot4, dot3, dot2)
+    elif dot4 != -1:
+        dots = (dot4, dot3, dot2, dot1)
+    elif dot3 != -1:
+        dots = (dot3, dot2, dot1)
+    elif dot2 != -1:
+        dots = (dot2, dot1)
+    elif dot1 != -1:
+        dots = (dot1,)
+    else:
+        return
+    for dot in dots:
+        candidate = hostname[dot + 1:]
+        if candidate == '':
+            return
+        yield candidate
+
+
+class _OrganizationIndex(Mapping):
+    """Read-only mapping of domains to organizations backed by the records
+
+    Used in place of the company classifier dict in compact mode, see
+    `DisconnectParser._pack_record` for the layout of the records.
+    """
+    def __init__(self, records, organization_names):
+        self._records = records
+        self._organization_names = organization_names
+
+    def __getitem__(self, domain):
+        organization_id = self._records[domain] >> 2 * RECORD_FIELD_BITS
+        if organization_id == 0:
+            raise KeyError(domain)
+        return self._organization_names[organization_id - 1]
+
+    def __iter__(self):
+        for domain, record in self._records.items():
+            if record >> 2 * RECORD_FIELD_BITS != 0:
+                yield domain
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
 
 class DisconnectParser(object):
     """A parser for the Disconnect list.
@@ -23,12 +287,28 @@ class DisconnectParser(object):
     This partser is meant to use the list as it is used in Firefox's URL
     classifier. This does not necessarily match the implementation of
     Disconnect's own extension or any other consumer of the Disconnect list"""
+
+    # Parsed state that is stored in and restored from snapshots
+    _SNAPSHOT_ATTRIBUTES = (
+        '_exclude', '_should_remap', '_compact', '_lists',
+        '_all_list_categories', '_categorized_blocklist', '_tagged_domains',
+        '_company_classifier', '_domain_records', '_category_bits',
+        '_tag_bits', '_organization_ids', '_category_names', '_tag_names',
+        '_organization_names', '_views', '_source_hashes'
+    )
+
     def __init__(self, blocklist=None, entitylist=None,
                  blocklist_url=None, entitylist_url=None,
                  disconnect_mapping=None, disconnect_mapping_url=None,
-                 categories_to_exclude=[], verbose=False):
+                 categories_to_exclude=[], verbose=False, cache_size=None,
+                 compact=False, fetcher=None, metrics=None,
+                 streaming=False):
         """Initialize the parser.
 
+        Lists may be gzip-, bz2- or zstd-compressed, which is detected from
+        their content. Reading zstd-compressed lists requires the optional
+        `zstandard` package.
+
         Parameters
         ----------
         blocklist : string
@@ -53,35 +333,213 @@ class DisconnectParser(object):
             the `Content` category by default. (default empty list)
         verbose : boolean
             Set to True to print list parsing info.
+        cache_size : int (optional)
+            The maximum number of decisions to keep in a least recently used
+            cache keyed on the request hostname and top-level hostname. The
+            cache is disabled by default.
+        compact : boolean (optional)
+            Set to True to reduce the memory held by the parser. The raw
+            lists are dropped once parsed, domain and organization strings
+            are interned, and organizations are only stored by id in the
+            per-domain records. Lookups are not affected. (default False)
+        fetcher : ListFetcher (optional)
+            The fetcher used to download the lists given by URL, e.g. to
+            cache them on disk. All lists given by URL are downloaded
+            concurrently when the parser is created. A fetcher without a disk
+            cache is used by default.
+        metrics : ParserMetrics (optional)
+            Record the duration of parsing and lookup phases and lookup
+            counters in `metrics`. Nothing is recorded by default.
+        streaming : boolean (optional)
+            Set to True to parse the blocklist and entitylist incrementally
+            while they are read, one organization at a time, so the raw lists
+            are never held in memory. Requires the optional `ijson` package,
+            installed by the `streaming` extra. (default False)
         """
-        self.verbose = verbose
+        if streaming:
+            require_ijson()
+        self._init_runtime_state(verbose, cache_size, metrics)
+        self._compact = compact
+        self._streaming = streaming
         self._exclude = set([x.lower() for x in categories_to_exclude])
+        self._source_hashes = dict()
+
+        # The remapping and entitylist are loaded on first use. Parsed lists
+        # are shared with the parsers returned by `with_categories_excluded`.
+        self._list_locations = {
+            'disconnect_mapping': (disconnect_mapping, disconnect_mapping_url),
+            'entitylist': (entitylist, entitylist_url)
+        }
+        for location, network_location in self._list_locations.values():
+            self._check_list_location(location, network_location)
+        self._check_list_location(blocklist, blocklist_url)
+        self._lists = dict()
+
+        # Lists given by URL are all downloaded up front and parsed on use
+        urls = [url for url in (blocklist_url, entitylist_url,
+                                disconnect_mapping_url) if url is not None]
+        self._fetched = dict()
+        if len(urls) > 0 and fetcher is None:
+            with self._phase('fetch'), ListFetcher() as default_fetcher:
+                self._fetched = default_fetcher.fetch_many(urls)
+        elif len(urls) > 0:
+            with self._phase('fetch'):
+                self._fetched = fetcher.fetch_many(urls)
+        self._raw_entitylist = None
+        # Incremented whenever the parsed lists are updated in place. Shared
+        # with the parsers returned by `with_categories_excluded`.
+        self._list_version = [0]
 
         # Remapping
-        self._disconnect_mapping = self._load_list(
-            disconnect_mapping, disconnect_mapping_url)
-        self._should_remap = self._disconnect_mapping is not None
+        self._should_remap = (disconnect_mapping is not None or
+                              disconnect_mapping_url is not None)
 
         # Blocklist
-        self._raw_blocklist = self._load_list(blocklist, blocklist_url)
-        if self._raw_blocklist is None:
+        self._raw_blocklist = None
+        if self._streaming:
+            rv = self._load_list(blocklist, blocklist_url, 'blocklist',
+                                 self._stream_blocklist)
+        else:
+            rv = self._raw_blocklist = self._load_list(
+                blocklist, blocklist_url, 'blocklist')
+        if rv is None:
             raise ValueError(
                 "Unable to load blocklist. Did you specify a valid list "
                 "location in `blocklist` or `blocklist_url`?"
             )
-        rv = self._parse_blocklist(self._raw_blocklist)
+        if not self._streaming:
+            with self._phase('parse_blocklist'):
+                rv = self._parse_blocklist(iter_blocklist(self._raw_blocklist))
         (self._categorized_blocklist,
          self._tagged_domains,
-         self._company_classifier) = rv
-        self._blocklist = self._flatten_blocklist(self._categorized_blocklist)
+         self._company_classifier,
+         self._domain_records) = rv
+        if self._compact:
+            self._raw_blocklist = None
+            self._company_classifier = _OrganizationIndex(
+                self._domain_records, self._organization_names)
+        self._views = dict()
+        self._blocklist = self._get_view(self._exclude)[0]
 
-        # Entitylist
-        self._raw_entitylist = self._load_list(entitylist, entitylist_url)
-        if self._raw_entitylist is not None:
-            self._entitylist = self._parse_entitylist(self._raw_entitylist)
+    def _init_runtime_state(self, verbose, cache_size, metrics):
+        """Set up the state that is not derived from the lists"""
+        self.verbose = verbose
+        self._metrics = metrics
+        # Lookup phases are only timed by instrumented parsers, which shadow
+        # the methods with timed wrappers bound to this parser.
+        self.__dict__.pop('_match_hostname', None)
+        self.__dict__.pop('_is_whitelisted', None)
+        if metrics is not None:
+            self._match_hostname = metrics.timed(
+                'suffix_walk', self._match_hostname)
+            self._is_whitelisted = metrics.timed(
+                'entitylist_check', self._is_whitelisted)
+        if cache_size is not None and cache_size <= 0:
+            raise ValueError(
+                "Invalid cache size %s. The cache size must be a positive "
+                "integer or None to disable caching." % cache_size)
+        self._cache_size = cache_size
+        self._cache = OrderedDict()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
+        self._cached_blocklist = None
+        self._cached_version = None
+
+    def _phase(self, phase):
+        """Return a context manager timing `phase` if metrics are enabled"""
+        if self._metrics is None:
+            return contextlib.nullcontext()
+        return self._metrics.time_phase(phase)
+
+    def get_metrics(self):
+        """Return the `ParserMetrics` of this parser, or None"""
+        return self._metrics
 
-    def _load_list(self, location, network_location):
-        """Load the list from the disk or network and return a json object"""
+    @property
+    def _disconnect_mapping(self):
+        """The disconnect category remapping, loaded on first use"""
+        try:
+            return self._lists['disconnect_mapping']
+        except KeyError:
+            pass
+        location, network_location = self._list_locations[
+            'disconnect_mapping']
+        mapping = self._load_list(
+            location, network_location, 'disconnect_mapping')
+        self._lists['disconnect_mapping'] = mapping
+        return mapping
+
+    @property
+    def _entitylist(self):
+        """The parsed entitylist, loaded on first use"""
+        try:
+            return self._lists['entitylist'][0]
+        except KeyError:
+            return self._load_entitylist()[0]
+
+    @property
+    def _entitylist_resources(self):
+        """Maps entitylist resources to the properties they are allowed on"""
+        try:
+            return self._lists['entitylist'][1]
+        except KeyError:
+            return self._load_entitylist()[1]
+
+    @property
+    def _entitylist_owners(self):
+        """Maps entitylist properties and resources to their organization"""
+        try:
+            return self._lists['entitylist'][2]
+        except KeyError:
+            return self._load_entitylist()[2]
+
+    @property
+    def _organization_domains(self):
+        """Maps organizations to the domains they own, built on first use
+
+        Blocklist domains and entitylist properties and resources are
+        merged under the name of their organization.
+        """
+        try:
+            return self._lists['organization_domains']
+        except KeyError:
+            pass
+        index = dict()
+        for domain, record in self._domain_records.items():
+            organization_id = record >> 2 * RECORD_FIELD_BITS
+            if organization_id != 0:
+                index.setdefault(
+                    self._organization_names[organization_id - 1],
+                    set()).add(domain)
+        for domain, organization in self._entitylist_owners.items():
+            index.setdefault(organization, set()).add(domain)
+        self._lists['organization_domains'] = index
+        return index
+
+    def _load_entitylist(self):
+        """Load and parse the entitylist"""
+        location, network_location = self._list_locations['entitylist']
+        if self._streaming:
+            entitylist = self._load_list(location, network_location,
+                                         'entitylist', self._stream_entitylist)
+        else:
+            self._raw_entitylist = self._load_list(
+                location, network_location, 'entitylist')
+            entitylist = None
+            if self._raw_entitylist is not None:
+                with self._phase('parse_entitylist'):
+                    entitylist = self._parse_entitylist(
+                        self._raw_entitylist.items())
+        if entitylist is None:
+            entitylist = (dict(), dict(), dict())
+        if self._compact:
+            self._raw_entitylist = None
+        self._lists['entitylist'] = entitylist
+        return entitylist
+
+    def _check_list_location(self, location, network_location):
+        """Raise if both a local and network location of a list are given"""
         if location is not None and network_location is not None:
             raise ValueError(
                 "Invalid combination of arguments. "
@@ -89,19 +547,278 @@ class DisconnectParser(object):
                 "the same list. Choose one of the following: %s and %s." %
                 (location, network_location)
             )
-        if location is not None:
-            with open(os.path.expanduser(location), 'r') as f:
-                json_list = json.load(f)
-            return json_list
-        if network_location is not None:
-            resp = requests.get(network_location)
-            if resp.status_code != 200:
-                raise RuntimeError(
-                    "Bad status code while requesting %s (code: %s)." %
-                    (network_location, resp.status_code)
+
+    def _load_list(self, location, network_location, name, read=json.load):
+        """Load the list from the disk or network and return `read(stream)`
+
+        `read` is called with a binary stream of the decompressed list and
+        parses it into a json object by default. The SHA-256 digest of the
+        raw content is recorded under `name` in the parser's source hashes.
+        """
+        self._check_list_location(location, network_location)
+        if location is None and network_location is None:
+            return
+        with self._phase('load_' + name):
+            if location is not None:
+                source = ListSource.from_file(location)
+            else:
+                try:
+                    content = self._fetched.pop(network_location)
+                except KeyError:
+                    with ListFetcher() as fetcher:
+                        content = fetcher.fetch(network_location)
+                source = ListSource.from_bytes(content)
+                del content
+            with source:
+                out = read(source.stream)
+                self._source_hashes[name] = source.hexdigest()
+            return out
+
+    def _stream_blocklist(self, stream):
+        """Parse the blocklist while it is read from `stream`"""
+        with self._phase('parse_blocklist'):
+            return self._parse_blocklist(iter_blocklist_stream(stream))
+
+    def _stream_entitylist(self, stream):
+        """Parse the entitylist while it is read from `stream`"""
+        with self._phase('parse_entitylist'):
+            return self._parse_entitylist(iter_entitylist_stream(stream))
+
+    def get_source_hashes(self):
+        """Return the SHA-256 digests of the lists this parser was built from
+
+        Returns
+        -------
+        dict : Maps `blocklist`, `entitylist` and `disconnect_mapping` to the
+            hex digest of the corresponding list, for the lists that were
+            given.
+        """
+        return dict(self._source_hashes)
+
+    def save_snapshot(self, path):
+        """Save the parsed list to a snapshot file at `path`
+
+        Snapshots can be loaded with `DisconnectParser.from_snapshot`, which
+        is much faster than parsing the lists again. The snapshot records the
+        digests of the source lists so stale snapshots can be detected.
+
+        Parameters
+        ----------
+        path : string
+            The file location to write the snapshot to.
+        """
+        # Make sure the lazily loaded lists are part of the snapshot
+        self._disconnect_mapping
+        self._entitylist
+        header = json.dumps({
+            'sources': self._source_hashes,
+            'categories_to_exclude': sorted(self._exclude)
+        }).encode('utf-8')
+        state = dict()
+        for attribute in self._SNAPSHOT_ATTRIBUTES:
+            state[attribute] = getattr(self, attribute)
+        with open(os.path.expanduser(path), 'wb') as f:
+            f.write(SNAPSHOT_MAGIC)
+            f.write(struct.pack('>II', SNAPSHOT_VERSION, len(header)))
+            f.write(header)
+            pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def from_snapshot(cls, path, blocklist=None, entitylist=None,
+                      disconnect_mapping=None, verbose=False,
+                      cache_size=None, metrics=None):
+        """Load a parser from a snapshot written by `save_snapshot`
+
+        The parsed state is restored as-is without validation, so snapshots
+        must only be loaded from trusted locations.
+
+        Parameters
+        ----------
+        path : string
+            The file location of the snapshot.
+        blocklist : string (optional)
+            The file location of the current blocklist. If given, the snapshot
+            must have been built from a list with the same content.
+        entitylist : string (optional)
+            The file location of the current entitylist. If given, the
+            snapshot must have been built from a list with the same content.
+        disconnect_mapping : string (optional)
+            The file location of the current disconnect category remapping
+            file. If given, the snapshot must have been built from a mapping
+            with the same content.
+        verbose : boolean
+            Set to True to print list parsing info.
+        cache_size : int (optional)
+            The maximum number of decisions to keep in the decision cache.
+            The cache is disabled by default.
+        metrics : ParserMetrics (optional)
+            Record lookup phases and counters in `metrics`.
+
+        Returns
+        -------
+        DisconnectParser : The parser stored in the snapshot.
+
+        Raises
+        ------
+        ValueError
+            If the file is not a snapshot, was written by an unsupported
+            version, or is stale with respect to one of the given lists.
+        """
+        with open(os.path.expanduser(path), 'rb') as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                raise ValueError("%s is not a parser snapshot." % path)
+            version, header_length = struct.unpack('>II', f.read(8))
+            if version != SNAPSHOT_VERSION:
+                raise ValueError(
+                    "Snapshot %s has version %s but only version %s is "
+                    "supported. Rebuild the snapshot from the source lists."
+                    % (path, version, SNAPSHOT_VERSION))
+            header = json.loads(f.read(header_length).decode('utf-8'))
+            sources = {
+                'blocklist': blocklist,
+                'entitylist': entitylist,
+                'disconnect_mapping': disconnect_mapping
+            }
+            for name, location in sources.items():
+                if location is None:
+                    continue
+                with open(os.path.expanduser(location), 'rb') as lf:
+                    digest = hashlib.sha256(lf.read()).hexdigest()
+                if header['sources'].get(name) != digest:
+                    raise ValueError(
+                        "Snapshot %s is stale: it was not built from the "
+                        "current %s at %s." % (path, name, location))
+            state = pickle.load(f)
+        parser = cls.__new__(cls)
+        parser._init_runtime_state(verbose, cache_size, metrics)
+        parser.__dict__.update(state)
+        parser._list_locations = dict()
+        parser._fetched = dict()
+        parser._streaming = False
+        parser._list_version = [0]
+        parser._decoded_categories = dict()
+        parser._decoded_tags = dict()
+        parser._raw_blocklist = None
+        parser._raw_entitylist = None
+        parser._blocklist = parser._get_view(parser._exclude)[0]
+        return parser
+
+    def apply_diff(self, diff):
+        """Update the parsed lists in place to the new version of a diff
+
+        The work done is proportional to the size of the diff rather than
+        the size of the list. The parsed lists are shared with the parsers
+        returned by `with_categories_excluded`, which are updated as well.
+        The raw lists are not updated and are dropped from this parser.
+
+        Parameters
+        ----------
+        diff : ListDiff
+            The changes to apply, as computed by
+            `DisconnectDiff.diff_lists` between a parser of the same list
+            as this parser and a parser of the new list.
+        """
+        for category in diff.categories - self._all_list_categories:
+            self._categorized_blocklist[category] = set()
+        changes = dict()
+        for domain, categories in diff.added.items():
+            changes[domain] = (set(), categories)
+        for domain, categories in diff.removed.items():
+            changes[domain] = (categories, set())
+        changes.update(diff.recategorized)
+        for domain, (old, new) in changes.items():
+            for category in old - new:
+                self._categorized_blocklist[category].discard(domain)
+            for category in new - old:
+                self._categorized_blocklist[category].add(domain)
+            for exclude, (blocklist, index) in self._views.items():
+                blocked = any(
+                    category.lower() not in exclude and not (
+                        self._should_remap and category == 'Disconnect')
+                    for category in new
                 )
-            return json.loads(resp.content.decode('utf-8'))
-        return
+                if blocked and domain not in blocklist:
+                    blocklist.add(domain)
+                    if index is not None:
+                        self._add_to_suffix_index(index, domain)
+                elif not blocked and domain in blocklist:
+                    blocklist.discard(domain)
+                    if index is not None:
+                        self._remove_from_suffix_index(index, domain)
+        for category in self._all_list_categories - diff.categories:
+            del self._categorized_blocklist[category]
+        self._all_list_categories.clear()
+        self._all_list_categories.update(diff.categories)
+
+        for domain, (old, new) in changes.items():
+            self._update_domain_record(domain, categories=new)
+
+        for domain, (old, new) in diff.organization_changes.items():
+            # In compact mode the organization index reads the records
+            if not self._compact and new is None:
+                self._company_classifier.pop(domain, None)
+            elif not self._compact:
+                self._company_classifier[domain] = new
+            self._update_domain_record(domain, organization=new)
+        for domain, (old, new) in diff.tag_changes.items():
+            old = old or set()
+            new = new or set()
+            for tag in old - new:
+                self._tagged_domains[tag].discard(domain)
+                if len(self._tagged_domains[tag]) == 0:
+                    del self._tagged_domains[tag]
+            for tag in new - old:
+                self._tagged_domains.setdefault(tag, set()).add(domain)
+            self._update_domain_record(domain, tags=new)
+        entitylist = self._entitylist
+        resource_index = self._entitylist_resources
+        for url, (old, new) in diff.entitylist_changes.items():
+            for resource in entitylist.pop(url, ()):
+                resource_index[resource].discard(url)
+                if len(resource_index[resource]) == 0:
+                    del resource_index[resource]
+            if new is not None:
+                entitylist[url] = new
+                for resource in new:
+                    resource_index.setdefault(resource, set()).add(url)
+        owners = self._entitylist_owners
+        for host, (old, new) in diff.entitylist_owner_changes.items():
+            if new is None:
+                del owners[host]
+            else:
+                owners[host] = new
+        # Rebuilt on next use
+        self._lists.pop('organization_domains', None)
+
+        self._source_hashes.clear()
+        self._source_hashes.update(diff.source_hashes[1])
+        self._raw_blocklist = None
+        self._raw_entitylist = None
+        self._list_version[0] += 1
+
+    def with_categories_excluded(self, categories_to_exclude):
+        """Return a parser that excludes a different set of categories
+
+        The returned parser shares the parsed lists with this parser, so no
+        list is loaded or parsed again. The flattened blocklist of every
+        exclusion set is only built once, on first use.
+
+        Parameters
+        ----------
+        categories_to_exclude : list
+            A list of list categories to exclude, e.g. `['Content']` for the
+            categories Firefox blocks by default.
+
+        Returns
+        -------
+        DisconnectParser : A parser with the given category exclusions.
+        """
+        parser = copy.copy(self)
+        parser._init_runtime_state(
+            self.verbose, self._cache_size, self._metrics)
+        parser._exclude = set([x.lower() for x in categories_to_exclude])
+        parser._blocklist = parser._get_view(parser._exclude)[0]
+        return parser
 
     def _remap_disconnect(self, domain):
         """Remap the "Disconnect" category
@@ -153,76 +870,250 @@ class DisconnectParser(object):
         """
         return key not in ALL_TAGS
 
-    def _parse_blocklist(self, blocklist):
-        """Parse raw blocklist into a format that's easier to work with"""
+    def _parse_blocklist(self, items):
+        """Parse raw blocklist into a format that's easier to work with
+
+        Parameters
+        ----------
+        items : iterable
+            The `(category, item)` pairs of the blocklist, as yielded by
+            `iter_blocklist` or `iter_blocklist_stream`.
+        """
         if self.verbose:
             print("Parsing raw list into categorized list...")
 
         collapsed = dict()
         company_classifier = dict()
-        self._all_list_categories = set(blocklist['categories'].keys())
-        for category in self._all_list_categories:
-            collapsed[category] = set()
-
         tagged_domains = dict()
+        # Disconnect domains are remapped once all categories are known
+        remapped = list()
+        intern = sys.intern if self._compact else str
+        for cat, item in items:
+            if item is None:
+                collapsed.setdefault(cat, set())
+                continue
+            for org, urls in item.items():
+                org = intern(org)
+                # Parse out sub-category. The way the list is structured,
+                # we must first iterate through all items to gather
+                # the categories and then iterate again to apply these
+                # categories to domains. Categories are assumed to apply to
+                # all resources in an organization.
+                tags = set()
+                for k, v in urls.items():
+                    if self._is_domain_key(k):
+                        continue
+                    if k in DISCONNECT_TAGS:
+                        if v == "true":
+                            tags.add(k)
+                        continue
+                    elif k == DNT_TAG:
+                        tags.add(v)
+                        continue
+                    raise ValueError(
+                        "Unsupported record type %s in organization %s. "
+                        "This likely means the list changed and the "
+                        "parser should be updated." % (k, org))
+                for url, domains in urls.items():
+                    if not self._is_domain_key(url):
+                        continue
+                    for domain in domains:
+                        if len(domain) == 1:
+                            raise ValueError(
+                                "Unexpected domain of length 1 in "
+                                "resource list %s under organization %s. "
+                                "This likely means the parser needs to be "
+                                "updated due to a list format change." %
+                                (domains, org))
+                        domain = intern(domain)
+                        for tag in tags:
+                            if tag not in tagged_domains:
+                                tagged_domains[tag] = set()
+                            tagged_domains[tag].add(domain)
+                        if self._should_remap and cat == 'Disconnect':
+                            remapped.append(domain)
+                        collapsed[cat].add(domain)
+                        company_classifier[domain] = org
+        self._all_list_categories = set(collapsed.keys())
         remapping_count = Counter()
-        for cat in blocklist['categories'].keys():
-            for item in blocklist['categories'][cat]:
-                for org, urls in item.items():
-                    # Parse out sub-category. The way the list is structured,
-                    # we must first iterate through all items to gather
-                    # the categories and then iterate again to apply these
-                    # categories to domains. Categories are assumed to apply to
-                    # all resources in an organization.
-                    tags = set()
-                    for k, v in urls.items():
-                        if self._is_domain_key(k):
-                            continue
-                        if k in DISCONNECT_TAGS:
-                            if v == "true":
-                                tags.add(k)
-                            continue
-                        elif k == DNT_TAG:
-                            tags.add(v)
-                            continue
-                        raise ValueError(
-                            "Unsupported record type %s in organization %s. "
-                            "This likely means the list changed and the "
-                            "parser should be updated." % (k, org))
-                    for url, domains in urls.items():
-                        if not self._is_domain_key(url):
-                            continue
-                        for domain in domains:
-                            if len(domain) == 1:
-                                raise ValueError(
-                                    "Unexpected domain of length 1 in "
-                                    "resource list %s under organization %s. "
-                                    "This likely means the parser needs to be "
-                                    "updated due to a list format change." %
-                                    (domains, org))
-                            for tag in tags:
-                                if tag not in tagged_domains:
-                                    tagged_domains[tag] = set()
-                                tagged_domains[tag].add(domain)
-                            if self._should_remap and cat == 'Disconnect':
-                                new_cat = self._remap_disconnect(domain)
-                                collapsed[new_cat].add(domain)
-                                remapping_count[new_cat] += 1
-                            collapsed[cat].add(domain)
-                            company_classifier[domain] = org
+        for domain in remapped:
+            new_cat = self._remap_disconnect(domain)
+            collapsed[new_cat].add(domain)
+            remapping_count[new_cat] += 1
         if self.verbose:
             for category, count in remapping_count.items():
                 print("Remapped %d domains from Disconnect to %s" % (
                     count, category))
-        return collapsed, tagged_domains, company_classifier
+        domain_records = self._build_domain_records(
+            collapsed, tagged_domains, company_classifier)
+        return collapsed, tagged_domains, company_classifier, domain_records
+
+    def _build_domain_records(self, categorized, tagged, company_classifier):
+        """Build the index of packed per-domain records
+
+        See `_pack_record` for the layout of the records.
+        """
+        self._category_bits = dict()
+        self._category_names = list()
+        self._tag_bits = dict()
+        self._tag_names = list()
+        self._organization_ids = dict()
+        self._organization_names = list()
+        self._decoded_categories = dict()
+        self._decoded_tags = dict()
+        for category in sorted(categorized):
+            self._get_bit(category, self._category_bits, self._category_names)
+        for tag in sorted(tagged):
+            self._get_bit(tag, self._tag_bits, self._tag_names)
+
+        categories = dict()
+        for category, domains in categorized.items():
+            bit = self._category_bits[category]
+            for domain in domains:
+                categories[domain] = categories.get(domain, 0) | bit
+        tags = dict()
+        for tag, domains in tagged.items():
+            bit = self._tag_bits[tag]
+            for domain in domains:
+                tags[domain] = tags.get(domain, 0) | bit
+        records = dict()
+        for domain, category_mask in categories.items():
+            records[domain] = self._pack_record(
+                category_mask, tags.get(domain, 0),
+                company_classifier.get(domain))
+        return records
+
+    def _get_bit(self, name, bits, names):
+        """Return the bit of `name`, allocating a new one if needed"""
+        try:
+            return bits[name]
+        except KeyError:
+            pass
+        if len(names) == RECORD_FIELD_BITS:
+            raise ValueError(
+                "Unable to index more than %d categories or tags, found %s. "
+                "This likely means the list changed and the parser should "
+                "be updated." % (RECORD_FIELD_BITS, names + [name]))
+        bit = bits[name] = 1 << len(names)
+        names.append(name)
+        return bit
+
+    def _pack_record(self, category_mask, tag_mask, organization):
+        """Pack the categories, tags and organization of a domain
+
+        Records are single integers holding the category bitmask in the
+        lowest `RECORD_FIELD_BITS` bits, the tag bitmask in the next
+        `RECORD_FIELD_BITS` bits and the organization id above these. An
+        organization id of 0 means the domain has no organization, the
+        organization with id `i` is `_organization_names[i - 1]`.
+        """
+        organization_id = 0
+        if organization is not None:
+            try:
+                organization_id = self._organization_ids[organization]
+            except KeyError:
+                self._organization_names.append(organization)
+                organization_id = len(self._organization_names)
+                self._organization_ids[organization] = organization_id
+        return (category_mask | tag_mask << RECORD_FIELD_BITS |
+                organization_id << 2 * RECORD_FIELD_BITS)
 
-    def _flatten_blocklist(self, blocklist):
+    def _update_domain_record(self, domain, categories=None, tags=None,
+                              organization=False):
+        """Update the packed record of `domain` after a list change
+
+        Only the given fields are changed. Domains without any category are
+        removed from the index.
+        """
+        record = self._domain_records.get(domain, 0)
+        category_mask = record & RECORD_FIELD_MASK
+        tag_mask = record >> RECORD_FIELD_BITS & RECORD_FIELD_MASK
+        organization_id = record >> 2 * RECORD_FIELD_BITS
+        if categories is not None:
+            category_mask = 0
+            for category in categories:
+                category_mask |= self._get_bit(
+                    category, self._category_bits, self._category_names)
+        if tags is not None:
+            tag_mask = 0
+            for tag in tags:
+                tag_mask |= self._get_bit(
+                    tag, self._tag_bits, self._tag_names)
+        if organization is False:
+            organization = None
+            if organization_id != 0:
+                organization = self._organization_names[organization_id - 1]
+        if category_mask == 0:
+            self._domain_records.pop(domain, None)
+            return
+        self._domain_records[domain] = self._pack_record(
+            category_mask, tag_mask, organization)
+
+    def _decode_mask(self, mask, names, decoded):
+        """Return the sorted tuple of names set in `mask`, memoized"""
+        try:
+            return decoded[mask]
+        except KeyError:
+            pass
+        out = decoded[mask] = tuple(sorted(
+            name for i, name in enumerate(names) if mask & 1 << i
+        ))
+        return out
+
+    def _decode_record(self, record):
+        """Return the categories, tags and organization of a packed record
+
+        Disconnect is dropped from the categories if the parser remaps it.
+        """
+        category_mask = record & RECORD_FIELD_MASK
+        if self._should_remap:
+            category_mask &= ~self._category_bits.get('Disconnect', 0)
+        organization_id = record >> 2 * RECORD_FIELD_BITS
+        return (
+            self._decode_mask(category_mask, self._category_names,
+                              self._decoded_categories),
+            self._decode_mask(record >> RECORD_FIELD_BITS & RECORD_FIELD_MASK,
+                              self._tag_names, self._decoded_tags),
+            self._organization_names[organization_id - 1]
+            if organization_id != 0 else None
+        )
+
+    def _get_view(self, exclude):
+        """Return the flattened blocklist and its suffix index for `exclude`
+
+        Views are built on first use and memoized by exclusion set. In
+        compact mode the suffix index is None until `_suffix_index` is used.
+        """
+        key = frozenset(exclude)
+        try:
+            return self._views[key]
+        except KeyError:
+            pass
+        with self._phase('flatten_blocklist'):
+            blocklist = self._flatten_blocklist(key)
+        index = None
+        if not self._compact:
+            with self._phase('build_suffix_index'):
+                index = self._build_suffix_index(blocklist)
+        view = self._views[key] = [blocklist, index]
+        return view
+
+    @property
+    def _suffix_index(self):
+        """The suffix index of the current view, built on first use"""
+        view = self._get_view(self._exclude)
+        if view[1] is None:
+            with self._phase('build_suffix_index'):
+                view[1] = self._build_suffix_index(view[0])
+        return view[1]
+
+    def _flatten_blocklist(self, exclude):
         """Generate a flattened version of the blocklist category map"""
         if self.verbose:
             print("Parsing categorized list into single blocklist...")
         out = set()
         for category, domains in self._categorized_blocklist.items():
-            if category.lower() in self._exclude:
+            if category.lower() in exclude:
                 if self.verbose:
                     print("Skipping %s" % category)
                 continue
@@ -233,16 +1124,204 @@ class DisconnectParser(object):
             if self.verbose:
                 print("Added %i domains for category %s" % (
                     len(domains), category))
-            out = out.union(domains)
+            out.update(domains)
         return out
 
-    def _parse_entitylist(self, entitylist):
-        """Parse raw entitylist into a format that's easier to work with"""
+    def _build_suffix_index(self, domains):
+        """Build a reverse-label trie of `domains`
+
+        Each node of the trie is a dict mapping the next label (read from
+        the top-level domain down) to its child node. Nodes that correspond
+        to a domain in `domains` store that domain under the `None` key.
+        """
+        index = dict()
+        for domain in domains:
+            self._add_to_suffix_index(index, domain)
+        return index
+
+    def _add_to_suffix_index(self, index, domain):
+        """Add `domain` to the reverse-label trie `index`"""
+        node = index
+        for label in reversed(domain.split('.')):
+            try:
+                node = node[label]
+            except KeyError:
+                node[label] = node = dict()
+        node[None] = domain
+
+    def _remove_from_suffix_index(self, index, domain):
+        """Remove `domain` from the reverse-label trie `index`
+
+        Nodes that no longer lead to any domain are pruned.
+        """
+        path = [(None, index)]
+        node = index
+        for label in reversed(domain.split('.')):
+            try:
+                node = node[label]
+            except KeyError:
+                return
+            path.append((label, node))
+        node.pop(None, None)
+        for i in range(len(path) - 1, 0, -1):
+            label, node = path[i]
+            if len(node) > 0:
+                return
+            del path[i - 1][1][label]
+
+    def _parse_entitylist(self, entries):
+        """Parse raw entitylist into a format that's easier to work with
+
+        Parameters
+        ----------
+        entries : iterable
+            The `(organization, entry)` pairs of the entitylist, as returned
+            by `dict.items` or `iter_entitylist_stream`.
+
+        Returns
+        -------
+        dict : Maps each property to the set of resources allowed on it.
+        dict : Maps each resource to the set of properties it is allowed on.
+        dict : Maps each property and resource to its organization.
+        """
         out = dict()
-        for org in entitylist.keys():
-            for url in entitylist[org]['properties']:
-                out[url] = entitylist[org]['resources']
-        return out
+        resource_index = dict()
+        owners = dict()
+        intern = sys.intern if self._compact else str
+        for org, entry in entries:
+            org = intern(org)
+            resources = frozenset(intern(x) for x in entry['resources'])
+            for resource in resources:
+                owners[resource] = org
+            for url in entry['properties']:
+                url = intern(url)
+                out[url] = resources
+                owners[url] = org
+                for resource in resources:
+                    resource_index.setdefault(resource, set()).add(url)
+        return out, resource_index, owners
+
+    def _get_ps1(self, hostname):
+        """Return the PS+1 of `hostname` through the shared PS+1 cache"""
+        return _get_hostname_ps_plus_1(hostname)
+
+    def _is_whitelisted(self, url_host, top_host):
+        """Check the entitylist for already extracted hostnames
+
+        PS+1s are only computed once the resource index shows that the
+        request could be whitelisted at all.
+        """
+        resource_index = self._entitylist_resources
+        if url_host not in resource_index:
+            # A request is only whitelisted if its hostname or PS+1 is a
+            # resource, and the PS+1 is one of the hostname's suffixes once
+            # a trailing dot, which the PS+1 doesn't keep, is removed.
+            suffix = url_host.rstrip('.')
+            while suffix not in resource_index:
+                i = suffix.find('.')
+                if i == -1:
+                    return False
+                suffix = suffix[i + 1:]
+        if top_host in self._entitylist:
+            top_property = top_host
+        else:
+            top_property = self._get_ps1(top_host)
+            if top_property not in self._entitylist:
+                return False
+        properties = resource_index.get(url_host)
+        if properties is not None and top_property in properties:
+            return True
+        properties = resource_index.get(self._get_ps1(url_host))
+        return properties is not None and top_property in properties
+
+    def _match_hostname(self, hostname):
+        """Return the blocklist rule matching `hostname`, or None"""
+        blocklist = self._blocklist
+        for candidate in get_candidate_hostnames(hostname):
+            if candidate in blocklist:
+                return candidate
+        return
+
+    def _classify_hostnames(self, url_host, top_host):
+        """Classify a request given its already extracted hostnames
+
+        The entitylist is only consulted for requests that would otherwise
+        be blocked.
+        """
+        match = self._match_hostname(url_host)
+        if match is None:
+            return None, None
+        if top_host is not None and self._is_whitelisted(url_host, top_host):
+            return 'whitelisted', None
+        return 'blacklisted', match
+
+    def _lookup_hostnames(self, url_host, top_host):
+        """Return the `MatchResult` of already extracted hostnames"""
+        blocklist = self._blocklist
+        for depth, candidate in enumerate(get_candidate_hostnames(url_host)):
+            if candidate in blocklist:
+                break
+        else:
+            return NO_MATCH
+        if top_host is not None and self._is_whitelisted(url_host, top_host):
+            return WHITELISTED
+        return MatchResult('blacklisted', candidate, depth,
+                           *self._decode_record(
+                               self._domain_records[candidate]))
+
+    def _record_outcome(self, hostname, verdict, match):
+        """Record the outcome of a classified request in the metrics"""
+        depth = None
+        if match is not None:
+            for depth, candidate in enumerate(
+                    get_candidate_hostnames(hostname)):
+                if candidate == match:
+                    break
+        self._metrics.record_outcome(
+            verdict, depth=depth, ip_address=is_ip_address(hostname))
+
+    def _cached(self, key, func, *args):
+        """Return `func(*args)`, going through the decision cache if enabled
+        """
+        if self._cache_size is None:
+            return func(*args)
+        if (self._cached_blocklist is not self._blocklist or
+                self._cached_version != self._list_version[0]):
+            # The lists changed since the cache was filled
+            self.cache_clear()
+            self._cached_blocklist = self._blocklist
+            self._cached_version = self._list_version[0]
+        try:
+            value = self._cache[key]
+        except KeyError:
+            self._cache_misses += 1
+            value = self._cache[key] = func(*args)
+            if len(self._cache) > self._cache_size:
+                self._cache.popitem(last=False)
+                self._cache_evictions += 1
+            return value
+        self._cache_hits += 1
+        self._cache.move_to_end(key)
+        return value
+
+    def cache_info(self):
+        """Return statistics of the decision cache
+
+        Returns
+        -------
+        CacheInfo : A named tuple of `hits`, `misses`, `evictions`, `maxsize`
+            and `currsize`. `maxsize` is None if the cache is disabled.
+        """
+        return CacheInfo(self._cache_hits, self._cache_misses,
+                         self._cache_evictions, self._cache_size,
+                         len(self._cache))
+
+    def cache_clear(self):
+        """Clear the decision cache and its statistics"""
+        self._cache.clear()
+        self._cache_hits = 0
+        self._cache_misses = 0
+        self._cache_evictions = 0
 
     def should_whitelist(self, url, top_url):
         """Check if `url` is whitelisted on `top_url` due to the entitylist
@@ -258,21 +1337,14 @@ class DisconnectParser(object):
         -------
         boolean : True if the url would have been whitelisted by the entitylist
         """
-        if not url.startswith('http'):
-            url = 'http://' + url
-        if not top_url.startswith('http'):
-            top_url = 'http://' + top_url
-        top_host = urlparse(top_url).hostname
-        top_ps1 = du.get_ps_plus_1(top_url)
-        url_host = urlparse(url).hostname
-        url_ps1 = du.get_ps_plus_1(url)
-        if top_host in self._entitylist:
-            resources = self._entitylist[top_host]
-        elif top_ps1 in self._entitylist:
-            resources = self._entitylist[top_ps1]
-        else:
-            return False
-        return url_host in resources or url_ps1 in resources
+        url_host = get_hostname(url)
+        top_host = get_hostname(top_url)
+        if self._metrics is not None:
+            self._metrics.record_call('should_whitelist')
+        # Whitelist checks are cached separately from decisions, which are
+        # keyed on the hostname pair alone
+        return self._cached((url_host, top_host, 'whitelist'),
+                            self._is_whitelisted, url_host, top_host)
 
     def should_block_with_match(self, url, top_url=None):
         """Check if Firefox's Tracking Protection would block this request.
@@ -294,45 +1366,154 @@ class DisconnectParser(object):
 
         Returns
         -------
-        string : `blacklisted`, `whitelisted`, or None
+        string : `blacklisted`, `whitelisted`, or None. Requests are only
+            reported as `whitelisted` if they would otherwise be blocked.
         string : The matching domain (only supported for blocking) or None
         """
-        if not url.startswith('http'):
-            url = 'http://' + url
+        url_host = get_hostname(url)
+        top_host = None
+        if top_url is not None:
+            top_host = get_hostname(top_url)
+        result = self._cached((url_host, top_host), self._classify_hostnames,
+                              url_host, top_host)
+        if self._metrics is not None:
+            self._metrics.record_call('should_block_with_match')
+            self._record_outcome(url_host, *result)
+        return result
 
-        if top_url is not None and self.should_whitelist(url, top_url):
-            return 'whitelisted', None
+    def lookup(self, url, top_url=None):
+        """Classify a request and describe the matching rule in one pass
 
-        # Check exact hostname
-        hostname = urlparse(url).hostname
-        if hostname in self._blocklist:
-            return 'blacklisted', hostname
+        This returns the same verdict and rule as `should_block_with_match`,
+        together with the suffix depth of the match and the categories,
+        tags and organization of the rule, read from the packed per-domain
+        records built at parse time.
 
-        # Skip IP address
-        if du.is_ip_address(hostname):
-            return None, None
+        Parameters
+        ----------
+        url : string
+            The URL or hostname to classify.
+        top_url : string
+            (optional) The URL or hostname of the top-level page on which `url`
+            was loaded. If this is not provided, the entitylist is not checked.
+
+        Returns
+        -------
+        MatchResult : The verdict, rule, depth, categories, tags and
+            organization of the request. All fields but `verdict` are empty
+            unless the request is blocked.
+        """
+        url_host = get_hostname(url)
+        top_host = None
+        if top_url is not None:
+            top_host = get_hostname(top_url)
+        result = self._cached((url_host, top_host, 'lookup'),
+                              self._lookup_hostnames, url_host, top_host)
+        if self._metrics is not None:
+            self._metrics.record_call('lookup')
+            self._metrics.record_outcome(
+                result.verdict, depth=result.depth,
+                ip_address=is_ip_address(url_host))
+        return result
+
+    def should_block_hostname_with_match(self, hostname, top_hostname=None):
+        """Check if Firefox's Tracking Protection would block this request.
+
+        This is equivalent to `should_block_with_match` for callers that have
+        already extracted the hostnames of the request and top-level page,
+        and skips hostname extraction altogether.
+
+        Parameters
+        ----------
+        hostname : string
+            The lowercase hostname of the request, as returned by
+            `get_hostname` or `urlparse(url).hostname`.
+        top_hostname : string
+            (optional) The lowercase hostname of the top-level page on which
+            the request was loaded. If this is not provided, the entitylist
+            is not checked.
+
+        Returns
+        -------
+        string : `blacklisted`, `whitelisted`, or None. Requests are only
+            reported as `whitelisted` if they would otherwise be blocked.
+        string : The matching domain (only supported for blocking) or None
+        """
+        result = self._cached((hostname, top_hostname),
+                              self._classify_hostnames, hostname,
+                              top_hostname)
+        if self._metrics is not None:
+            self._metrics.record_call('should_block_hostname_with_match')
+            self._record_outcome(hostname, *result)
+        return result
+
+    def should_block_many(self, pairs):
+        """Check many requests at once against Firefox's Tracking Protection.
+
+        This is equivalent to calling `should_block_with_match` for each
+        request, but hostname extraction, blocklist matches and entitylist
+        checks are shared between all requests of the batch that have the
+        same hosts.
 
-        # Check up to four hostnames formed by starting with the last five
-        # components and successively removing the leading component
-        # NOTE: The top-level domain should be skipped, but this is currently
-        # not implemented in Firefox. See: Bug 1203635.
-        hostname = '.'.join(hostname.rsplit('.', 5)[1:])
-        # ps1 = ps1 = du.get_ps_plus_1(url)  # blocked on Bug 1203635
-        count = 0
-        while hostname != '':
-            count += 1
-            if count > 4:
-                return None, None
-            if hostname in self._blocklist:
-                return 'blacklisted', hostname
-            # Skip top-level domain (blocked on Bug 1203635)
-            # if hostname == ps1:
-            #     return None, None
+        Parameters
+        ----------
+        pairs : iterable of tuples
+            `(url, top_url)` pairs to classify. `top_url` may be None, in
+            which case the entitylist is not checked for that request.
+
+        Returns
+        -------
+        list : `blacklisted`, `whitelisted`, or None for each request
+        list : The matching domain (only supported for blocking) or None for
+            each request
+        """
+        hostnames = dict()
+        matches = dict()
+        whitelisted = dict()
+        verdicts = list()
+        rules = list()
+        # The request hostnames, only kept to record metrics
+        url_hosts = list() if self._metrics is not None else None
+        for url, top_url in pairs:
             try:
-                hostname = hostname.split('.', 1)[1]
-            except IndexError:
-                return None, None
-        return None, None
+                url_host = hostnames[url]
+            except KeyError:
+                url_host = hostnames[url] = get_hostname(url)
+            if url_hosts is not None:
+                url_hosts.append(url_host)
+            try:
+                match = matches[url_host]
+            except KeyError:
+                match = matches[url_host] = self._match_hostname(url_host)
+            if match is None:
+                verdicts.append(None)
+                rules.append(None)
+                continue
+            top_host = None
+            if top_url is not None:
+                try:
+                    top_host = hostnames[top_url]
+                except KeyError:
+                    top_host = hostnames[top_url] = get_hostname(
+                        top_url)
+            if top_host is not None:
+                key = (url_host, top_host)
+                try:
+                    is_whitelisted = whitelisted[key]
+                except KeyError:
+                    is_whitelisted = whitelisted[key] = self._is_whitelisted(
+                        url_host, top_host)
+                if is_whitelisted:
+                    verdicts.append('whitelisted')
+                    rules.append(None)
+                    continue
+            verdicts.append('blacklisted')
+            rules.append(match)
+        if url_hosts is not None:
+            self._metrics.record_call('should_block_many')
+            for url_host, verdict, rule in zip(url_hosts, verdicts, rules):
+                self._record_outcome(url_host, verdict, rule)
+        return verdicts, rules
 
     def should_block(self, url, top_url=None):
         """Check if Firefox's Tracking Protection would block this request
@@ -352,19 +1533,142 @@ class DisconnectParser(object):
         result, match = self.should_block_with_match(url, top_url)
         return result == 'blacklisted'
 
+    def get_blocklist(self, categories_to_exclude=None):
+        """Returns the flattened blocklist
+
+        Parameters
+        ----------
+        categories_to_exclude : list (optional)
+            A list of list categories to exclude. Defaults to the categories
+            excluded by this parser.
+
+        Returns
+        -------
+        set : All domains / rules that are blocked.
+        """
+        if categories_to_exclude is None:
+            return set(self._blocklist)
+        blocklist, _ = self._get_view(
+            set([x.lower() for x in categories_to_exclude]))
+        return set(blocklist)
+
+    def compile_hash_prefixes(self, categories_to_exclude=None,
+                              prefix_size=4):
+        """Compile the flattened blocklist into a Safe Browsing prefix set
+
+        Parameters
+        ----------
+        categories_to_exclude : list (optional)
+            A list of list categories to exclude. Defaults to the categories
+            excluded by this parser.
+        prefix_size : int (optional)
+            The length of the hash prefixes in bytes, from 1 to 4.
+            (default 4)
+
+        Returns
+        -------
+        HashPrefixMatcher : A matcher emulating the storage of the list in
+            Firefox's URL classifier. See `DisconnectHashPrefix`.
+        """
+        from .DisconnectHashPrefix import HashPrefixMatcher
+        return HashPrefixMatcher(
+            self.get_blocklist(categories_to_exclude), prefix_size)
+
     def contains_domain(self, hostname):
         """Returns True if the Disconnect list contains that exact hostname"""
         return hostname in self._blocklist
 
     def contains_ps1(self, hostname):
         """Returns True if the Disconnect list contains any domains from ps1"""
-        if not hostname.startswith('http'):
-            hostname = 'http://' + hostname
-        return du.get_ps_plus_1(hostname) in self._blocklist
+        return get_ps_plus_1(hostname) in self._blocklist
 
     def get_matching_domains(self, hostname):
-        """Returns all domains that match or are subdomains of hostname"""
-        return [x for x in self._blocklist if x.endswith(hostname)]
+        """Returns all domains that match or are subdomains of hostname
+
+        Matching is done on whole labels, i.e. `ample.com` does not match
+        `example.com`.
+        """
+        node = self._suffix_index
+        for label in reversed(hostname.split('.')):
+            try:
+                node = node[label]
+            except KeyError:
+                return []
+        out = list()
+        stack = [node]
+        while stack:
+            node = stack.pop()
+            for label, child in node.items():
+                if label is None:
+                    out.append(child)
+                else:
+                    stack.append(child)
+        return out
+
+    def get_domain_info(self, domain):
+        """Returns the categories, tags and organization of the exact `domain`
+
+        This is a single lookup in an index of packed per-domain records
+        built at parse time.
+
+        Parameters
+        ----------
+        domain : string
+            A domain / rule of the list, e.g. a match returned by
+            `should_block_with_match`.
+
+        Returns
+        -------
+        DomainInfo : A named tuple of the sorted tuple of `categories`, the
+            sorted tuple of `tags` and the owning `organization`. Domains from
+            the Disconnect category are reported under their remapped
+            category if the parser has a remapping. Returns None if `domain`
+            is not on the list.
+        """
+        try:
+            record = self._domain_records[domain]
+        except KeyError:
+            return
+        return DomainInfo(*self._decode_record(record))
+
+    def get_domain_categories(self, domain):
+        """Returns the top-level categories of the exact `domain`
+
+        Parameters
+        ----------
+        domain : string
+            A domain / rule of the list, e.g. a match returned by
+            `should_block_with_match`.
+
+        Returns
+        -------
+        list : The sorted categories of `domain`. Domains from the Disconnect
+            category are reported under their remapped category if the
+            parser has a remapping. Empty if `domain` is not on the list.
+        """
+        info = self.get_domain_info(domain)
+        if info is None:
+            return []
+        return list(info.categories)
+
+    def get_domain_tags(self, domain):
+        """Returns the sub-category tags of the exact `domain`
+
+        Parameters
+        ----------
+        domain : string
+            A domain / rule of the list, e.g. a match returned by
+            `should_block_with_match`.
+
+        Returns
+        -------
+        list : The sorted tags of `domain`, including the `dnt` type (`eff`
+            or `w3c`). Empty if `domain` has no tags.
+        """
+        info = self.get_domain_info(domain)
+        if info is None:
+            return []
+        return list(info.tags)
 
     def get_domains_with_category(self, categories,
                                   skip_disconnect_if_remapped=True):
@@ -416,3 +1720,164 @@ class DisconnectParser(object):
         for tag in tags:
             out.update(self._tagged_domains.get(tag, {}))
         return out
+
+    def _get_hostname_organization(self, hostname):
+        """Return the organization owning `hostname` or its closest parent
+
+        Every suffix of `hostname` is checked, longest first, against the
+        blocklist organizations and then the entitylist organizations.
+        """
+        if hostname is None:
+            return
+        records = self._domain_records
+        owners = self._entitylist_owners
+        # IP addresses have no parent domains
+        i = -1 if is_ip_address(hostname) else 0
+        candidate = hostname
+        while True:
+            record = records.get(candidate)
+            if record is not None and record >> 2 * RECORD_FIELD_BITS != 0:
+                return self._organization_names[
+                    (record >> 2 * RECORD_FIELD_BITS) - 1]
+            organization = owners.get(candidate)
+            if organization is not None:
+                return organization
+            if i == -1:
+                return
+            i = hostname.find('.', i)
+            if i == -1:
+                return
+            i += 1
+            candidate = hostname[i:]
+
+    def get_organization(self, url):
+        """Returns the organization owning `url` or its closest parent domain
+
+        Unlike `get_domain_info`, the hostname of `url` does not need to be
+        on the list: `cdn.sub.tracker.example` is attributed to the owner of
+        `tracker.example`. Owners from the blocklist take precedence over
+        owners from the entitylist for the same domain.
+
+        Parameters
+        ----------
+        url : string
+            The URL or hostname to attribute.
+
+        Returns
+        -------
+        string : The name of the organization, or None if `url` has no
+            hostname or neither the hostname nor any of its parent domains
+            has an owner.
+        """
+        return self._get_hostname_organization(get_hostname(url))
+
+    def get_organizations(self, urls):
+        """Returns the organization owning each of `urls`
+
+        This is equivalent to calling `get_organization` for each URL, but
+        every hostname is only attributed once.
+
+        Parameters
+        ----------
+        urls : iterable of strings
+            The URLs or hostnames to attribute.
+
+        Returns
+        -------
+        list : The name of the organization or None for each URL.
+        """
+        hostnames = dict()
+        organizations = dict()
+        out = list()
+        for url in urls:
+            try:
+                hostname = hostnames[url]
+            except KeyError:
+                hostname = hostnames[url] = get_hostname(url)
+            try:
+                organization = organizations[hostname]
+            except KeyError:
+                organization = organizations[hostname] = (
+                    self._get_hostname_organization(hostname))
+            out.append(organization)
+        return out
+
+    def get_organization_domains(self, organization):
+        """Returns all domains owned by `organization`
+
+        Parameters
+        ----------
+        organization : string
+            The name of an organization of the blocklist or entitylist.
+
+        Returns
+        -------
+        set : The blocklist domains and entitylist properties and resources
+            of `organization`. Empty if the organization is unknown.
+        """
+        return set(self._organization_domains.get(organization, ()))
+
+    def get_request_parties(self, pairs):
+        """Attribute requests and group them into first and third parties
+
+        A request is first-party if it is owned by the same organization as
+        its top-level page. Hosts without an organization are their own
+        owner by PS+1, so requests between such hosts are first-party if
+        they share a PS+1. URLs without a hostname have no owner.
+
+        Parameters
+        ----------
+        pairs : iterable of tuples
+            `(url, top_url)` pairs of requests. `top_url` may be None, in
+            which case the request is not grouped.
+
+        Returns
+        -------
+        list : The organization owning each request, or None.
+        list : The organization owning the top-level page of each request,
+            or None.
+        list : True for third-party requests, False for first-party requests
+            and None for requests without a top-level page or where either
+            URL has no hostname.
+        """
+        hostnames = dict()
+        owners = dict()
+        # The owner of URLs without a hostname
+        no_owner = (None, None)
+
+        def get_owner(url):
+            try:
+                hostname = hostnames[url]
+            except KeyError:
+                hostname = hostnames[url] = get_hostname(url)
+            try:
+                return owners[hostname]
+            except KeyError:
+                pass
+            if hostname is None:
+                return no_owner
+            organization = self._get_hostname_organization(hostname)
+            if organization is None:
+                owner = owners[hostname] = (
+                    None, self._get_ps1(hostname))
+            else:
+                owner = owners[hostname] = (organization, None)
+            return owner
+
+        organizations = list()
+        top_organizations = list()
+        third_party = list()
+        for url, top_url in pairs:
+            owner = get_owner(url)
+            organizations.append(owner[0])
+            if top_url is None:
+                top_organizations.append(None)
+                third_party.append(None)
+                continue
+            top_owner = get_owner(top_url)
+            top_organizations.append(top_owner[0])
+            if owner == no_owner or top_owner == no_owner:
+                third_party.append(None)
+            else:
+                third_party.append(owner != top_owner)
+        return organizations, top_organizations, third_party
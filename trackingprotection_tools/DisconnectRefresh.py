@@ -0,0 +1,197 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+
+from .DisconnectFetcher import ListFetcher
+from .DisconnectParser import DisconnectParser
+
+# Parser arguments holding the local and network location of each list
+LIST_ARGUMENTS = {
+    'blocklist': ('blocklist', 'blocklist_url'),
+    'entitylist': ('entitylist', 'entitylist_url'),
+    'disconnect_mapping': ('disconnect_mapping', 'disconnect_mapping_url')
+}
+
+
+class RefreshingDisconnectParser(object):
+    """A `DisconnectParser` that picks up new versions of its lists
+
+    A background thread periodically checks whether any of the lists
+    changed: local lists by modification time and size, lists given by URL
+    with conditional requests through a caching `ListFetcher`. When a list
+    changed, a new parser is built in the background and swapped in with a
+    single reference assignment once it is fully loaded. Lookups keep using
+    the previous parser until then and never wait on a refresh.
+
+    All attributes and methods of the current parser are available on this
+    object, e.g. `should_block_with_match`. Each attribute access uses the
+    parser that is current at the time of the access, so callers that need
+    several lookups against the same version of the list should hold on to
+    the `parser` property instead.
+
+    The refresher can be used as a context manager, which stops the
+    background thread on exit.
+
+    Attributes
+    ----------
+    last_refresh : float
+        The time at which the lists were last checked successfully.
+    last_update : float
+        The time at which the current version of the lists was loaded.
+    last_error : Exception
+        The error of the last background check, or None if it succeeded.
+    """
+    def __init__(self, interval=3600, fetcher=None, start=True,
+                 **parser_kwargs):
+        """Load the lists and start the background refresh.
+
+        Parameters
+        ----------
+        interval : float (optional)
+            The number of seconds between two checks of the lists.
+            (default 3600)
+        fetcher : ListFetcher (optional)
+            The fetcher used for lists given by URL. It should have a cache
+            directory, so unchanged lists are not downloaded again. By
+            default a fetcher caching in a temporary directory is used.
+        start : boolean (optional)
+            Set to False to not start the background thread, in which case
+            lists are only checked by calling `refresh`. (default True)
+        parser_kwargs
+            Arguments passed to `DisconnectParser`, e.g. `blocklist` and
+            `entitylist`.
+        """
+        if interval <= 0:
+            raise ValueError(
+                "Invalid refresh interval %s. The interval must be a "
+                "positive number of seconds." % interval)
+        if 'fetcher' in parser_kwargs:
+            raise ValueError("Pass the fetcher as `fetcher`.")
+        self._interval = interval
+        self._parser_kwargs = parser_kwargs
+        self._temp_dir = None
+        has_urls = any(parser_kwargs.get(network_location) is not None
+                       for _, network_location in LIST_ARGUMENTS.values())
+        if fetcher is None and has_urls:
+            self._temp_dir = tempfile.mkdtemp(prefix='tptools-lists-')
+            fetcher = ListFetcher(cache_dir=self._temp_dir)
+        self._fetcher = fetcher
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.last_refresh = None
+        self.last_update = None
+        self.last_error = None
+        self._file_stats = self._stat_files()
+        self._parser = self._build_parser()
+        self.last_refresh = self.last_update = time.time()
+        if start:
+            self._thread = threading.Thread(
+                target=self._run, name='RefreshingDisconnectParser')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def __getattr__(self, name):
+        # Only called for attributes not found on the refresher itself
+        if name.startswith('__') or name == '_parser':
+            raise AttributeError(name)
+        return getattr(self._parser, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def parser(self):
+        """The `DisconnectParser` of the current version of the lists"""
+        return self._parser
+
+    @property
+    def version(self):
+        """The SHA-256 digests of the current lists
+
+        See `DisconnectParser.get_source_hashes`.
+        """
+        return self._parser.get_source_hashes()
+
+    def close(self):
+        """Stop the background refresh and release the fetcher cache"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._temp_dir is not None:
+            self._fetcher.close()
+            shutil.rmtree(self._temp_dir, ignore_errors=True)
+            self._temp_dir = None
+
+    def _run(self):
+        """Refresh the lists every `interval` seconds until stopped"""
+        while not self._stop.wait(self._interval):
+            try:
+                self.refresh()
+            except Exception as e:
+                # Keep serving the current lists and retry on the next check
+                self.last_error = e
+
+    def _stat_files(self):
+        """Return the modification time and size of every local list"""
+        out = dict()
+        for location, _ in LIST_ARGUMENTS.values():
+            path = self._parser_kwargs.get(location)
+            if path is not None:
+                stat = os.stat(os.path.expanduser(path))
+                out[location] = (stat.st_mtime_ns, stat.st_size)
+        return out
+
+    def _urls_changed(self):
+        """Return True if any list given by URL has new content"""
+        hashes = self._parser.get_source_hashes()
+        for name, (_, network_location) in LIST_ARGUMENTS.items():
+            url = self._parser_kwargs.get(network_location)
+            if url is None:
+                continue
+            content = self._fetcher.fetch(url)
+            if hashlib.sha256(content).hexdigest() != hashes.get(name):
+                return True
+        return False
+
+    def _build_parser(self):
+        """Build a parser of the current lists with all lists loaded"""
+        parser = DisconnectParser(fetcher=self._fetcher,
+                                  **self._parser_kwargs)
+        # Load the lazily loaded lists before the parser is used
+        parser._disconnect_mapping
+        parser._entitylist
+        return parser
+
+    def refresh(self):
+        """Check the lists now and swap in a new parser if they changed
+
+        Returns
+        -------
+        boolean : True if a new version of the lists was loaded.
+        """
+        with self._lock:
+            file_stats = self._stat_files()
+            if file_stats == self._file_stats and not self._urls_changed():
+                self.last_refresh = time.time()
+                self.last_error = None
+                return False
+            parser = self._build_parser()
+            self._file_stats = file_stats
+            self.last_refresh = time.time()
+            self.last_error = None
+            if parser.get_source_hashes() == (
+                    self._parser.get_source_hashes()):
+                # The files were touched but their content is unchanged
+                return False
+            self._parser = parser
+            self.last_update = self.last_refresh
+            return True
@@ -0,0 +1,333 @@
+"""An asyncio HTTP service classifying requests against one parser.
+
+Endpoints
+---------
+GET /classify?url=URL[&top_url=TOP_URL]
+POST /classify
+    Classify a single request, given as query parameters or as a JSON
+    object with a `url` and optional `top_url` key. Single requests that
+    arrive close together are classified as one micro-batch.
+POST /classify/batch
+    Classify a JSON list of `{"url": ..., "top_url": ...}` objects at once.
+GET /health
+    The status of the service and the source hashes of the lists.
+GET /metrics
+    Service counters in the Prometheus text format, followed by the parser
+    metrics if the parser was created with `metrics`.
+
+Results hold the `verdict` and `match` returned by
+`DisconnectParser.should_block_with_match`.
+"""
+import asyncio
+import json
+import time
+from urllib.parse import parse_qs, urlsplit
+
+from .DisconnectParser import get_hostname
+
+DEFAULT_PORT = 8080
+MAX_BODY_SIZE = 16 * 2 ** 20
+
+_REASONS = {
+    200: 'OK',
+    400: 'Bad Request',
+    404: 'Not Found',
+    405: 'Method Not Allowed',
+    413: 'Payload Too Large',
+    500: 'Internal Server Error'
+}
+
+
+class _HTTPError(Exception):
+    """An error reported to the client with the given status code"""
+    def __init__(self, status, message):
+        super(_HTTPError, self).__init__(message)
+        self.status = status
+
+
+def _check_request(url, top_url):
+    """Return the `(url, top_url)` pair if both URLs can be classified
+
+    URLs are checked before they are queued, so an invalid URL fails its
+    own request rather than the batch it would be classified with. A
+    `top_url` without a hostname is treated as a missing one.
+    """
+    try:
+        if get_hostname(url) is None:
+            raise _HTTPError(400, "`url` has no hostname.")
+        if top_url is not None and get_hostname(top_url) is None:
+            top_url = None
+    except ValueError as e:
+        raise _HTTPError(400, "Invalid URL: %s." % e)
+    return url, top_url
+
+
+def _parse_request(record):
+    """Return the `(url, top_url)` pair of a request object"""
+    if not isinstance(record, dict) or \
+            not isinstance(record.get('url'), str):
+        raise _HTTPError(
+            400, "Requests must be objects with a string `url`.")
+    top_url = record.get('top_url')
+    if top_url is not None and not isinstance(top_url, str):
+        raise _HTTPError(400, "`top_url` must be a string or null.")
+    return _check_request(record['url'], top_url)
+
+
+class ClassificationServer(object):
+    """Serve classifications of one `DisconnectParser` over HTTP
+
+    All classification happens on the event loop. Single requests are
+    queued and classified together with `should_block_many` once
+    `max_batch_size` requests are queued or `batch_delay` seconds after the
+    first request of the batch arrived, whichever comes first.
+    """
+    def __init__(self, parser, host='127.0.0.1', port=DEFAULT_PORT,
+                 max_batch_size=256, batch_delay=0.001):
+        """Initialize the server.
+
+        Parameters
+        ----------
+        parser : DisconnectParser
+            The parser used for all classifications. A
+            `RefreshingDisconnectParser` can be used to pick up new lists.
+        host : string (optional)
+            The address to listen on. (default `127.0.0.1`)
+        port : int (optional)
+            The port to listen on, or 0 to pick a free port. (default 8080)
+        max_batch_size : int (optional)
+            The maximum number of single requests classified at once.
+            (default 256)
+        batch_delay : float (optional)
+            The maximum number of seconds a single request waits for others
+            to share its batch. (default 0.001)
+        """
+        if max_batch_size <= 0:
+            raise ValueError(
+                "Invalid batch size %s. The batch size must be a positive "
+                "integer." % max_batch_size)
+        self.parser = parser
+        self.host = host
+        self.port = port
+        self._max_batch_size = max_batch_size
+        self._batch_delay = batch_delay
+        self._server = None
+        self._pending = list()
+        self._flush_handle = None
+        self._started = None
+        self._counters = {
+            'http_requests': 0,
+            'http_errors': 0,
+            'classified_requests': 0,
+            'batches': 0,
+            'single_requests': 0
+        }
+
+    async def start(self):
+        """Start listening for connections
+
+        Once started, `port` holds the port the server listens on.
+        """
+        self._server = await asyncio.start_server(
+            self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        self._started = time.time()
+
+    async def close(self):
+        """Stop listening and wait for the server to shut down"""
+        if self._server is None:
+            return
+        self._server.close()
+        await self._server.wait_closed()
+        self._server = None
+
+    async def serve_forever(self):
+        """Start the server if needed and serve until cancelled"""
+        if self._server is None:
+            await self.start()
+        async with self._server:
+            await self._server.serve_forever()
+
+    def run(self):
+        """Serve in a new event loop until interrupted"""
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    def _classify_many(self, pairs):
+        """Classify `pairs` and return the result objects"""
+        verdicts, rules = self.parser.should_block_many(pairs)
+        self._counters['batches'] += 1
+        self._counters['classified_requests'] += len(verdicts)
+        return [{'verdict': verdict, 'match': rule}
+                for verdict, rule in zip(verdicts, rules)]
+
+    def _flush(self):
+        """Classify all queued single requests"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, list()
+        if len(pending) == 0:
+            return
+        try:
+            results = self._classify_many([pair for pair, _ in pending])
+        except Exception:
+            # Classify each request on its own so an error only fails the
+            # request that caused it
+            for pair, future in pending:
+                try:
+                    result = self._classify_many([pair])[0]
+                except Exception as e:
+                    if not future.done():
+                        future.set_exception(e)
+                    continue
+                if not future.done():
+                    future.set_result(result)
+            return
+        for (_, future), result in zip(pending, results):
+            if not future.done():
+                future.set_result(result)
+
+    def _classify_single(self, url, top_url):
+        """Queue one request and return a future of its result"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._counters['single_requests'] += 1
+        self._pending.append(((url, top_url), future))
+        if len(self._pending) >= self._max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(
+                self._batch_delay, self._flush)
+        return future
+
+    def _get_metrics(self):
+        """Return the service counters in the Prometheus text format"""
+        lines = list()
+        for name, value in sorted(self._counters.items()):
+            lines.append('# TYPE tptools_server_%s_total counter' % name)
+            lines.append('tptools_server_%s_total %d' % (name, value))
+        lines.append('# TYPE tptools_server_uptime_seconds gauge')
+        lines.append('tptools_server_uptime_seconds %f' % (
+            time.time() - self._started))
+        out = '\n'.join(lines) + '\n'
+        parser_metrics = self.parser.get_metrics()
+        if parser_metrics is not None:
+            out += parser_metrics.to_prometheus()
+        return out
+
+    async def _dispatch(self, method, target, body):
+        """Return the status, content type and body of a response"""
+        parts = urlsplit(target)
+        if parts.path == '/health':
+            return 200, 'application/json', {
+                'status': 'ok',
+                'sources': self.parser.get_source_hashes()
+            }
+        if parts.path == '/metrics':
+            return 200, 'text/plain; version=0.0.4', self._get_metrics()
+        if parts.path == '/classify' and method == 'GET':
+            query = parse_qs(parts.query)
+            if 'url' not in query:
+                raise _HTTPError(400, "Missing `url` query parameter.")
+            top_url = query.get('top_url', [None])[0]
+            result = await self._classify_single(
+                *_check_request(query['url'][0], top_url))
+            return 200, 'application/json', result
+        if parts.path not in ('/classify', '/classify/batch'):
+            raise _HTTPError(404, "Unknown endpoint %s." % parts.path)
+        if method != 'POST':
+            raise _HTTPError(405, "Use POST for %s." % parts.path)
+        try:
+            record = json.loads(body.decode('utf-8'))
+        except ValueError:
+            raise _HTTPError(400, "The request body is not valid JSON.")
+        if parts.path == '/classify':
+            result = await self._classify_single(*_parse_request(record))
+            return 200, 'application/json', result
+        if not isinstance(record, list):
+            raise _HTTPError(400, "Batches must be JSON lists.")
+        pairs = [_parse_request(x) for x in record]
+        return 200, 'application/json', self._classify_many(pairs)
+
+    async def _read_request(self, reader):
+        """Read one HTTP request, returning None once the client is done"""
+        request_line = await reader.readline()
+        if request_line.strip() == b'':
+            return
+        try:
+            method, target, version = request_line.decode(
+                'latin-1').split()
+        except ValueError:
+            raise _HTTPError(400, "Malformed request line.")
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get('content-length', 0))
+        except ValueError:
+            raise _HTTPError(400, "Invalid Content-Length.")
+        if length < 0:
+            raise _HTTPError(400, "Invalid Content-Length.")
+        if length > MAX_BODY_SIZE:
+            raise _HTTPError(413, "Request bodies are limited to %d bytes."
+                             % MAX_BODY_SIZE)
+        body = await reader.readexactly(length)
+        keep_alive = headers.get('connection', '').lower() != 'close'
+        if version == 'HTTP/1.0':
+            keep_alive = headers.get('connection', '').lower() == \
+                'keep-alive'
+        return method, target, body, keep_alive
+
+    def _write_response(self, writer, status, content_type, payload,
+                        keep_alive):
+        """Write a complete HTTP response"""
+        if content_type == 'application/json':
+            payload = json.dumps(payload)
+        body = payload.encode('utf-8')
+        writer.write((
+            'HTTP/1.1 %d %s\r\n'
+            'Content-Type: %s\r\n'
+            'Content-Length: %d\r\n'
+            'Connection: %s\r\n'
+            '\r\n' % (status, _REASONS[status], content_type, len(body),
+                      'keep-alive' if keep_alive else 'close')
+        ).encode('latin-1') + body)
+
+    async def _handle_connection(self, reader, writer):
+        """Serve the requests of one client connection"""
+        try:
+            while True:
+                keep_alive = False
+                try:
+                    request = await self._read_request(reader)
+                    if request is None:
+                        break
+                    method, target, body, keep_alive = request
+                    self._counters['http_requests'] += 1
+                    response = await self._dispatch(method, target, body)
+                except _HTTPError as e:
+                    self._counters['http_errors'] += 1
+                    response = (e.status, 'application/json',
+                                {'error': str(e)})
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    raise
+                except Exception as e:
+                    self._counters['http_errors'] += 1
+                    response = (500, 'application/json', {
+                        'error': "%s: %s" % (type(e).__name__, e)})
+                self._write_response(writer, *response,
+                                     keep_alive=keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
@@ -0,0 +1,423 @@
+"""A read-only lookup index that processes share through a memory map.
+
+The index file holds everything `should_block_with_match` needs, laid out as
+flat arrays that are used in place:
+
+* a pool of all strings (domains, entitylist hosts and organization names),
+  UTF-8 encoded back to back, and the offsets of every string in the pool.
+* the domains of the list, sorted by their 64-bit BLAKE2b hash, alongside
+  the string id, the packed record (see `DisconnectParser._pack_record`)
+  and whether the domain is blocked.
+* the entitylist resources and properties, and the allowed
+  `(resource, property)` pairs, each sorted by hash.
+
+Lookups hash the key, binary search the hashes and confirm the match
+against the string pool. Every process that opens the file maps the same
+pages of the page cache, so memory per host stays flat as workers are
+added.
+"""
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+from array import array
+from bisect import bisect_left
+
+from .DisconnectParser import (RECORD_FIELD_BITS, RECORD_FIELD_MASK,
+                               DomainInfo, _get_hostname_ps_plus_1,
+                               get_candidate_hostnames, get_hostname)
+
+SHARED_INDEX_MAGIC = b'TPTOOLS-INDEX\x00\x00\x00'
+SHARED_INDEX_VERSION = 1
+
+# Set in the flags of domains that are blocked by the index
+BLOCKED = 1
+
+_ALIGNMENT = 8
+
+
+def _hash(key):
+    """Return the 64-bit hash of the string `key`"""
+    return int.from_bytes(hashlib.blake2b(
+        key.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def _pair_key(resource, top_property):
+    """Return the key of an allowed entitylist pair"""
+    return resource + ' ' + top_property
+
+
+def _align(offset):
+    return -(-offset // _ALIGNMENT) * _ALIGNMENT
+
+
+class _StringPool(object):
+    """Collect the strings of an index being written"""
+    def __init__(self):
+        self.ids = dict()
+        self.pool = bytearray()
+        self.offsets = array('Q', [0])
+
+    def add(self, string):
+        try:
+            return self.ids[string]
+        except KeyError:
+            pass
+        self.pool += string.encode('utf-8')
+        self.offsets.append(len(self.pool))
+        string_id = self.ids[string] = len(self.offsets) - 2
+        return string_id
+
+
+def _sorted_table(strings, keys, *columns):
+    """Return the hash, string id and extra columns of `keys` by hash
+
+    `columns` are `(typecode, function)` pairs computing a column value of
+    each key.
+    """
+    rows = sorted((_hash(key), key) for key in keys)
+    out = [array('Q', (key_hash for key_hash, _ in rows)),
+           array('Q', (strings.add(key) for _, key in rows))]
+    for typecode, function in columns:
+        out.append(array(typecode, (function(key) for _, key in rows)))
+    return out
+
+
+class SharedIndex(object):
+    """A memory-mapped, read-only equivalent of a `DisconnectParser`
+
+    Build the index file once with `SharedIndex.build` and open it in every
+    worker process. Classification matches `DisconnectParser` with the
+    categories excluded by the parser the index was built from. The index
+    is never modified, so it can be used from any number of threads and
+    processes. Pickling an index pickles its file location, and unpickling
+    opens the file again, e.g. in the workers of a `multiprocessing` pool.
+
+    The index can be used as a context manager, which closes it on exit.
+    """
+    def __init__(self, path):
+        """Open the index file at `path`.
+
+        Raises
+        ------
+        ValueError
+            If the file is not an index, was written by an unsupported
+            version, or on a platform with a different byte order.
+        """
+        self.path = path
+        with open(os.path.expanduser(path), 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        view = memoryview(self._mmap)
+        self._views = [view]
+        start = len(SHARED_INDEX_MAGIC)
+        if view[:start] != SHARED_INDEX_MAGIC:
+            self.close()
+            raise ValueError("%s is not a shared index." % path)
+        version, header_length = struct.unpack('<II', view[start:start + 8])
+        start += 8
+        if version != SHARED_INDEX_VERSION:
+            self.close()
+            raise ValueError(
+                "Shared index %s has version %s but only version %s is "
+                "supported. Rebuild the index." % (
+                    path, version, SHARED_INDEX_VERSION))
+        header = json.loads(
+            bytes(view[start:start + header_length]).decode('utf-8'))
+        if header['byteorder'] != sys.byteorder:
+            self.close()
+            raise ValueError(
+                "Shared index %s was written on a %s-endian platform." % (
+                    path, header['byteorder']))
+        data_start = _align(start + header_length)
+        sections = dict()
+        for name, (offset, length, typecode) in header['sections'].items():
+            offset += data_start
+            section = view[offset:offset + length]
+            if typecode != 'B':
+                section = section.cast(typecode)
+            self._views.append(section)
+            sections[name] = section
+        self._sections = sections
+        self._source_hashes = header['sources']
+        self._exclude = set(header['categories_to_exclude'])
+        self._should_remap = header['should_remap']
+        self._category_names = header['category_names']
+        self._tag_names = header['tag_names']
+        self._disconnect_bit = 0
+        if 'Disconnect' in self._category_names:
+            self._disconnect_bit = 1 << self._category_names.index(
+                'Disconnect')
+        self._decoded_categories = dict()
+        self._decoded_tags = dict()
+
+    @classmethod
+    def build(cls, parser, path):
+        """Write the index of `parser` to `path` and open it
+
+        The file is replaced atomically, so processes that have the previous
+        index open keep using it until they open the new file.
+
+        Parameters
+        ----------
+        parser : DisconnectParser
+            The parser to index. Its category exclusions are applied.
+        path : string
+            The file location to write the index to.
+
+        Returns
+        -------
+        SharedIndex : The opened index.
+        """
+        strings = _StringPool()
+        blocklist = parser._blocklist
+        records = parser._domain_records
+        domains = _sorted_table(
+            strings, records,
+            ('Q', lambda domain: records[domain]),
+            ('B', lambda domain: BLOCKED if domain in blocklist else 0))
+        entitylist = parser._entitylist
+        resource_index = parser._entitylist_resources
+        resources = _sorted_table(strings, resource_index)
+        properties = _sorted_table(strings, entitylist)
+        pairs = [_pair_key(resource, top_property)
+                 for resource, top_properties in resource_index.items()
+                 for top_property in top_properties]
+        pairs = _sorted_table(strings, pairs)
+        organizations = array('Q', (
+            strings.add(name) for name in parser._organization_names))
+
+        sections = [
+            ('domain_hashes', domains[0]),
+            ('domain_strings', domains[1]),
+            ('domain_records', domains[2]),
+            ('domain_flags', domains[3]),
+            ('resource_hashes', resources[0]),
+            ('resource_strings', resources[1]),
+            ('property_hashes', properties[0]),
+            ('property_strings', properties[1]),
+            ('pair_hashes', pairs[0]),
+            ('pair_strings', pairs[1]),
+            ('organizations', organizations),
+            ('string_offsets', strings.offsets),
+            ('string_pool', strings.pool)
+        ]
+        layout = dict()
+        offset = 0
+        for name, data in sections:
+            length = len(data) * (
+                data.itemsize if isinstance(data, array) else 1)
+            typecode = data.typecode if isinstance(data, array) else 'B'
+            layout[name] = (offset, length, typecode)
+            offset = _align(offset + length)
+        header = json.dumps({
+            'byteorder': sys.byteorder,
+            'sources': parser.get_source_hashes(),
+            'categories_to_exclude': sorted(parser._exclude),
+            'should_remap': parser._should_remap,
+            'category_names': parser._category_names,
+            'tag_names': parser._tag_names,
+            'sections': layout
+        }).encode('utf-8')
+
+        path = os.path.expanduser(path)
+        tmp_path = '%s.%d.tmp' % (path, os.getpid())
+        with open(tmp_path, 'wb') as f:
+            f.write(SHARED_INDEX_MAGIC)
+            f.write(struct.pack('<II', SHARED_INDEX_VERSION, len(header)))
+            f.write(header)
+            data_start = _align(f.tell())
+            for name, data in sections:
+                f.write(b'\x00' * (data_start + layout[name][0] - f.tell()))
+                f.write(data)
+        os.replace(tmp_path, path)
+        return cls(path)
+
+    def __reduce__(self):
+        return (self.__class__, (self.path,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        """Release the memory map"""
+        for view in reversed(self._views):
+            view.release()
+        self._views = list()
+        self._sections = dict()
+        self._mmap.close()
+
+    def _string(self, string_id):
+        """Return the UTF-8 bytes of the string with id `string_id`"""
+        offsets = self._sections['string_offsets']
+        return self._sections['string_pool'][
+            offsets[string_id]:offsets[string_id + 1]]
+
+    def _find(self, table, key):
+        """Return the row of `key` in `table`, or -1"""
+        hashes = self._sections[table + '_hashes']
+        strings = self._sections[table + '_strings']
+        key_hash = _hash(key)
+        i = bisect_left(hashes, key_hash)
+        encoded = None
+        while i < len(hashes) and hashes[i] == key_hash:
+            if encoded is None:
+                encoded = key.encode('utf-8')
+            if self._string(strings[i]) == encoded:
+                return i
+            i += 1
+        return -1
+
+    def _match_hostname(self, hostname):
+        """Return the blocklist rule matching `hostname`, or None"""
+        flags = self._sections['domain_flags']
+        for candidate in get_candidate_hostnames(hostname):
+            i = self._find('domain', candidate)
+            if i != -1 and flags[i] & BLOCKED:
+                return candidate
+        return
+
+    def _is_whitelisted(self, url_host, top_host):
+        """Check the entitylist for already extracted hostnames
+
+        See `DisconnectParser._is_whitelisted`.
+        """
+        if self._find('resource', url_host) == -1:
+            suffix = url_host.rstrip('.')
+            while self._find('resource', suffix) == -1:
+                i = suffix.find('.')
+                if i == -1:
+                    return False
+                suffix = suffix[i + 1:]
+        if self._find('property', top_host) != -1:
+            top_property = top_host
+        else:
+            top_property = _get_hostname_ps_plus_1(top_host)
+            if self._find('property', top_property) == -1:
+                return False
+        if self._find('pair', _pair_key(url_host, top_property)) != -1:
+            return True
+        return self._find('pair', _pair_key(
+            _get_hostname_ps_plus_1(url_host), top_property)) != -1
+
+    def _classify_hostnames(self, url_host, top_host):
+        """Classify a request given its already extracted hostnames"""
+        match = self._match_hostname(url_host)
+        if match is None:
+            return None, None
+        if top_host is not None and self._is_whitelisted(url_host, top_host):
+            return 'whitelisted', None
+        return 'blacklisted', match
+
+    def get_source_hashes(self):
+        """Return the SHA-256 digests of the lists the index was built from
+        """
+        return dict(self._source_hashes)
+
+    def get_metrics(self):
+        """Return None, indexes don't record metrics"""
+        return
+
+    def should_whitelist(self, url, top_url):
+        """Check if `url` is whitelisted on `top_url` due to the entitylist
+
+        See `DisconnectParser.should_whitelist`.
+        """
+        return self._is_whitelisted(get_hostname(url), get_hostname(top_url))
+
+    def should_block_with_match(self, url, top_url=None):
+        """Check if Firefox's Tracking Protection would block this request.
+
+        See `DisconnectParser.should_block_with_match`.
+        """
+        top_host = None
+        if top_url is not None:
+            top_host = get_hostname(top_url)
+        return self._classify_hostnames(get_hostname(url), top_host)
+
+    def should_block_hostname_with_match(self, hostname, top_hostname=None):
+        """Check if Firefox's Tracking Protection would block this request.
+
+        See `DisconnectParser.should_block_hostname_with_match`.
+        """
+        return self._classify_hostnames(hostname, top_hostname)
+
+    def should_block_many(self, pairs):
+        """Check many requests at once against Firefox's Tracking Protection.
+
+        See `DisconnectParser.should_block_many`. Requests with the same
+        hosts are only classified once per batch.
+        """
+        hostnames = dict()
+        results = dict()
+        verdicts = list()
+        rules = list()
+        for url, top_url in pairs:
+            try:
+                url_host = hostnames[url]
+            except KeyError:
+                url_host = hostnames[url] = get_hostname(url)
+            top_host = None
+            if top_url is not None:
+                try:
+                    top_host = hostnames[top_url]
+                except KeyError:
+                    top_host = hostnames[top_url] = get_hostname(top_url)
+            key = (url_host, top_host)
+            try:
+                verdict, rule = results[key]
+            except KeyError:
+                verdict, rule = results[key] = self._classify_hostnames(
+                    url_host, top_host)
+            verdicts.append(verdict)
+            rules.append(rule)
+        return verdicts, rules
+
+    def should_block(self, url, top_url=None):
+        """Check if Firefox's Tracking Protection would block this request"""
+        result, match = self.should_block_with_match(url, top_url)
+        return result == 'blacklisted'
+
+    def contains_domain(self, hostname):
+        """Returns True if the index blocks that exact hostname"""
+        i = self._find('domain', hostname)
+        return i != -1 and self._sections['domain_flags'][i] & BLOCKED != 0
+
+    def _decode_mask(self, mask, names, decoded):
+        """Return the sorted tuple of names set in `mask`, memoized"""
+        try:
+            return decoded[mask]
+        except KeyError:
+            pass
+        out = decoded[mask] = tuple(sorted(
+            name for i, name in enumerate(names) if mask & 1 << i))
+        return out
+
+    def get_domain_info(self, domain):
+        """Returns the categories, tags and organization of the exact `domain`
+
+        See `DisconnectParser.get_domain_info`.
+        """
+        i = self._find('domain', domain)
+        if i == -1:
+            return
+        record = self._sections['domain_records'][i]
+        category_mask = record & RECORD_FIELD_MASK
+        if self._should_remap:
+            category_mask &= ~self._disconnect_bit
+        organization = None
+        organization_id = record >> 2 * RECORD_FIELD_BITS
+        if organization_id != 0:
+            organization = self._string(self._sections['organizations'][
+                organization_id - 1]).tobytes().decode('utf-8')
+        return DomainInfo(
+            self._decode_mask(category_mask, self._category_names,
+                              self._decoded_categories),
+            self._decode_mask(record >> RECORD_FIELD_BITS & RECORD_FIELD_MASK,
+                              self._tag_names, self._decoded_tags),
+            organization
+        )
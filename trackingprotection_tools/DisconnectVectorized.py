@@ -0,0 +1,183 @@
+"""Classify whole columns of requests at once.
+
+`classify_arrays` and `classify_frame` take array-likes of URLs and top-level
+URLs, e.g. the columns of a crawl DataFrame. Both columns are factorized so
+hostnames are extracted once per unique URL, the suffix walk runs once per
+unique hostname and the entitylist is checked once per unique pair of
+hostnames that would otherwise be blocked. Results are broadcast back to
+all rows through the factorization codes.
+
+Requires the optional `numpy` package, and `pandas` for `classify_frame`.
+"""
+from .DisconnectParser import get_hostname
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    import pandas as pd
+except ImportError:
+    pd = None
+
+VERDICTS = ('blacklisted', 'whitelisted')
+COLUMNS = ('verdict', 'match', 'category', 'organization')
+
+
+def _require(module, name):
+    if module is None:
+        raise ImportError(
+            "Vectorized classification requires the `%s` package. Install "
+            "it with `pip install trackingprotection-tools[vectorized]`."
+            % name)
+
+
+def _is_missing(value):
+    """Return True for None and NaN values of a column"""
+    return value is None or value != value
+
+
+def _factorize(values):
+    """Return the codes and unique values of `values`
+
+    Missing values get the code -1.
+    """
+    if pd is not None:
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object))
+        return codes.astype(np.intp, copy=False), list(uniques)
+    index = dict()
+    codes = np.empty(len(values), dtype=np.intp)
+    for i, value in enumerate(values):
+        if _is_missing(value):
+            codes[i] = -1
+        else:
+            codes[i] = index.setdefault(value, len(index))
+    return codes, list(index)
+
+
+def _take(codes, values):
+    """Return `values[codes]` for codes that may be -1"""
+    return np.where(codes >= 0, values[np.maximum(codes, 0)], -1)
+
+
+def _classify_codes(parser, urls, top_urls):
+    """Classify the requests and return the codes and values of each column
+
+    Returns
+    -------
+    dict : Maps each of `COLUMNS` to a pair of the code of every request
+        (-1 for None) and the list of values the codes refer to.
+    """
+    url_codes, unique_urls = _factorize(urls)
+    if (url_codes == -1).any():
+        raise ValueError("URLs must not be missing.")
+    host_codes, unique_hosts = _factorize(
+        [get_hostname(url) for url in unique_urls])
+    # URLs without a hostname get the code -1 and no verdict
+    request_hosts = host_codes[url_codes]
+
+    match_codes, unique_matches = _factorize(
+        [parser._match_hostname(host) for host in unique_hosts])
+    request_matches = _take(request_hosts, match_codes)
+    verdicts = np.where(request_matches >= 0, 0, -1)
+
+    if top_urls is not None:
+        if len(top_urls) != len(url_codes):
+            raise ValueError(
+                "Got %d URLs but %d top-level URLs." % (
+                    len(url_codes), len(top_urls)))
+        top_codes, unique_top_urls = _factorize(top_urls)
+        top_host_codes, unique_top_hosts = _factorize(
+            [get_hostname(url) for url in unique_top_urls])
+        request_top_hosts = _take(top_codes, top_host_codes)
+        # Only requests that would be blocked are checked
+        rows = np.flatnonzero((request_matches >= 0) &
+                              (request_top_hosts >= 0))
+        pairs, inverse = np.unique(
+            request_hosts[rows].astype(np.int64) * len(unique_top_hosts) +
+            request_top_hosts[rows], return_inverse=True)
+        whitelisted = np.fromiter((
+            parser._is_whitelisted(
+                unique_hosts[pair // len(unique_top_hosts)],
+                unique_top_hosts[pair % len(unique_top_hosts)])
+            for pair in pairs.tolist()), dtype=bool, count=len(pairs))
+        rows = rows[whitelisted[inverse.ravel()]]
+        verdicts[rows] = 1
+        request_matches[rows] = -1
+
+    infos = [parser.get_domain_info(match) for match in unique_matches]
+    category_codes, unique_categories = _factorize(
+        [','.join(info.categories) if info is not None else None
+         for info in infos])
+    organization_codes, unique_organizations = _factorize(
+        [info.organization if info is not None else None for info in infos])
+    return {
+        'verdict': (verdicts, list(VERDICTS)),
+        'match': (request_matches, unique_matches),
+        'category': (_take(request_matches, category_codes),
+                     unique_categories),
+        'organization': (_take(request_matches, organization_codes),
+                         unique_organizations)
+    }
+
+
+def classify_arrays(parser, urls, top_urls=None):
+    """Classify columns of requests and return the results as numpy arrays
+
+    This is equivalent to calling `should_block_with_match` for each
+    request, but every unique URL, hostname and pair of hostnames is only
+    classified once.
+
+    Parameters
+    ----------
+    parser : DisconnectParser or SharedIndex
+        The parser to classify the requests with.
+    urls : array-like of strings
+        The URL or hostname of each request. Requests whose URL has no
+        hostname get no verdict.
+    top_urls : array-like of strings (optional)
+        The URL or hostname of the top-level page of each request. Missing
+        values (None or NaN) skip the entitylist check for that request, as
+        does leaving out the column.
+
+    Returns
+    -------
+    dict : Maps `blocked` to a boolean array of whether each request is
+        blocked, and `verdict` (`blacklisted`, `whitelisted` or None),
+        `match` (the matching domain of blocked requests), `category` (the
+        comma-separated categories of the match) and `organization` (the
+        organization owning the match) to object arrays.
+    """
+    _require(np, 'numpy')
+    columns = _classify_codes(parser, urls, top_urls)
+    out = {'blocked': columns['verdict'][0] == 0}
+    for name in COLUMNS:
+        codes, values = columns[name]
+        # Code -1 picks the trailing None
+        out[name] = np.array(values + [None], dtype=object)[codes]
+    return out
+
+
+def classify_frame(parser, urls, top_urls=None):
+    """Classify columns of requests and return the results as a DataFrame
+
+    See `classify_arrays`. The `verdict`, `match`, `category` and
+    `organization` columns are categorical, with missing values for
+    requests without a verdict or match.
+
+    Returns
+    -------
+    pandas.DataFrame : One row per request, with the index of `urls` if it
+        is a Series.
+    """
+    _require(np, 'numpy')
+    _require(pd, 'pandas')
+    columns = _classify_codes(parser, urls, top_urls)
+    data = {'blocked': columns['verdict'][0] == 0}
+    for name in COLUMNS:
+        codes, values = columns[name]
+        data[name] = pd.Categorical.from_codes(codes, categories=values)
+    index = urls.index if isinstance(urls, pd.Series) else None
+    return pd.DataFrame(data, index=index,
+                        columns=['blocked'] + list(COLUMNS))
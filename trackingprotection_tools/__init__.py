@@ -1,3 +1,12 @@
 # flake8: noqa
+from .DisconnectDiff import ListDiff, diff_lists
+from .DisconnectFetcher import ListFetcher
+from .DisconnectHashPrefix import HashPrefixMatcher
+from .DisconnectListStore import DisconnectListStore
+from .DisconnectMetrics import ParserMetrics
+from .DisconnectParallel import ParallelClassifier
 from .DisconnectParser import DisconnectParser
+from .DisconnectRefresh import RefreshingDisconnectParser
 from .DisconnectReporting import DisconnectReport, send_report_to_disconnect
+from .DisconnectSharedIndex import SharedIndex
+from .DisconnectVectorized import classify_arrays, classify_frame
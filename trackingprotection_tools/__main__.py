@@ -0,0 +1,279 @@
+"""Command-line tools for working with Firefox's Tracking Protection lists.
+
+Usage: python -m trackingprotection_tools classify --blocklist list.json \\
+           < requests.tsv > verdicts.jsonl
+       python -m trackingprotection_tools serve --blocklist list.json \\
+           --port 8080
+"""
+import argparse
+import json
+import sys
+from itertools import islice
+
+from .DisconnectFetcher import ListFetcher
+from .DisconnectParser import DisconnectParser, get_hostname
+from .DisconnectServer import DEFAULT_PORT, ClassificationServer
+
+
+def _parse_record(line):
+    """Return the `(url, top_url, error)` triple of a JSONL input line"""
+    try:
+        record = json.loads(line)
+    except ValueError as e:
+        return None, None, "Invalid JSON: %s" % e
+    if not isinstance(record, dict) or \
+            not isinstance(record.get('url'), str):
+        return None, None, "Requests must be objects with a string `url`"
+    top_url = record.get('top_url')
+    if top_url is not None and not isinstance(top_url, str):
+        return record['url'], None, "`top_url` must be a string or null"
+    return record['url'], top_url, None
+
+
+def _iter_pairs(stream, input_format):
+    """Yield `(url, top_url, error)` triples from a line-oriented stream
+
+    Text input holds either a URL or a `url<TAB>top_url` pair per line. JSONL
+    input holds one object per line with a `url` and optional `top_url` key.
+    Blank lines are skipped, and a `top_url` without a hostname is treated as
+    a missing one. `error` describes why a request can't be classified, or
+    is None.
+    """
+    for line in stream:
+        line = line.strip()
+        if line == '':
+            continue
+        if input_format == 'jsonl':
+            url, top_url, error = _parse_record(line)
+        else:
+            url, _, top_url = line.partition('\t')
+            top_url = top_url if top_url != '' else None
+            error = None
+        if error is None:
+            try:
+                if get_hostname(url) is None:
+                    error = "`url` has no hostname"
+                elif top_url is not None and get_hostname(top_url) is None:
+                    # Like a missing `top_url`, the entitylist isn't checked
+                    top_url = None
+            except ValueError as e:
+                error = "Invalid URL: %s" % e
+        yield url, top_url, error
+
+
+def _classify_stream(parser, stream, output, input_format, batch_size):
+    """Classify all requests from `stream` and write JSONL to `output`
+
+    Requests that can't be classified are written as objects with an
+    `error` key, so one bad line doesn't end the run.
+    """
+    pairs = _iter_pairs(stream, input_format)
+    while True:
+        batch = list(islice(pairs, batch_size))
+        if len(batch) == 0:
+            return
+        results = iter(zip(*parser.should_block_many(
+            [(url, top_url) for url, top_url, error in batch
+             if error is None])))
+        for url, top_url, error in batch:
+            if error is not None:
+                output.write(json.dumps({
+                    'url': url,
+                    'top_url': top_url,
+                    'error': error
+                }))
+                output.write('\n')
+                continue
+            verdict, rule = next(results)
+            info = None
+            if rule is not None:
+                info = parser.get_domain_info(rule)
+            output.write(json.dumps({
+                'url': url,
+                'top_url': top_url,
+                'verdict': verdict,
+                'match': rule,
+                'categories': info.categories if info is not None else [],
+                'tags': info.tags if info is not None else []
+            }))
+            output.write('\n')
+        output.flush()
+
+
+def _build_parser(args):
+    """Load the `DisconnectParser` described by the command-line arguments"""
+    if args.snapshot is not None:
+        parser = DisconnectParser.from_snapshot(args.snapshot)
+        if args.categories_to_exclude:
+            parser = parser.with_categories_excluded(
+                args.categories_to_exclude)
+        return parser
+    with ListFetcher(cache_dir=args.cache_dir) as fetcher:
+        return DisconnectParser(
+            blocklist=args.blocklist,
+            entitylist=args.entitylist,
+            blocklist_url=args.blocklist_url,
+            entitylist_url=args.entitylist_url,
+            disconnect_mapping=args.disconnect_mapping,
+            disconnect_mapping_url=args.disconnect_mapping_url,
+            categories_to_exclude=args.categories_to_exclude,
+            fetcher=fetcher
+        )
+
+
+def _add_list_arguments(subparser):
+    """Add the arguments describing the lists to load to `subparser`"""
+    subparser.add_argument(
+        '--blocklist', help="file location of the blocklist")
+    subparser.add_argument('--blocklist-url', help="URL of the blocklist")
+    subparser.add_argument(
+        '--entitylist', help="file location of the entitylist")
+    subparser.add_argument('--entitylist-url', help="URL of the entitylist")
+    subparser.add_argument(
+        '--disconnect-mapping',
+        help="file location of the Disconnect category remapping")
+    subparser.add_argument(
+        '--disconnect-mapping-url',
+        help="URL of the Disconnect category remapping")
+    subparser.add_argument(
+        '--cache-dir',
+        help=("directory in which lists given by URL are cached between runs. "
+              "Cached lists are only downloaded again when they changed.")
+    )
+    subparser.add_argument(
+        '--snapshot',
+        help=("file location of a parser snapshot to load instead of the "
+              "lists, see `DisconnectParser.save_snapshot`")
+    )
+    subparser.add_argument(
+        '--exclude',
+        dest='categories_to_exclude',
+        metavar='CATEGORY',
+        action='append',
+        default=[],
+        help="list category to exclude, can be repeated"
+    )
+
+
+def main(argv=None, stdin=None, stdout=None):
+    """Run the command-line interface
+
+    Parameters
+    ----------
+    argv : list of strings (optional)
+        The command-line arguments. Defaults to `sys.argv[1:]`.
+    stdin : file-like object (optional)
+        The stream to read from when no input files are given. Defaults to
+        `sys.stdin`.
+    stdout : file-like object (optional)
+        The stream to write results to. Defaults to `sys.stdout`.
+    """
+    if stdin is None:
+        stdin = sys.stdin
+    if stdout is None:
+        stdout = sys.stdout
+
+    arg_parser = argparse.ArgumentParser(
+        prog='python -m trackingprotection_tools',
+        description="Tools for working with Firefox Tracking Protection."
+    )
+    subparsers = arg_parser.add_subparsers(dest='command')
+    subparsers.required = True
+    classify = subparsers.add_parser(
+        'classify',
+        description=(
+            "Classify requests read from files or stdin and write one JSON "
+            "object per request to stdout."
+        ),
+        help="classify requests against the Disconnect list"
+    )
+    classify.add_argument(
+        'inputs',
+        metavar='FILE',
+        nargs='*',
+        help=("files with one URL or `url<TAB>top_url` pair per line, or one "
+              "JSON object per line with --format jsonl. Reads stdin if no "
+              "file is given or for `-`. Lines that can't be classified are "
+              "written as objects with an `error` key.")
+    )
+    classify.add_argument(
+        '--format',
+        dest='input_format',
+        choices=['text', 'jsonl'],
+        default='text',
+        help="input format. (Default: `text`)"
+    )
+    _add_list_arguments(classify)
+    classify.add_argument(
+        '--batch-size',
+        type=int,
+        default=1000,
+        help="number of requests classified at once. (Default: 1000)"
+    )
+    serve = subparsers.add_parser(
+        'serve',
+        description=(
+            "Serve classifications over HTTP, see "
+            "`trackingprotection_tools.DisconnectServer` for the endpoints."
+        ),
+        help="run an HTTP classification service"
+    )
+    _add_list_arguments(serve)
+    serve.add_argument(
+        '--host',
+        default='127.0.0.1',
+        help="address to listen on. (Default: 127.0.0.1)"
+    )
+    serve.add_argument(
+        '--port',
+        type=int,
+        default=DEFAULT_PORT,
+        help="port to listen on. (Default: %d)" % DEFAULT_PORT
+    )
+    serve.add_argument(
+        '--batch-size',
+        type=int,
+        default=256,
+        help=("maximum number of single requests classified at once. "
+              "(Default: 256)")
+    )
+    serve.add_argument(
+        '--batch-delay',
+        type=float,
+        default=0.001,
+        help=("maximum number of seconds a single request waits to be "
+              "batched with others. (Default: 0.001)")
+    )
+    args = arg_parser.parse_args(argv)
+
+    list_args = (args.blocklist, args.blocklist_url, args.entitylist,
+                 args.entitylist_url, args.disconnect_mapping,
+                 args.disconnect_mapping_url, args.cache_dir)
+    if args.snapshot is not None and any(x is not None for x in list_args):
+        arg_parser.error("--snapshot cannot be used alongside list locations")
+    if args.snapshot is None and (args.blocklist is None and
+                                  args.blocklist_url is None):
+        arg_parser.error(
+            "one of --snapshot, --blocklist or --blocklist-url is required")
+    if args.batch_size <= 0:
+        arg_parser.error("--batch-size must be a positive integer")
+
+    parser = _build_parser(args)
+    if args.command == 'serve':
+        server = ClassificationServer(
+            parser, host=args.host, port=args.port,
+            max_batch_size=args.batch_size, batch_delay=args.batch_delay)
+        server.run()
+        return
+    for location in args.inputs or ['-']:
+        if location == '-':
+            _classify_stream(parser, stdin, stdout, args.input_format,
+                             args.batch_size)
+            continue
+        with open(location, 'r') as f:
+            _classify_stream(parser, f, stdout, args.input_format,
+                             args.batch_size)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,153 @@
+from __future__ import absolute_import
+
+import json
+from os.path import join
+
+import pytest
+
+from ..DisconnectDiff import diff_lists
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+
+
+class TestDisconnectDiff(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_lists(self, tmpdir):
+        self.blocklist_file = join(self.RESOURCE_DIR, 'test-blocklist.json')
+        self.entitylist_file = join(self.RESOURCE_DIR, 'test-entitylist.json')
+        self.mapping_file = join(self.RESOURCE_DIR, 'test-mapping.json')
+
+        with open(self.blocklist_file) as f:
+            blocklist = json.load(f)
+        categories = blocklist['categories']
+        # Add a domain to an existing organization
+        categories['Advertising'][1]['Advertising Tracker B'][
+            'http://ad-trackerB.example/'].append('new-tracker.example')
+        # Remove a domain and move it to another organization and category
+        categories['Analytics'][1]['Analytics Tracker B'][
+            'http://analytics-trackerB.example/'] = []
+        categories['Content'].append({
+            'Content Tracker C': {
+                'http://content-trackerC.example/': [
+                    'analytics-trackerB.example'],
+                'fingerprinting': 'true'
+            }
+        })
+        # Remove a whole organization and a whole category
+        categories['Social'] = []
+        del categories['Cryptomining']
+        # Add a new category
+        categories['Email'] = [{
+            'Email Tracker': {
+                'http://email.example/': ['email.example']
+            }
+        }]
+        self.new_blocklist_file = join(str(tmpdir), 'new-blocklist.json')
+        with open(self.new_blocklist_file, 'w') as f:
+            json.dump(blocklist, f)
+
+        with open(self.entitylist_file) as f:
+            entitylist = json.load(f)
+        entitylist['Example']['properties'].remove('example.org')
+        entitylist['Example']['resources'].append('example.invalid')
+        self.new_entitylist_file = join(str(tmpdir), 'new-entitylist.json')
+        with open(self.new_entitylist_file, 'w') as f:
+            json.dump(entitylist, f)
+
+        self.old = DisconnectParser(
+            self.blocklist_file, self.entitylist_file,
+            disconnect_mapping=self.mapping_file)
+        self.new = DisconnectParser(
+            self.new_blocklist_file, self.new_entitylist_file,
+            disconnect_mapping=self.mapping_file)
+
+    def test_diff(self):
+        diff = diff_lists(self.old, self.new)
+        assert diff.added == {
+            'new-tracker.example': {'Advertising'},
+            'email.example': {'Email'}
+        }
+        assert diff.removed == {'social-trackerA.example': {'Social'}}
+        assert diff.recategorized == {
+            'analytics-trackerB.example': ({'Analytics'}, {'Content'}),
+            'example.com': ({'Cryptomining', 'Fingerprinting'},
+                            {'Fingerprinting'})
+        }
+        assert diff.organization_changes == {
+            'new-tracker.example': (None, 'Advertising Tracker B'),
+            'email.example': (None, 'Email Tracker'),
+            'social-trackerA.example': ('Social Tracker A', None),
+            'analytics-trackerB.example': (
+                'Analytics Tracker B', 'Content Tracker C')
+        }
+        assert diff.tag_changes == {
+            'new-tracker.example': (None, {'w3c', 'performance'}),
+            'analytics-trackerB.example': (
+                {'session-replay'}, {'fingerprinting'})
+        }
+        assert set(diff.entitylist_changes) == {
+            'example.com', 'example.net', 'example.org'}
+        assert diff.entitylist_changes['example.org'][1] is None
+        assert diff.entitylist_owner_changes == {
+            'example.invalid': (None, 'Example')}
+        assert 'Email' in diff.categories
+        assert 'Cryptomining' not in diff.categories
+        assert len(diff) == 9
+        assert len(diff_lists(self.old, self.old)) == 0
+
+        with pytest.raises(ValueError):
+            diff_lists(self.old, DisconnectParser(self.blocklist_file))
+
+    def test_apply_diff(self):
+        parser = DisconnectParser(
+            self.blocklist_file, self.entitylist_file,
+            disconnect_mapping=self.mapping_file, cache_size=10)
+        standard = parser.with_categories_excluded(['Content'])
+        assert parser.should_block_with_match('email.example') == (None, None)
+        assert standard.should_block('analytics-trackerb.example') is False
+
+        parser.apply_diff(diff_lists(self.old, self.new))
+        assert len(diff_lists(parser, self.new)) == 0
+        assert parser._blocklist == self.new._blocklist
+        assert parser._categorized_blocklist == (
+            self.new._categorized_blocklist)
+        assert parser._tagged_domains == self.new._tagged_domains
+        assert parser._company_classifier == self.new._company_classifier
+        assert parser._entitylist == self.new._entitylist
+        assert parser._entitylist_resources == (
+            self.new._entitylist_resources)
+        assert parser._entitylist_owners == self.new._entitylist_owners
+        assert parser._organization_domains == (
+            self.new._organization_domains)
+        assert parser._all_list_categories == self.new._all_list_categories
+        for domain in self.new._blocklist.union(self.old._blocklist):
+            assert parser.get_domain_info(domain) == (
+                self.new.get_domain_info(domain))
+        assert parser.get_source_hashes() == self.new.get_source_hashes()
+        assert parser._suffix_index == parser._build_suffix_index(
+            self.new._blocklist)
+        assert standard.get_blocklist() == self.new.get_blocklist(['Content'])
+        assert standard._suffix_index == parser._build_suffix_index(
+            self.new.get_blocklist(['Content']))
+
+        # Cached decisions are dropped
+        assert parser.should_block_with_match('email.example') == (
+            'blacklisted', 'email.example')
+        assert parser.get_matching_domains('social-trackerA.example') == []
+        assert parser.should_block('www.example.com', 'example.org')
+        with pytest.raises(KeyError):
+            parser.get_domains_with_category('Cryptomining')
+
+    def test_apply_diff_compact(self):
+        parser = DisconnectParser(
+            self.blocklist_file, self.entitylist_file,
+            disconnect_mapping=self.mapping_file, compact=True)
+        parser.apply_diff(diff_lists(self.old, self.new))
+        assert len(diff_lists(parser, self.new)) == 0
+        assert parser._company_classifier == self.new._company_classifier
+        for domain in self.new._blocklist.union(self.old._blocklist):
+            assert parser.get_domain_info(domain) == (
+                self.new.get_domain_info(domain))
+        assert parser._suffix_index == parser._build_suffix_index(
+            self.new._blocklist)
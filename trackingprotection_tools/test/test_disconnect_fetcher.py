@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+
+import json
+import os
+from os.path import join
+
+import pytest
+
+from ..DisconnectFetcher import ListFetcher
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+from .utilities import BASE_TEST_URL
+
+BLOCKLIST_URL = BASE_TEST_URL + '/test-blocklist.json'
+ENTITYLIST_URL = BASE_TEST_URL + '/test-entitylist.json'
+MAPPING_URL = BASE_TEST_URL + '/test-mapping.json'
+
+
+class TestListFetcher(BaseTest):
+
+    def test_fetch(self):
+        with ListFetcher() as fetcher:
+            content = fetcher.fetch(BLOCKLIST_URL)
+            with open(join(self.RESOURCE_DIR, 'test-blocklist.json'),
+                      'rb') as f:
+                assert content == f.read()
+            with pytest.raises(RuntimeError):
+                fetcher.fetch(BASE_TEST_URL + '/missing.json')
+
+    def test_fetch_many(self):
+        with ListFetcher(max_workers=2) as fetcher:
+            out = fetcher.fetch_many(
+                [BLOCKLIST_URL, ENTITYLIST_URL, MAPPING_URL, MAPPING_URL])
+        assert set(out) == {BLOCKLIST_URL, ENTITYLIST_URL, MAPPING_URL}
+        assert json.loads(out[MAPPING_URL].decode('utf-8'))[
+            'should-be-social-tracker.example'] == 'Social'
+
+    def test_conditional_requests(self):
+        cache_dir = join(self.tmpdir, 'cache')
+        fetcher = ListFetcher(cache_dir=cache_dir)
+        content = fetcher.fetch(ENTITYLIST_URL)
+        assert len(os.listdir(cache_dir)) == 2
+
+        # The server responds with 304, so the cached content is returned
+        body_path, meta_path = fetcher._cache_paths(ENTITYLIST_URL)
+        with open(body_path, 'wb') as f:
+            f.write(b'cached')
+        assert fetcher.fetch(ENTITYLIST_URL) == b'cached'
+        assert ListFetcher(cache_dir=cache_dir).fetch(
+            ENTITYLIST_URL) == b'cached'
+
+        # Stale validators download the list again
+        with open(meta_path, 'w') as f:
+            json.dump({
+                'url': ENTITYLIST_URL,
+                'etag': None,
+                'last_modified': 'Thu, 01 Jan 1970 00:00:00 GMT'
+            }, f)
+        assert fetcher.fetch(ENTITYLIST_URL) == content
+        with open(body_path, 'rb') as f:
+            assert f.read() == content
+        fetcher.close()
+
+    def test_parser_fetcher(self):
+        cache_dir = join(self.tmpdir, 'cache')
+        kwargs = {
+            'blocklist_url': BLOCKLIST_URL,
+            'entitylist_url': ENTITYLIST_URL,
+            'disconnect_mapping_url': MAPPING_URL
+        }
+        with ListFetcher(cache_dir=cache_dir) as fetcher:
+            parser = DisconnectParser(fetcher=fetcher, **kwargs)
+            assert len(os.listdir(cache_dir)) == 6
+            cached = DisconnectParser(fetcher=fetcher, **kwargs)
+        local = DisconnectParser(
+            join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            disconnect_mapping=join(self.RESOURCE_DIR, 'test-mapping.json'))
+        for remote in [parser, cached]:
+            assert remote.get_blocklist() == local.get_blocklist()
+            assert remote._entitylist == local._entitylist
+            assert remote.get_source_hashes() == local.get_source_hashes()
+            assert remote._fetched == {}
@@ -0,0 +1,68 @@
+from __future__ import absolute_import
+
+from os.path import join
+
+import pytest
+
+from ..DisconnectHashPrefix import HashPrefixMatcher, get_full_hash
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+
+URLS = [
+    'fingerprinter.example',
+    'https://a.b.c.d.sub.fingerprinter.example/script.js',
+    'http://www.example.com/',
+    'https://sub.example.com/',
+    'not-a-tracker.example',
+    'should-be-social-tracker.example',
+    'should-be-ad-tracker-small.example',
+    'content-trackerA.example',
+    'http://127.0.0.1/',
+]
+
+
+class TestHashPrefixMatcher(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_parser(self):
+        self.parser = DisconnectParser(
+            blocklist=join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            disconnect_mapping=join(self.RESOURCE_DIR, 'test-mapping.json'),
+            categories_to_exclude=['Content']
+        )
+
+    def test_matches_parser(self):
+        matcher = self.parser.compile_hash_prefixes()
+        assert len(matcher) == len(self.parser.get_blocklist())
+        assert matcher.nbytes == len(matcher) * (4 + 32)
+        for url in URLS:
+            blocked, match = self.parser.should_block_with_match(url)
+            assert matcher.match(url) == (match if blocked else None)
+            if blocked:
+                assert match in matcher.match_prefixes(url)
+
+        # Excluded categories are left out of the prefix set
+        matcher = self.parser.compile_hash_prefixes(categories_to_exclude=[])
+        assert len(matcher) == len(self.parser.get_blocklist([]))
+
+    def test_prefix_collisions(self):
+        domains = ['tracker-%d.example' % i for i in range(300)]
+        matcher = HashPrefixMatcher(domains, prefix_size=1)
+        assert len(matcher) <= 256
+        collisions = matcher.get_prefix_collisions()
+        assert sum(collisions.values()) - len(collisions) + len(matcher) == (
+            len(domains))
+        for domain in domains:
+            assert matcher.match('https://www.%s/' % domain) == domain
+
+        # An unlisted hostname sharing a prefix is a hit that fails the
+        # full-hash confirmation
+        unlisted = next(
+            'unlisted-%d.example' % i for i in range(1000)
+            if get_full_hash('unlisted-%d.example' % i)[0] ==
+            get_full_hash(domains[0])[0])
+        assert matcher.match_prefixes(unlisted) == [unlisted]
+        assert matcher.match(unlisted) is None
+
+        with pytest.raises(ValueError):
+            HashPrefixMatcher(domains, prefix_size=5)
@@ -0,0 +1,96 @@
+from __future__ import absolute_import
+
+import json
+from os.path import join
+
+import pytest
+
+from ..DisconnectListStore import DisconnectListStore
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+
+
+class TestDisconnectListStore(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_versions(self, tmpdir):
+        self.mapping_file = join(self.RESOURCE_DIR, 'test-mapping.json')
+        with open(join(self.RESOURCE_DIR, 'test-blocklist.json')) as f:
+            blocklist = json.load(f)
+        categories = blocklist['categories']
+        self.versions = list()
+
+        def save(name):
+            location = join(str(tmpdir), '%s.json' % name)
+            with open(location, 'w') as f:
+                json.dump(blocklist, f)
+            self.versions.append((name, location))
+
+        save('v1')
+        # v2: add a new tracker, remove the social tracker
+        categories['Advertising'].append({
+            'New Tracker': {'http://new.example/': ['new-tracker.example']}
+        })
+        social = categories['Social']
+        categories['Social'] = []
+        save('v2')
+        # v3: move the new tracker to another organization and category
+        categories['Advertising'].pop()
+        categories['Analytics'].append({
+            'Acquirer': {'http://acquirer.example/': ['new-tracker.example']}
+        })
+        save('v3')
+        # v4: the social tracker is back
+        categories['Social'] = social
+        save('v4')
+
+    @pytest.mark.parametrize('processes', [1, 2])
+    def test_queries(self, processes):
+        store = DisconnectListStore(
+            self.versions, disconnect_mapping=self.mapping_file,
+            processes=processes)
+        assert store.get_versions() == ['v1', 'v2', 'v3', 'v4']
+        assert store.versions_blocking('sub.new-tracker.example') == [
+            'v2', 'v3', 'v4']
+        assert store.versions_blocking('social-trackera.example') == []
+        assert store.versions_blocking('www.example.com') == [
+            'v1', 'v2', 'v3', 'v4']
+        assert store.versions_blocking('not-a-tracker.example') == []
+
+        assert store.first_seen('new-tracker.example', 'Advertising') == 'v2'
+        assert store.first_seen('new-tracker.example', 'Analytics') == 'v3'
+        assert store.first_seen('new-tracker.example', 'Social') is None
+        assert store.category_history(
+            'social-trackerA.example', 'Social') == [('v1', 'v2'),
+                                                     ('v4', None)]
+        assert store.category_history(
+            'new-tracker.example', 'Advertising') == [('v2', 'v3')]
+        assert store.versions_with_category(
+            'social-trackerA.example', 'Social') == ['v1', 'v4']
+        assert store.versions_with_category(
+            'should-be-social-tracker.example', 'Social') == [
+                'v1', 'v2', 'v3', 'v4']
+
+        assert store.get_organization('new-tracker.example', 'v1') is None
+        assert store.get_organization(
+            'new-tracker.example', 'v2') == 'New Tracker'
+        assert store.get_organization(
+            'new-tracker.example', 'v4') == 'Acquirer'
+        with pytest.raises(KeyError):
+            store.get_organization('new-tracker.example', 'v5')
+
+        for name, location in self.versions:
+            parser = DisconnectParser(
+                location, disconnect_mapping=self.mapping_file)
+            assert store.get_domains(name) == parser._blocklist
+            assert store.get_domains(name, 'Social') == (
+                parser.get_domains_with_category('Social'))
+
+    def test_domains_are_shared(self):
+        store = DisconnectListStore(self.versions, processes=1)
+        domains = dict()
+        for history in store._categories.values():
+            for domain in history:
+                assert domains.setdefault(domain, domain) is domain
+        assert store.get_domains('v3', 'Content') == {
+            'content-trackerA.example', 'content-trackerB.example'}
@@ -0,0 +1,138 @@
+from __future__ import absolute_import
+
+import bz2
+import gzip
+import hashlib
+import json
+from os.path import join
+
+import pytest
+
+from ..DisconnectLoader import (ListSource, iter_blocklist,
+                                iter_blocklist_stream, iter_entitylist_stream)
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+
+LOOKUPS = [
+    ('https://sub.example.com/', 'https://example.net/'),
+    ('https://sub.example.com/', 'https://tracker.invalid/'),
+    ('https://a.b.fingerprinter.example/', None),
+    ('https://should-be-ad-tracker-small.example/', None),
+    ('https://unlisted.example/', None)
+]
+
+
+class TestDisconnectLoader(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_lists(self):
+        self.blocklist_file = join(self.RESOURCE_DIR, 'test-blocklist.json')
+        self.entitylist_file = join(self.RESOURCE_DIR, 'test-entitylist.json')
+        self.mapping_file = join(self.RESOURCE_DIR, 'test-mapping.json')
+        self.parser = DisconnectParser(
+            self.blocklist_file,
+            self.entitylist_file,
+            disconnect_mapping=self.mapping_file
+        )
+
+    def _write_compressed(self, location, compress, extension):
+        with open(location, 'rb') as f:
+            content = compress(f.read())
+        out = join(self.tmpdir, 'list.json' + extension)
+        with open(out, 'wb') as f:
+            f.write(content)
+        return out, hashlib.sha256(content).hexdigest()
+
+    def _assert_same_lookups(self, parser):
+        assert parser.get_blocklist() == self.parser.get_blocklist()
+        assert parser._entitylist == self.parser._entitylist
+        for url, top_url in LOOKUPS:
+            assert parser.should_block_with_match(url, top_url) == (
+                self.parser.should_block_with_match(url, top_url))
+
+    def test_list_source(self):
+        with open(self.mapping_file, 'rb') as f:
+            content = f.read()
+        for compress in [lambda x: x, gzip.compress, bz2.compress]:
+            with ListSource.from_bytes(compress(content)) as source:
+                assert source.stream.read() == content
+                assert source.hexdigest() == (
+                    hashlib.sha256(compress(content)).hexdigest())
+
+        # The digest covers content that was not read
+        with ListSource.from_file(self.blocklist_file) as source:
+            source.stream.read(10)
+            with open(self.blocklist_file, 'rb') as f:
+                assert source.hexdigest() == (
+                    hashlib.sha256(f.read()).hexdigest())
+
+    def test_compressed_lists(self):
+        for compress, extension in [(gzip.compress, '.gz'),
+                                    (bz2.compress, '.bz2')]:
+            blocklist, digest = self._write_compressed(
+                self.blocklist_file, compress, extension)
+            parser = DisconnectParser(
+                blocklist, self.entitylist_file,
+                disconnect_mapping=self.mapping_file)
+            self._assert_same_lookups(parser)
+            assert parser.get_source_hashes()['blocklist'] == digest
+
+    def test_zstd_list(self):
+        zstandard = pytest.importorskip('zstandard')
+        blocklist, digest = self._write_compressed(
+            self.blocklist_file, zstandard.ZstdCompressor().compress, '.zst')
+        parser = DisconnectParser(
+            blocklist, self.entitylist_file,
+            disconnect_mapping=self.mapping_file)
+        self._assert_same_lookups(parser)
+        assert parser.get_source_hashes()['blocklist'] == digest
+
+    def test_stream_items(self):
+        pytest.importorskip('ijson')
+        with open(self.blocklist_file, 'rb') as f:
+            expected = list(iter_blocklist(json.load(f)))
+        with ListSource.from_file(self.blocklist_file) as source:
+            assert list(iter_blocklist_stream(source.stream)) == expected
+        with open(self.entitylist_file, 'rb') as f:
+            expected = list(json.load(f).items())
+        with ListSource.from_file(self.entitylist_file) as source:
+            assert list(iter_entitylist_stream(source.stream)) == expected
+
+        # Categories without organizations and other keys are handled
+        content = json.dumps({
+            'license': {'text': ['skipped']},
+            'categories': {'Empty': [], 'Content': [
+                {'Org': {'https://org.example/': ['org.example']}}]},
+            'trailing': 1
+        }).encode('utf-8')
+        with ListSource.from_bytes(content) as source:
+            assert list(iter_blocklist_stream(source.stream)) == [
+                ('Empty', None), ('Content', None),
+                ('Content', {'Org': {'https://org.example/': ['org.example']}})
+            ]
+
+    def test_streaming_parser(self):
+        pytest.importorskip('ijson')
+        blocklist, digest = self._write_compressed(
+            self.blocklist_file, gzip.compress, '.gz')
+        for compact in [False, True]:
+            parser = DisconnectParser(
+                blocklist, self.entitylist_file,
+                disconnect_mapping=self.mapping_file,
+                compact=compact, streaming=True)
+            self._assert_same_lookups(parser)
+            assert parser._raw_blocklist is None
+            assert parser._raw_entitylist is None
+            assert parser._all_list_categories == (
+                self.parser._all_list_categories)
+            assert parser._tagged_domains == self.parser._tagged_domains
+            assert dict(parser._company_classifier) == (
+                self.parser._company_classifier)
+            assert parser.get_source_hashes() == dict(
+                self.parser.get_source_hashes(), blocklist=digest)
+
+        # Unmapped Disconnect domains are still reported
+        with pytest.raises(ValueError):
+            DisconnectParser(
+                join(self.RESOURCE_DIR, 'unmapped-blocklist.json'),
+                disconnect_mapping=self.mapping_file, streaming=True)
@@ -0,0 +1,95 @@
+from __future__ import absolute_import
+
+from os.path import join
+
+import pytest
+
+from ..DisconnectMetrics import ParserMetrics
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+
+
+class TestParserMetrics(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_parser(self):
+        self.metrics = ParserMetrics()
+        self.parser = DisconnectParser(
+            join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            disconnect_mapping=join(self.RESOURCE_DIR, 'test-mapping.json'),
+            metrics=self.metrics
+        )
+
+    def test_parse_phases(self):
+        phases = self.metrics.snapshot()['phases']
+        assert set(phases) == {
+            'load_blocklist', 'load_disconnect_mapping', 'parse_blocklist',
+            'flatten_blocklist', 'build_suffix_index'}
+        assert all(values['count'] == 1 for values in phases.values())
+        assert all(values['seconds'] >= 0 for values in phases.values())
+
+        self.parser.should_block('example.com', 'example.net')
+        phases = self.metrics.snapshot()['phases']
+        assert phases['load_entitylist']['count'] == 1
+        assert phases['parse_entitylist']['count'] == 1
+
+    def test_lookup_counters(self):
+        parser = self.parser
+        assert parser.get_metrics() is self.metrics
+        assert parser.should_block_with_match('a.b.fingerprinter.example') == (
+            'blacklisted', 'fingerprinter.example')
+        parser.should_block('fingerprinter.example')
+        parser.should_block_hostname_with_match('not-a-tracker.example')
+        parser.should_block_with_match('https://127.0.0.1/')
+        parser.should_block_with_match('www.example.com', 'example.net')
+        parser.should_whitelist('www.example.com', 'example.net')
+        parser.should_block_many([
+            ('example.com', None), ('example.com', 'example.org')])
+
+        snapshot = self.metrics.snapshot()
+        assert snapshot['calls'] == {
+            'should_block_with_match': 4,
+            'should_block_hostname_with_match': 1,
+            'should_whitelist': 1,
+            'should_block_many': 1
+        }
+        assert snapshot['outcomes'] == {
+            'blacklisted': 3, 'whitelisted': 2, 'none': 2}
+        assert snapshot['match_depths'] == {0: 2, 2: 1}
+        assert snapshot['ip_short_circuits'] == 1
+        assert snapshot['phases']['suffix_walk']['count'] == 6
+        assert snapshot['phases']['entitylist_check']['count'] == 3
+
+        # Views share the metrics
+        standard = parser.with_categories_excluded(['Fingerprinting'])
+        assert standard.should_block_with_match('fingerprinter.example') == (
+            None, None)
+        assert self.metrics.snapshot()['outcomes']['none'] == 3
+
+        self.metrics.reset()
+        assert self.metrics.snapshot()['calls'] == {}
+
+    def test_prometheus(self):
+        self.parser.should_block('fingerprinter.example')
+        text = self.metrics.to_prometheus()
+        assert text.endswith('\n')
+        lines = text.splitlines()
+        assert '# TYPE tptools_parser_requests_total counter' in lines
+        assert 'tptools_parser_requests_total{outcome="blacklisted"} 1' in \
+            lines
+        assert 'tptools_parser_requests_total{outcome="none"} 0' in lines
+        assert 'tptools_parser_match_depth_total{depth="0"} 1' in lines
+        assert 'tptools_parser_ip_short_circuits_total 0' in lines
+        assert ('tptools_parser_phase_runs_total{phase="parse_blocklist"} 1'
+                in lines)
+        for line in lines:
+            if not line.startswith('#'):
+                float(line.rsplit(' ', 1)[1])
+
+    def test_disabled(self):
+        parser = DisconnectParser(
+            join(self.RESOURCE_DIR, 'test-blocklist.json'))
+        assert parser.get_metrics() is None
+        assert '_match_hostname' not in parser.__dict__
+        assert parser.should_block('fingerprinter.example')
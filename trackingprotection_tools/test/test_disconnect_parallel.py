@@ -0,0 +1,76 @@
+from __future__ import absolute_import
+
+from os.path import join
+
+import pytest
+
+from ..DisconnectParallel import ParallelClassifier
+from ..DisconnectParser import DisconnectParser
+from ..DisconnectSharedIndex import SharedIndex
+from .basetest import BaseTest
+
+PAIRS = [
+    ('fingerprinter.example', None),
+    ('https://sub.fingerprinter.example/script.js', 'site.example'),
+    ('http://www.example.com/', 'https://example.org/'),
+    ('http://www.example.com/', 'https://example.invalid/'),
+    ('not-a-tracker.example', 'site.example'),
+    ('should-be-social-tracker.example', 'site.example'),
+    ('http://127.0.0.1/', None),
+] * 5
+
+
+class TestParallelClassifier(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_parser(self):
+        self.parser_kwargs = {
+            'blocklist': join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            'entitylist': join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            'disconnect_mapping': join(self.RESOURCE_DIR, 'test-mapping.json')
+        }
+        self.parser = DisconnectParser(**self.parser_kwargs)
+        self.expected = [
+            self.parser.should_block_with_match(url, top_url)
+            for url, top_url in PAIRS
+        ]
+
+    def test_ordered(self):
+        with ParallelClassifier(
+                processes=2, chunk_size=3, **self.parser_kwargs) as pc:
+            assert list(pc.classify(iter(PAIRS))) == self.expected
+            indices = [x[0] for x in pc.classify_chunks(PAIRS)]
+            assert indices == list(range(12))
+            assert list(pc.classify([])) == []
+
+    def test_unordered_from_snapshot(self):
+        snapshot = join(self.tmpdir, 'list.snapshot')
+        self.parser.save_snapshot(snapshot)
+        chunk_size = 4
+        with ParallelClassifier(processes=2, chunk_size=chunk_size,
+                                snapshot=snapshot) as pc:
+            results = [None] * len(PAIRS)
+            for index, verdicts, rules in pc.classify_chunks(
+                    PAIRS, ordered=False):
+                start = index * chunk_size
+                assert len(verdicts) == len(rules) <= chunk_size
+                results[start:start + len(verdicts)] = zip(verdicts, rules)
+        assert results == self.expected
+
+    def test_shared_index(self):
+        path = join(self.tmpdir, 'list.index')
+        SharedIndex.build(self.parser, path).close()
+        with ParallelClassifier(processes=2, chunk_size=3,
+                                shared_index=path) as pc:
+            assert list(pc.classify(PAIRS)) == self.expected
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            ParallelClassifier()
+        with pytest.raises(ValueError):
+            ParallelClassifier(snapshot='list.snapshot', **self.parser_kwargs)
+        with pytest.raises(ValueError):
+            ParallelClassifier(snapshot='list.snapshot',
+                               shared_index='list.index')
+        with pytest.raises(ValueError):
+            ParallelClassifier(chunk_size=0, **self.parser_kwargs)
@@ -0,0 +1,93 @@
+from __future__ import absolute_import
+
+import json
+import os
+import shutil
+import time
+from os.path import join
+
+import pytest
+
+from ..DisconnectRefresh import RefreshingDisconnectParser
+from .basetest import BaseTest
+from .utilities import BASE_TEST_URL
+
+
+class TestRefreshingDisconnectParser(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def copy_lists(self, tmpdir):
+        self.blocklist_file = join(str(tmpdir), 'blocklist.json')
+        shutil.copy(join(self.RESOURCE_DIR, 'test-blocklist.json'),
+                    self.blocklist_file)
+        self.entitylist_file = join(self.RESOURCE_DIR, 'test-entitylist.json')
+
+    def update_blocklist(self):
+        with open(self.blocklist_file) as f:
+            blocklist = json.load(f)
+        blocklist['categories']['Advertising'].append({
+            'New Tracker': {'http://new.example/': ['new-tracker.example']}
+        })
+        with open(self.blocklist_file, 'w') as f:
+            json.dump(blocklist, f)
+        # Make sure the modification time changes on coarse filesystems
+        stat = os.stat(self.blocklist_file)
+        os.utime(self.blocklist_file,
+                 ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 9))
+
+    def test_refresh(self):
+        with RefreshingDisconnectParser(
+                blocklist=self.blocklist_file,
+                entitylist=self.entitylist_file,
+                start=False) as parser:
+            version = parser.version
+            initial = parser.parser
+            assert parser.last_update is not None
+            assert not parser.should_block('new-tracker.example')
+            assert parser.should_block('www.example.com', 'example.net') \
+                is False
+            assert parser.refresh() is False
+            assert parser.parser is initial
+
+            # Touching the file without changing it keeps the parser
+            os.utime(self.blocklist_file, (0, 0))
+            assert parser.refresh() is False
+            assert parser.parser is initial
+
+            self.update_blocklist()
+            last_update = parser.last_update
+            assert parser.refresh() is True
+            assert parser.should_block('new-tracker.example')
+            assert parser.version['blocklist'] != version['blocklist']
+            assert parser.version['entitylist'] == version['entitylist']
+            assert parser.last_update >= last_update
+            # Readers holding the previous parser are not affected
+            assert not initial.should_block('new-tracker.example')
+
+    def test_background_refresh(self):
+        with RefreshingDisconnectParser(
+                interval=0.01, blocklist=self.blocklist_file) as parser:
+            self.update_blocklist()
+            deadline = time.time() + 10
+            while not parser.should_block('new-tracker.example'):
+                assert time.time() < deadline
+                time.sleep(0.01)
+            assert parser.last_error is None
+        assert parser._thread is None
+
+    def test_refresh_urls(self):
+        parser = RefreshingDisconnectParser(
+            blocklist_url=BASE_TEST_URL + '/test-blocklist.json',
+            entitylist_url=BASE_TEST_URL + '/test-entitylist.json',
+            start=False)
+        temp_dir = parser._temp_dir
+        assert len(os.listdir(temp_dir)) == 4
+        assert parser.refresh() is False
+        assert parser.should_block('fingerprinter.example')
+        parser.close()
+        assert not os.path.exists(temp_dir)
+
+    def test_invalid_arguments(self):
+        with pytest.raises(ValueError):
+            RefreshingDisconnectParser(
+                interval=0, blocklist=self.blocklist_file)
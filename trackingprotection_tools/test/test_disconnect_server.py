@@ -0,0 +1,181 @@
+from __future__ import absolute_import
+
+import asyncio
+import json
+import socket
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from os.path import join
+
+import pytest
+import requests
+
+from ..DisconnectParser import DisconnectParser
+from ..DisconnectServer import ClassificationServer
+from .basetest import BaseTest
+
+
+class TestClassificationServer(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def run_server(self):
+        self.parser = DisconnectParser(
+            join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            disconnect_mapping=join(self.RESOURCE_DIR, 'test-mapping.json')
+        )
+        self.server = ClassificationServer(
+            self.parser, port=0, max_batch_size=4, batch_delay=0.01)
+        loop = asyncio.new_event_loop()
+        loop.run_until_complete(self.server.start())
+        thread = threading.Thread(target=loop.run_forever)
+        thread.start()
+        self.base_url = 'http://127.0.0.1:%d' % self.server.port
+        yield
+        asyncio.run_coroutine_threadsafe(self.server.close(), loop).result()
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+    def test_classify(self):
+        resp = requests.get(self.base_url + '/classify', params={
+            'url': 'https://sub.fingerprinter.example/script.js'})
+        assert resp.status_code == 200
+        assert resp.json() == {
+            'verdict': 'blacklisted', 'match': 'fingerprinter.example'}
+        resp = requests.post(self.base_url + '/classify', json={
+            'url': 'http://www.example.com/', 'top_url': 'example.net'})
+        assert resp.json() == {'verdict': 'whitelisted', 'match': None}
+
+        pairs = [
+            ('https://sub.fingerprinter.example/', None),
+            ('http://www.example.com/', 'https://example.org/'),
+            ('http://www.example.com/', 'https://site.example/'),
+            ('not-a-tracker.example', None)
+        ]
+        resp = requests.post(self.base_url + '/classify/batch', json=[
+            {'url': url, 'top_url': top_url} for url, top_url in pairs])
+        verdicts, rules = self.parser.should_block_many(pairs)
+        assert resp.json() == [
+            {'verdict': verdict, 'match': rule}
+            for verdict, rule in zip(verdicts, rules)
+        ]
+
+    def test_micro_batches(self):
+        urls = ['https://%d.fingerprinter.example/' % i for i in range(16)]
+
+        def classify(url):
+            return requests.get(
+                self.base_url + '/classify', params={'url': url}).json()
+
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            results = list(executor.map(classify, urls))
+        assert results == [{
+            'verdict': 'blacklisted', 'match': 'fingerprinter.example'
+        }] * 16
+        assert self.server._counters['single_requests'] == 16
+        assert self.server._counters['classified_requests'] == 16
+        assert self.server._counters['batches'] <= 16
+
+    def test_keep_alive(self):
+        with requests.Session() as session:
+            for i in range(3):
+                resp = session.get(self.base_url + '/classify',
+                                   params={'url': 'example.com'})
+                assert resp.json()['verdict'] == 'blacklisted'
+
+    def test_health_and_metrics(self):
+        resp = requests.get(self.base_url + '/health')
+        assert resp.json() == {
+            'status': 'ok', 'sources': self.parser.get_source_hashes()}
+        requests.get(self.base_url + '/classify',
+                     params={'url': 'example.com'})
+        metrics = requests.get(self.base_url + '/metrics').text
+        assert 'tptools_server_single_requests_total 1\n' in metrics
+        assert 'tptools_server_uptime_seconds' in metrics
+
+    def test_errors(self):
+        for method, path, body in [
+                ('get', '/classify', None),
+                ('post', '/classify', b'{'),
+                ('post', '/classify', json.dumps({'top_url': 'a.com'})),
+                ('post', '/classify/batch', json.dumps({'url': 'a.com'})),
+                ('post', '/classify/batch', json.dumps([{'url': 1}]))]:
+            resp = getattr(requests, method)(self.base_url + path, data=body)
+            assert resp.status_code == 400
+            assert 'error' in resp.json()
+        assert requests.get(self.base_url + '/missing').status_code == 404
+        assert requests.get(
+            self.base_url + '/classify/batch').status_code == 405
+        assert self.server._counters['http_errors'] == 7
+
+    def test_invalid_urls(self):
+        for params in [{'url': 'http://[::1'}, {'url': ''},
+                       {'url': 'example.com', 'top_url': 'http://[::1'}]:
+            resp = requests.get(self.base_url + '/classify', params=params)
+            assert resp.status_code == 400
+            assert 'error' in resp.json()
+        resp = requests.post(self.base_url + '/classify/batch', json=[
+            {'url': 'example.com'}, {'url': 'http://[::1'}])
+        assert resp.status_code == 400
+
+        # An invalid URL only fails its own request in a micro-batch
+        urls = ['https://fingerprinter.example/', 'http://[::1']
+
+        def classify(url):
+            return requests.post(self.base_url + '/classify',
+                                 json={'url': url})
+
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            valid, invalid = list(executor.map(classify, urls))
+        assert valid.json() == {
+            'verdict': 'blacklisted', 'match': 'fingerprinter.example'}
+        assert invalid.status_code == 400
+
+        # Top-level URLs without a hostname skip the entitylist
+        resp = requests.get(self.base_url + '/classify', params={
+            'url': 'www.example.com', 'top_url': 'https:///'})
+        assert resp.json() == {
+            'verdict': 'blacklisted', 'match': 'example.com'}
+        resp = requests.post(self.base_url + '/classify/batch', json=[
+            {'url': 'www.example.com', 'top_url': ''},
+            {'url': 'www.example.com', 'top_url': 'example.net'}])
+        assert resp.json() == [
+            {'verdict': 'blacklisted', 'match': 'example.com'},
+            {'verdict': 'whitelisted', 'match': None}]
+
+    def test_internal_errors(self):
+        def fail(pairs):
+            if any(url == 'broken.example' for url, _ in pairs):
+                raise RuntimeError("broken")
+            return original(pairs)
+        original = self.parser.should_block_many
+        self.parser.should_block_many = fail
+
+        def classify(url):
+            return requests.get(self.base_url + '/classify',
+                                params={'url': url})
+
+        urls = ['fingerprinter.example', 'broken.example']
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            valid, broken = list(executor.map(classify, urls))
+        assert valid.json() == {
+            'verdict': 'blacklisted', 'match': 'fingerprinter.example'}
+        assert broken.status_code == 500
+        assert broken.json() == {'error': 'RuntimeError: broken'}
+        resp = requests.post(self.base_url + '/classify/batch',
+                             json=[{'url': 'broken.example'}])
+        assert resp.status_code == 500
+
+        # The connection is still usable after an error
+        with requests.Session() as session:
+            for url in ['broken.example', 'fingerprinter.example']:
+                resp = session.get(self.base_url + '/classify',
+                                   params={'url': url})
+            assert resp.status_code == 200
+
+    def test_negative_content_length(self):
+        with socket.create_connection(('127.0.0.1', self.server.port)) as s:
+            s.sendall(b'POST /classify HTTP/1.1\r\n'
+                      b'Content-Length: -5\r\n\r\n')
+            assert s.recv(4096).startswith(b'HTTP/1.1 400 Bad Request')
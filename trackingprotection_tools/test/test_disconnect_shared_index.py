@@ -0,0 +1,83 @@
+from __future__ import absolute_import
+
+import pickle
+from os.path import join
+
+import pytest
+
+from ..DisconnectParser import DisconnectParser
+from ..DisconnectSharedIndex import SharedIndex
+from .basetest import BaseTest
+
+PAIRS = [
+    ('fingerprinter.example', None),
+    ('https://a.b.c.d.sub.fingerprinter.example/script.js', 'site.example'),
+    ('http://www.example.com/', 'https://example.org/'),
+    ('http://www.example.com/', 'https://example.invalid/'),
+    ('https://sub.example.com/', 'https://example.net/'),
+    ('https://sub.example.com/', 'https://tracker.invalid/'),
+    ('not-a-tracker.example', 'site.example'),
+    ('should-be-social-tracker.example', 'site.example'),
+    ('content-trackerA.example', None),
+    ('http://127.0.0.1/', None),
+    ('x.example.com.', 'example.org'),
+]
+
+
+class TestSharedIndex(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_index(self, tmpdir):
+        self.parser = DisconnectParser(
+            blocklist=join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            entitylist=join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            disconnect_mapping=join(self.RESOURCE_DIR, 'test-mapping.json'),
+            categories_to_exclude=['Content']
+        )
+        self.path = join(str(tmpdir), 'list.index')
+        self.index = SharedIndex.build(self.parser, self.path)
+        yield
+        self.index.close()
+
+    def test_lookups(self):
+        for url, top_url in PAIRS:
+            assert self.index.should_block_with_match(url, top_url) == (
+                self.parser.should_block_with_match(url, top_url))
+            assert self.index.should_block(url, top_url) == (
+                self.parser.should_block(url, top_url))
+            if top_url is not None:
+                assert self.index.should_whitelist(url, top_url) == (
+                    self.parser.should_whitelist(url, top_url))
+        assert self.index.should_block_many(PAIRS) == (
+            self.parser.should_block_many(PAIRS))
+        assert self.index.should_block_hostname_with_match(
+            'sub.example.com', 'example.net') == ('whitelisted', None)
+        assert self.index.should_block_with_match(
+            'content-trackerA.example') == (None, None)
+        assert not self.index.contains_domain('content-trackerA.example')
+        assert self.index.contains_domain('fingerprinter.example')
+        assert self.index.get_source_hashes() == (
+            self.parser.get_source_hashes())
+
+    def test_domain_info(self):
+        for domain in self.parser._domain_records:
+            assert self.index.get_domain_info(domain) == (
+                self.parser.get_domain_info(domain))
+        assert self.index.get_domain_info('bogus.example') is None
+
+    def test_reopen(self):
+        other = pickle.loads(pickle.dumps(self.index))
+        try:
+            assert other.should_block_many(PAIRS) == (
+                self.index.should_block_many(PAIRS))
+        finally:
+            other.close()
+        with SharedIndex(self.path) as index:
+            assert index.should_block_with_match(*PAIRS[1]) == (
+                'blacklisted', 'fingerprinter.example')
+
+    def test_invalid_file(self):
+        snapshot = join(self.tmpdir, 'list.snapshot')
+        self.parser.save_snapshot(snapshot)
+        with pytest.raises(ValueError):
+            SharedIndex(snapshot)
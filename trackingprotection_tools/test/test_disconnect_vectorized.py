@@ -0,0 +1,102 @@
+from __future__ import absolute_import
+
+from os.path import join
+
+import pytest
+
+from ..DisconnectParser import DisconnectParser
+from ..DisconnectSharedIndex import SharedIndex
+from ..DisconnectVectorized import classify_arrays, classify_frame
+from .basetest import BaseTest
+
+PAIRS = [
+    ('fingerprinter.example', None),
+    ('https://sub.fingerprinter.example/script.js', 'site.example'),
+    ('http://www.example.com/', 'https://example.org/'),
+    ('http://www.example.com/', 'https://example.invalid/'),
+    ('https://sub.example.com/', 'https://example.net/'),
+    ('not-a-tracker.example', 'site.example'),
+    ('should-be-social-tracker.example', 'site.example'),
+    ('content-trackerA.example', float('nan')),
+    ('http://127.0.0.1/', None),
+] * 3
+
+
+class TestVectorized(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def create_parser(self):
+        self.parser = DisconnectParser(
+            blocklist=join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            entitylist=join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            disconnect_mapping=join(self.RESOURCE_DIR, 'test-mapping.json')
+        )
+        self.urls = [url for url, _ in PAIRS]
+        self.top_urls = [top_url for _, top_url in PAIRS]
+        self.expected = [
+            self.parser.should_block_with_match(
+                url, top_url if isinstance(top_url, str) else None)
+            for url, top_url in PAIRS
+        ]
+
+    def _check(self, verdicts, matches, categories, organizations):
+        assert [(verdict, match) for verdict, match in zip(
+            verdicts, matches)] == self.expected
+        for match, category, organization in zip(
+                matches, categories, organizations):
+            info = self.parser.get_domain_info(match)
+            if info is None:
+                assert category is None and organization is None
+            else:
+                assert category == ','.join(info.categories)
+                assert organization == info.organization
+
+    def test_classify_arrays(self):
+        pytest.importorskip('numpy')
+        out = classify_arrays(self.parser, self.urls, self.top_urls)
+        self._check(out['verdict'], out['match'], out['category'],
+                    out['organization'])
+        assert list(out['blocked']) == [
+            verdict == 'blacklisted' for verdict, _ in self.expected]
+        assert out['category'][3] == 'Cryptomining,Fingerprinting'
+
+        # Without top-level URLs the entitylist is not checked
+        out = classify_arrays(self.parser, self.urls)
+        assert list(out['verdict']).count('whitelisted') == 0
+        with pytest.raises(ValueError):
+            classify_arrays(self.parser, self.urls, self.top_urls[1:])
+        with pytest.raises(ValueError):
+            classify_arrays(self.parser, [None], [None])
+
+        # URLs without a hostname get no verdict
+        out = classify_arrays(
+            self.parser, ['fingerprinter.example', '', 'http://'],
+            ['site.example', 'site.example', None])
+        assert list(out['blocked']) == [True, False, False]
+        assert list(out['verdict']) == ['blacklisted', None, None]
+        assert list(out['match']) == ['fingerprinter.example', None, None]
+        assert list(out['organization'])[1:] == [None, None]
+
+    def test_classify_frame(self):
+        pd = pytest.importorskip('pandas')
+        frame = pd.DataFrame({'url': self.urls, 'top_url': self.top_urls},
+                             index=range(10, 10 + len(PAIRS)))
+        out = classify_frame(self.parser, frame.url, frame.top_url)
+        assert list(out.index) == list(frame.index)
+        for column in ['verdict', 'match', 'category', 'organization']:
+            assert out[column].dtype.name == 'category'
+
+        def values(column):
+            return [None if pd.isna(x) else x for x in out[column]]
+        self._check(values('verdict'), values('match'), values('category'),
+                    values('organization'))
+        assert out.blocked.sum() == sum(
+            verdict == 'blacklisted' for verdict, _ in self.expected)
+
+    def test_shared_index(self):
+        pytest.importorskip('numpy')
+        path = join(self.tmpdir, 'list.index')
+        with SharedIndex.build(self.parser, path) as index:
+            out = classify_arrays(index, self.urls, self.top_urls)
+            self._check(out['verdict'], out['match'], out['category'],
+                        out['organization'])
@@ -0,0 +1,174 @@
+from __future__ import absolute_import
+
+import io
+import json
+import os
+import subprocess
+import sys
+from os.path import dirname, join
+
+import pytest
+
+from ..__main__ import main
+from ..DisconnectParser import DisconnectParser
+from .basetest import BaseTest
+from .utilities import BASE_TEST_URL
+
+
+class TestClassifyCommand(BaseTest):
+
+    @pytest.fixture(autouse=True)
+    def set_lists(self):
+        self.list_args = [
+            '--blocklist', join(self.RESOURCE_DIR, 'test-blocklist.json'),
+            '--entitylist', join(self.RESOURCE_DIR, 'test-entitylist.json'),
+            '--disconnect-mapping',
+            join(self.RESOURCE_DIR, 'test-mapping.json')
+        ]
+
+    def classify(self, args, stdin=''):
+        stdout = io.StringIO()
+        main(['classify'] + args, stdin=io.StringIO(stdin), stdout=stdout)
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    def test_text_input(self):
+        results = self.classify(self.list_args, stdin=(
+            'https://sub.fingerprinter.example/script.js\n'
+            '\n'
+            'http://www.example.com/\thttps://example.org/\n'
+            'should-be-ad-tracker-small.example\tsite.example\n'
+            'not-a-tracker.example\n'
+        ))
+        assert results == [{
+            'url': 'https://sub.fingerprinter.example/script.js',
+            'top_url': None,
+            'verdict': 'blacklisted',
+            'match': 'fingerprinter.example',
+            'categories': ['Fingerprinting'],
+            'tags': []
+        }, {
+            'url': 'http://www.example.com/',
+            'top_url': 'https://example.org/',
+            'verdict': 'whitelisted',
+            'match': None,
+            'categories': [],
+            'tags': []
+        }, {
+            'url': 'should-be-ad-tracker-small.example',
+            'top_url': 'site.example',
+            'verdict': 'blacklisted',
+            'match': 'should-be-ad-tracker-small.example',
+            'categories': ['Advertising'],
+            'tags': ['w3c']
+        }, {
+            'url': 'not-a-tracker.example',
+            'top_url': None,
+            'verdict': None,
+            'match': None,
+            'categories': [],
+            'tags': []
+        }]
+
+    def test_jsonl_files_and_snapshot(self):
+        requests = join(self.tmpdir, 'requests.jsonl')
+        with open(requests, 'w') as f:
+            f.write(json.dumps({'url': 'www.example.com'}) + '\n')
+            f.write(json.dumps({'url': 'www.example.com',
+                                'top_url': 'example.net'}) + '\n')
+        results = self.classify(
+            self.list_args + ['--format', 'jsonl', '--batch-size', '1',
+                              requests, '-'],
+            stdin=json.dumps({'url': 'fingerprinter.example'}) + '\n'
+        )
+        assert [(x['verdict'], x['match']) for x in results] == [
+            ('blacklisted', 'example.com'),
+            ('whitelisted', None),
+            ('blacklisted', 'fingerprinter.example')
+        ]
+        assert results[0]['categories'] == ['Cryptomining', 'Fingerprinting']
+        assert results[0]['tags'] == []
+
+        snapshot = join(self.tmpdir, 'list.snapshot')
+        DisconnectParser(
+            join(self.RESOURCE_DIR, 'test-blocklist.json')
+        ).save_snapshot(snapshot)
+        assert self.classify(
+            ['--snapshot', snapshot, '--exclude', 'Cryptomining',
+             '--exclude', 'Fingerprinting'], stdin='example.com\n'
+        )[0]['verdict'] is None
+
+    def test_invalid_lines(self):
+        results = self.classify(self.list_args + ['--batch-size', '2'], stdin=(
+            'fingerprinter.example\n'
+            'http://[::1\n'
+            'http://\n'
+            'example.com\thttp://[::1\n'
+            'example.com\n'
+        ))
+        assert [x['verdict'] for x in results if 'error' not in x] == [
+            'blacklisted', 'blacklisted']
+        assert [x['url'] for x in results if 'error' in x] == [
+            'http://[::1', 'http://', 'example.com']
+        assert results[1]['error'].startswith('Invalid URL')
+
+        results = self.classify(
+            self.list_args + ['--format', 'jsonl'],
+            stdin='{"url": "fingerprinter.example"}\n{\n{"top_url": "a.com"}\n'
+                  '{"url": "example.com", "top_url": 1}\n'
+                  '{"url": "example.com"}\n'
+        )
+        assert len(results) == 5
+        assert [x['match'] for x in results if 'error' not in x] == [
+            'fingerprinter.example', 'example.com']
+        assert results[1]['error'].startswith('Invalid JSON')
+        assert results[2]['url'] is None
+
+        # Top-level URLs without a hostname don't end the run
+        results = self.classify(
+            self.list_args + ['--format', 'jsonl'],
+            stdin='{"url": "fingerprinter.example"}\n'
+                  '{"url": "http://www.example.com/", "top_url": ""}\n'
+        )
+        assert [(x['verdict'], x['match'], x['top_url']) for x in results] == [
+            ('blacklisted', 'fingerprinter.example', None),
+            ('blacklisted', 'example.com', None)
+        ]
+        results = self.classify(
+            self.list_args, stdin='www.example.com\thttps:///\n')
+        assert results[0]['verdict'] == 'blacklisted'
+        assert results[0]['top_url'] is None
+
+    def test_cached_remote_lists(self):
+        cache_dir = join(self.tmpdir, 'cache')
+        args = [
+            '--blocklist-url', BASE_TEST_URL + '/test-blocklist.json',
+            '--entitylist-url', BASE_TEST_URL + '/test-entitylist.json',
+            '--cache-dir', cache_dir
+        ]
+        for i in range(2):
+            results = self.classify(
+                args, stdin='www.example.com\texample.net\n')
+            assert results[0]['verdict'] == 'whitelisted'
+        assert len(os.listdir(cache_dir)) == 4
+
+    def test_invalid_arguments(self):
+        with pytest.raises(SystemExit):
+            self.classify([])
+        with pytest.raises(SystemExit):
+            self.classify(self.list_args + ['--snapshot', 'list.snapshot'])
+        with pytest.raises(SystemExit):
+            self.classify(self.list_args + ['--batch-size', '0'])
+        with pytest.raises(SystemExit):
+            self.classify(['--snapshot', 'list.snapshot', '--cache-dir', '.'])
+
+    def test_module_entry_point(self):
+        process = subprocess.run(
+            [sys.executable, '-m', 'trackingprotection_tools', 'classify',
+             '--blocklist', join(self.RESOURCE_DIR, 'test-blocklist.json')],
+            input=b'fingerprinter.example\n',
+            stdout=subprocess.PIPE,
+            cwd=dirname(dirname(dirname(__file__))),
+            check=True
+        )
+        result = json.loads(process.stdout.decode('utf-8'))
+        assert result['match'] == 'fingerprinter.example'